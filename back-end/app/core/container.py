@@ -0,0 +1,79 @@
+# app/core/container.py
+
+import threading
+import time
+from typing import Callable, Dict, Generic, Iterable, Optional, TypeVar
+
+from dotenv import load_dotenv
+
+T = TypeVar("T")
+
+_env_lock = threading.Lock()
+_env_loaded = False
+
+
+def load_env() -> None:
+    """Читает .env один раз на процесс (модули вызывают это вместо load_dotenv при импорте)."""
+    global _env_loaded
+    if _env_loaded:
+        return
+    with _env_lock:
+        if not _env_loaded:
+            load_dotenv()
+            _env_loaded = True
+
+
+class LazyService(Generic[T]):
+    """
+    Внешний клиент или тяжёлый объект (OpenAI, R2, engine БД), который создаётся при первом
+    обращении, а не при импорте модуля. Тяжёлые библиотеки импортируются внутри фабрики.
+    Параллельные первые обращения ждут одну инициализацию; если фабрика упала,
+    следующее обращение попробует снова.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], T]):
+        self.name = name
+        self._factory = factory
+        self._value: Optional[T] = None
+        self._ready = False
+        self._lock = threading.Lock()
+        self.init_ms: Optional[float] = None
+        SERVICES[name] = self
+
+    @property
+    def ready(self) -> bool:
+        return self._ready
+
+    def get(self) -> T:
+        if self._ready:
+            return self._value
+        with self._lock:
+            if not self._ready:
+                started = time.perf_counter()
+                self._value = self._factory()
+                self.init_ms = (time.perf_counter() - started) * 1000
+                self._ready = True
+        return self._value
+
+    def reset(self) -> None:
+        """Забывает созданный объект (следующий get создаст новый)."""
+        with self._lock:
+            self._value, self._ready, self.init_ms = None, False, None
+
+
+SERVICES: Dict[str, LazyService] = {}
+
+
+def init_services(names: Optional[Iterable[str]] = None) -> Dict[str, Optional[str]]:
+    """
+    Создаёт зарегистрированные сервисы заранее (из lifespan, в отдельном потоке),
+    чтобы первый запрос не платил за импорт и инициализацию. {имя: текст ошибки или None}.
+    """
+    errors: Dict[str, Optional[str]] = {}
+    for name in list(names) if names is not None else list(SERVICES):
+        try:
+            SERVICES[name].get()
+            errors[name] = None
+        except Exception as e:
+            errors[name] = f"{type(e).__name__}: {e}"
+    return errors
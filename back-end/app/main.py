@@ -1,6 +1,13 @@
+import asyncio
 import hashlib
+import hmac
+import io
+import os
+import time
 import uuid
-from typing import List as TypingList
+from contextlib import asynccontextmanager
+from datetime import date, datetime
+from typing import List as TypingList, Literal, Optional
 
 from fastapi import (
     FastAPI,
@@ -9,11 +16,15 @@ from fastapi import (
     Depends,
     HTTPException,
     Header,
+    Query,
 )
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
+from PIL import Image, UnidentifiedImageError
 
+from app.core.container import init_services
 from app.models.database_ops import (
     create_db_and_tables,
     get_db,
@@ -22,21 +33,67 @@ from app.models.database_ops import (
     get_user_history,
     delete_history_item,
     delete_all_history_for_user,
+    get_usage_daily,
+    query_submissions_by_metrics,
+    search_user_history,
 )
 from app.models.schemas import (
     TextAnalyzeRequest,
     TextAnalyzeResponse,
     ImageAnalyzeResponse,
+    ImageByKeyRequest,
+    PresignedUploadRequest,
+    PresignedUploadResponse,
     HistoryItem,
+    HistorySearchHit,
+    SubmissionMetricsItem,
+    TextClassifyResponse,
+    UsageDailyItem,
 )
 from app.services.ai_service import analyze_image
+from app.services.image_forensics import IMAGE_MAX_PIXELS, read_image_header
 from app.services.submission_service import process_text_submission_fixed
+from app.services.async_storage_service import close_async_s3_client, upload_media_file_async
+from app.services.lexicon_matcher import lexicon_matcher
+from app.services.stylometry import stylometry_scorer
+from app.services.telemetry import (
+    CONTENT_TYPE as METRICS_CONTENT_TYPE,
+    RequestMetricsMiddleware,
+    instrument_db_commits,
+    monitor_event_loop,
+    render_metrics,
+)
+from app.services.text_classifier_service import text_classifier
+from app.services.usage_accounting import record_late_usage
+from app.services.warmup import WARMUP_ENABLED, WARMUP_TIMEOUT_SECONDS, run_warmup
+from app.services.profiling import PROFILING_ENABLED, ProfilingMiddleware, collapsed_stacks, profile_store
+from app.services.storage_service import (
+    ANALYZE_IMAGE_STORE_MEDIA,
+    DIRECT_UPLOAD_MAX_BYTES,
+    MEDIA_MAINTENANCE_INTERVAL_SECONDS,
+    MEDIA_SNIFF_BYTES,
+    MediaChangedError,
+    RangedMediaReader,
+    claim_direct_upload,
+    create_presigned_upload,
+    head_media_file,
+    media_cache,
+    owns_upload_key,
+    release_media_file,
+    run_media_maintenance,
+    sniff_image_type,
+)
+from app.services.export_service import (
+    EXPORT_MEDIA_TYPES,
+    HISTORY_EXPORT_FIELDS,
+    SUBMISSIONS_EXPORT_FIELDS,
+    accepts_gzip,
+    export_chunks,
+    iter_history_rows,
+    iter_submission_rows,
+)
 
 
-app = FastAPI(title="AI Identifier API", version="0.1")
-
-
-@app.on_event("startup")
 def on_startup():
     """
     Создает таблицы в базе данных при запуске приложения, если они не существуют.
@@ -44,6 +101,86 @@ def on_startup():
     print("Инициализация БД: Создание таблиц...")
     create_db_and_tables()
     print("Инициализация БД завершена.")
+    # Модель ddd (если артефакт есть): один раз на процесс, массивы через mmap
+    text_classifier.load()
+    stylometry_scorer.load()
+    lexicon_matcher.reload_if_changed(force=True)
+
+
+async def init_clients():
+    """
+    Внешние клиенты (OpenAI, R2) создаются в фоне после старта: воркер сразу принимает запросы,
+    а запрос, пришедший раньше, просто дождётся той же инициализации (LazyService).
+    """
+    for name, error in (await asyncio.to_thread(init_services)).items():
+        if error is not None:
+            print(f"❌ Сервис {name} не инициализирован: {error}")
+
+
+async def warm_up(app: FastAPI):
+    """
+    Прогрев (app/services/warmup.py): соединения к OpenAI, ZeroGPT, HF, R2 и пулу БД,
+    пробный скоринг локальными моделями. После него (или WARMUP_TIMEOUT_SECONDS) /ready = 200.
+    """
+    await app.state.clients_init
+    if WARMUP_ENABLED:
+        started = time.perf_counter()
+        try:
+            app.state.warmup = await asyncio.wait_for(asyncio.to_thread(run_warmup), WARMUP_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            # Поток прогрева доработает сам; воркер не держим вне ротации
+            app.state.warmup = {"timeout": {"status": "error", "error": f"прогрев дольше {WARMUP_TIMEOUT_SECONDS:g} с"}}
+        for step, result in app.state.warmup.items():
+            if result["status"] == "error":
+                print(f"⚠️ Прогрев {step}: {result['error']}")
+        print(f"Прогрев завершён за {(time.perf_counter() - started) * 1000:.0f} мс")
+    app.state.ready = True
+
+
+async def media_maintenance():
+    """Периодическая уборка бакета: брошенные presigned-загрузки и объекты без ссылок."""
+    while True:
+        await asyncio.sleep(MEDIA_MAINTENANCE_INTERVAL_SECONDS)
+        try:
+            removed = await asyncio.to_thread(run_media_maintenance)
+            if any(removed.values()):
+                print(f"Уборка бакета: {removed}")
+        except Exception as e:
+            print(f"⚠️ Уборка бакета не удалась: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.ready = False
+    app.state.warmup = {}
+    # Блокирующая инициализация — в потоке, чтобы не стоял event loop
+    await asyncio.to_thread(on_startup)
+    app.state.clients_init = asyncio.create_task(init_clients())
+    app.state.warmup_task = asyncio.create_task(warm_up(app))
+    # Фоновая проба задержки event loop для /metrics
+    app.state.loop_monitor = asyncio.create_task(monitor_event_loop())
+    app.state.media_maintenance = asyncio.create_task(media_maintenance())
+    yield
+    # Закрывает async-клиент R2 (если он создавался)
+    app.state.warmup_task.cancel()
+    app.state.loop_monitor.cancel()
+    app.state.media_maintenance.cancel()
+    await close_async_s3_client()
+    text_classifier.batcher.close()
+
+
+app = FastAPI(title="AI Identifier API", version="0.1", lifespan=lifespan)
+
+# Токен для админских эндпоинтов (заголовок X-Admin-Token). Не задан — админка выключена.
+ADMIN_API_TOKEN = os.getenv("ADMIN_API_TOKEN")
+
+
+# Время commit всех сессий БД
+instrument_db_commits(Session)
+
+
+# Latency и размер тела по шаблону маршрута (а не сырому пути), чтобы метки были ограничены
+app.add_middleware(RequestMetricsMiddleware)
 
 
 # Разрешаем фронту к нам ходить (для хакатона ок так)
@@ -55,12 +192,34 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Профилирование по запросу (X-Profile: 1 + X-Admin-Token) или по доле запросов.
+# Выключено — middleware не подключается вовсе.
+if PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware, admin_token=ADMIN_API_TOKEN)
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics_endpoint():
+    """Метрики в формате Prometheus."""
+    return PlainTextResponse(render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
 
 @app.get("/health")
 def health_check():
     return {"status": "ok"}
 
 
+@app.get("/ready")
+def readiness_check():
+    """
+    Готовность принимать трафик (readiness probe): 503, пока идёт прогрев.
+    /health (liveness) отвечает 200 сразу после старта процесса.
+    """
+    if not getattr(app.state, "ready", False):
+        return JSONResponse(status_code=503, content={"status": "warming_up"})
+    return {"status": "ready", "warmup": app.state.warmup}
+
+
 # ==========================
 #  AUTH: модели и утилиты
 # ==========================
@@ -116,6 +275,18 @@ def get_current_user_id(authorization: str = Header(None)) -> uuid.UUID:
         raise HTTPException(status_code=401, detail="Invalid user id in token")
 
 
+def require_admin(x_admin_token: str = Header(None)) -> None:
+    """
+    Пускает только запросы с заголовком X-Admin-Token == ADMIN_API_TOKEN.
+    """
+    if not ADMIN_API_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin API is disabled")
+    # Заголовок приходит декодированным как latin-1; сравниваем байты, иначе
+    # compare_digest падает с TypeError на не-ASCII символах (500 вместо 403)
+    if not x_admin_token or not hmac.compare_digest(x_admin_token.encode("latin-1"), ADMIN_API_TOKEN.encode("utf-8")):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+
 # ==========================
 #  AUTH: эндпоинты /register и /login
 # ==========================
@@ -174,6 +345,22 @@ def login_for_access_token(user_data: UserLogin, db: Session = Depends(get_db)):
 # ==========================
 
 
+@app.post("/classify", response_model=TextClassifyResponse)
+async def classify_text_endpoint(
+    payload: TextAnalyzeRequest,
+    user_id: uuid.UUID = Depends(get_current_user_id),
+):
+    """
+    Быстрая локальная классификация текста моделью ddd (без внешних API).
+    Параллельные запросы объединяются в один батч predict_proba.
+    """
+    if not text_classifier.loaded:
+        raise HTTPException(status_code=503, detail="Text model is not loaded")
+    probabilities = await asyncio.wrap_future(text_classifier.predict_proba_async(payload.content))
+    label = max(probabilities, key=probabilities.get)
+    return TextClassifyResponse(label=label, probabilities=probabilities)
+
+
 @app.post("/analyze-text", response_model=TextAnalyzeResponse)
 async def analyze_text_endpoint(
     payload: TextAnalyzeRequest,
@@ -199,7 +386,9 @@ async def analyze_text_endpoint(
             question=payload.content,
             raw_response=ai_response.dict(),  # полный JSON ответа модели
             kind="text",
+            usage=ai_response.usage,
         )
+        record_late_usage(ai_response.detector_run, user_id, "text")
 
         return ai_response
 
@@ -218,21 +407,142 @@ async def analyze_image_endpoint(
     user_id: uuid.UUID = Depends(get_current_user_id),
 ):
     """
-    Принимает изображение, анализирует его
-    и сохраняет историю (kind='image').
+    Принимает изображение, анализирует его и сохраняет историю (kind='image').
+    Параллельно с анализом изображение загружается в R2 (ключ по содержимому),
+    запись истории держит на него ссылку — как у /analyze-image-by-key.
     """
     image_bytes = await file.read()
-    ai_response = analyze_image(image_bytes)
-
-    # Сохраняем в history: вопросом считаем имя файла
     filename = file.filename or "uploaded_image"
-    create_history_record(
-        db=db,
-        user_id=user_id,
-        question=filename,
-        raw_response=ai_response.dict(),
-        kind="image",
-    )
+    store = None
+    if ANALYZE_IMAGE_STORE_MEDIA:
+        store = asyncio.create_task(upload_media_file_async(
+            io.BytesIO(image_bytes), filename, file.content_type or "application/octet-stream", db=db
+        ))
+
+    def settle_ref(key: str, keep: bool) -> None:
+        if not key:
+            db.rollback()  # загрузка не удалась: взятую ссылку (если была) не фиксируем
+            return
+        if not keep:
+            release_media_file(db, key)
+        db.commit()
+
+    async def stored_key(keep: bool) -> str:
+        """Дожидается загрузки. Ссылку фиксируем сразу (иначе объект остался бы без записи),
+        а если анализ упал — тут же и снимаем: объект удалит purge_orphaned_media.
+        Сессия к этому моменту свободна (загрузка завершена), запросы к БД — в потоке."""
+        key = await store if store is not None else ""
+        await asyncio.to_thread(settle_ref, key, keep)
+        return key
+
+    try:
+        # Анализ — в потоке: event loop тем временем ведёт загрузку
+        ai_response = await asyncio.to_thread(analyze_image, image_bytes)
+    except Exception:
+        await stored_key(keep=False)
+        raise
+    media_key = await stored_key(keep=True)
+
+    def save_history() -> None:
+        try:
+            # Сохраняем в history: вопросом считаем имя файла
+            create_history_record(
+                db=db,
+                user_id=user_id,
+                question=filename,
+                raw_response=ai_response.dict(),
+                kind="image",
+                usage=ai_response.usage,
+                media_key=media_key or None,
+            )
+            record_late_usage(ai_response.detector_run, user_id, "image")
+        except Exception:
+            if media_key:
+                # Ссылку отпускаем — объект удалит purge_orphaned_media после grace-периода
+                db.rollback()
+                release_media_file(db, media_key)
+                db.commit()
+            raise
+
+    await asyncio.to_thread(save_history)
+    return ai_response
+
+
+@app.post("/uploads/presign", response_model=PresignedUploadResponse)
+def presign_upload_endpoint(
+    payload: PresignedUploadRequest,
+    user_id: uuid.UUID = Depends(get_current_user_id),
+):
+    """
+    Выдаёт presigned PUT URL: клиент грузит изображение прямо в бакет,
+    а потом вызывает /analyze-image-by-key с полученным key.
+    """
+    if not payload.content_type.startswith("image/"):
+        raise HTTPException(status_code=400, detail="Only images can be uploaded")
+    return create_presigned_upload(user_id, payload.filename, payload.content_type)
+
+
+@app.post("/analyze-image-by-key", response_model=ImageAnalyzeResponse)
+def analyze_image_by_key_endpoint(
+    payload: ImageByKeyRequest,
+    db: Session = Depends(get_db),
+    user_id: uuid.UUID = Depends(get_current_user_id),
+):
+    """
+    Анализирует изображение, которое клиент уже загрузил в бакет по presigned URL.
+    Байты скачиваются сервером, а не передаются через API.
+    """
+    if not owns_upload_key(user_id, payload.key):
+        raise HTTPException(status_code=403, detail="Key does not belong to the current user")
+
+    meta = head_media_file(payload.key)
+    if meta is None:
+        raise HTTPException(status_code=404, detail="Object not found, upload it first")
+    if meta["size"] > DIRECT_UPLOAD_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="Uploaded file is too large")
+    # Формат и размеры — по заголовку той же версии объекта (IfMatch), одним ranged GET,
+    # до скачивания целиком и копирования под ключ по содержимому
+    reader = RangedMediaReader(payload.key, size=meta["size"], etag=meta["etag"])
+    try:
+        if sniff_image_type(reader.read(MEDIA_SNIFF_BYTES)) is None:
+            raise HTTPException(status_code=415, detail="Uploaded file is not a supported image")
+        reader.seek(0)
+        header = read_image_header(reader)
+    except MediaChangedError:
+        raise HTTPException(status_code=409, detail="Object changed or is unavailable, upload it again")
+    except Image.DecompressionBombError:
+        raise HTTPException(status_code=413, detail="Uploaded image has too many pixels")
+    except (UnidentifiedImageError, SyntaxError, ValueError):
+        raise HTTPException(status_code=415, detail="Uploaded file is not a supported image")
+    if header["width"] * header["height"] > IMAGE_MAX_PIXELS:
+        raise HTTPException(status_code=413, detail="Uploaded image has too many pixels")
+
+    # Ровно проверенная версия и размер; объект переносится под неизменяемый ключ по содержимому
+    claimed = claim_direct_upload(payload.key, meta, db=db)
+    if claimed is None:
+        raise HTTPException(status_code=409, detail="Object changed or is unavailable, upload it again")
+    media_key, image_bytes = claimed
+    # Ссылка на объект фиксируется сразу: иначе при ошибке ниже объект остался бы без записи
+    db.commit()
+
+    try:
+        ai_response = analyze_image(bytes(image_bytes))
+        create_history_record(
+            db=db,
+            user_id=user_id,
+            question=os.path.basename(payload.key),
+            raw_response=ai_response.dict(),
+            kind="image",
+            usage=ai_response.usage,
+            media_key=media_key,
+        )
+        record_late_usage(ai_response.detector_run, user_id, "image")
+    except Exception:
+        # Ссылку отпускаем — объект удалит purge_orphaned_media после grace-периода
+        db.rollback()
+        release_media_file(db, media_key)
+        db.commit()
+        raise
 
     return ai_response
 
@@ -254,6 +564,57 @@ def get_history_endpoint(
     return records
 
 
+@app.get("/history/search", response_model=TypingList[HistorySearchHit])
+def search_history_endpoint(
+    q: str = Query(..., min_length=1, max_length=500),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db),
+    user_id: uuid.UUID = Depends(get_current_user_id),
+):
+    """
+    Полнотекстовый поиск по истории текущего пользователя (вопрос + summary),
+    результаты отсортированы по релевантности.
+    """
+    hits = search_user_history(db, user_id, q, limit=limit, offset=offset)
+    return [
+        HistorySearchHit(**HistoryItem.model_validate(record).model_dump(), rank=rank)
+        for record, rank in hits
+    ]
+
+
+def _export_response(rows, fmt: str, fieldnames, filename: str, accept_encoding: Optional[str]):
+    """
+    StreamingResponse без Content-Length (chunked), gzip — если клиент его принимает.
+    """
+    use_gzip = accepts_gzip(accept_encoding)
+    headers = {
+        "Content-Disposition": f'attachment; filename="{filename}.{fmt}"',
+        "Vary": "Accept-Encoding",
+    }
+    if use_gzip:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        export_chunks(rows, fmt, fieldnames, gzip=use_gzip),
+        media_type=EXPORT_MEDIA_TYPES[fmt],
+        headers=headers,
+    )
+
+
+@app.get("/history/export")
+def export_history_endpoint(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    accept_encoding: Optional[str] = Header(None),
+    user_id: uuid.UUID = Depends(get_current_user_id),
+):
+    """
+    Потоковая выгрузка всей истории текущего пользователя (NDJSON или CSV).
+    """
+    return _export_response(
+        iter_history_rows(user_id), format, HISTORY_EXPORT_FIELDS, "history", accept_encoding
+    )
+
+
 @app.delete("/history/{history_id}", status_code=204)
 def delete_history_item_endpoint(
     history_id: uuid.UUID,
@@ -279,3 +640,161 @@ def delete_all_history_endpoint(
     """
     delete_all_history_for_user(db, user_id)
     return
+
+
+# ==========================
+#   SUBMISSIONS BY METRICS
+# ==========================
+
+MetricSortField = Literal[
+    "created_at",
+    "trust_score",
+    "ai_likeliness",
+    "manipulation_score",
+    "emotion_intensity",
+    "fake_probability",
+]
+
+
+class MetricsFilter:
+    """
+    Общие query-параметры фильтрации по горячим метрикам (для /submissions и /admin/submissions).
+    """
+
+    def __init__(
+        self,
+        verdict: Optional[Literal["REAL", "MIXED", "FAKE"]] = None,
+        min_trust_score: Optional[float] = Query(None, ge=0, le=100),
+        max_trust_score: Optional[float] = Query(None, ge=0, le=100),
+        min_ai_likeliness: Optional[float] = Query(None, ge=0, le=1),
+        max_ai_likeliness: Optional[float] = Query(None, ge=0, le=1),
+        min_manipulation_score: Optional[float] = Query(None, ge=0, le=1),
+        max_manipulation_score: Optional[float] = Query(None, ge=0, le=1),
+        created_from: Optional[datetime] = None,
+        created_to: Optional[datetime] = None,
+        sort_by: MetricSortField = "created_at",
+        order: Literal["asc", "desc"] = "desc",
+        limit: int = Query(50, ge=1, le=500),
+        offset: int = Query(0, ge=0),
+    ):
+        self.params = dict(
+            verdict=verdict,
+            min_trust_score=min_trust_score,
+            max_trust_score=max_trust_score,
+            min_ai_likeliness=min_ai_likeliness,
+            max_ai_likeliness=max_ai_likeliness,
+            min_manipulation_score=min_manipulation_score,
+            max_manipulation_score=max_manipulation_score,
+            created_from=created_from,
+            created_to=created_to,
+            sort_by=sort_by,
+            descending=order == "desc",
+            limit=limit,
+            offset=offset,
+        )
+
+
+@app.get("/submissions", response_model=TypingList[SubmissionMetricsItem])
+def list_my_submissions_endpoint(
+    filters: MetricsFilter = Depends(),
+    db: Session = Depends(get_db),
+    user_id: uuid.UUID = Depends(get_current_user_id),
+):
+    """
+    Заявки текущего пользователя с фильтрами/сортировкой по trust_score, ai_likeliness и т.д.
+    """
+    return query_submissions_by_metrics(db, user_id=user_id, **filters.params)
+
+
+@app.get(
+    "/admin/submissions",
+    response_model=TypingList[SubmissionMetricsItem],
+    dependencies=[Depends(require_admin)],
+)
+def list_all_submissions_endpoint(
+    filters: MetricsFilter = Depends(),
+    db: Session = Depends(get_db),
+):
+    """
+    То же самое по всей системе (только для админа).
+    """
+    return query_submissions_by_metrics(db, **filters.params)
+
+
+@app.get("/admin/export/submissions", dependencies=[Depends(require_admin)])
+def export_submissions_endpoint(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    accept_encoding: Optional[str] = Header(None),
+):
+    """
+    Потоковая выгрузка submissions + trust_scores по всей системе (только для админа).
+    """
+    return _export_response(
+        iter_submission_rows(created_from, created_to),
+        format,
+        SUBMISSIONS_EXPORT_FIELDS,
+        "submissions",
+        accept_encoding,
+    )
+
+
+@app.get("/usage", response_model=TypingList[UsageDailyItem])
+def get_usage_endpoint(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    db: Session = Depends(get_db),
+    user_id: uuid.UUID = Depends(get_current_user_id),
+):
+    """
+    Расходы текущего пользователя на внешние модели по дням (по умолчанию — за 30 дней).
+    """
+    return get_usage_daily(db, user_id=user_id, date_from=date_from, date_to=date_to)
+
+
+@app.get(
+    "/admin/usage",
+    response_model=TypingList[UsageDailyItem],
+    dependencies=[Depends(require_admin)],
+)
+def admin_usage_endpoint(
+    user_id: Optional[uuid.UUID] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    db: Session = Depends(get_db),
+):
+    """
+    Расходы по дням по всей системе или по одному пользователю (только для админа).
+    """
+    return get_usage_daily(db, user_id=user_id, date_from=date_from, date_to=date_to)
+
+
+@app.get("/admin/profiles", dependencies=[Depends(require_admin)])
+def list_profiles_endpoint():
+    """
+    Сохранённые профили запросов (новые сверху): маршрут, статус, длительность, число сэмплов.
+    """
+    return profile_store.list()
+
+
+@app.get("/admin/profiles/{profile_id}", dependencies=[Depends(require_admin)])
+def get_profile_endpoint(profile_id: str, format: Literal["json", "collapsed"] = "json"):
+    """
+    Профиль целиком (стеки + топ аллокаций tracemalloc) или стеки в формате collapsed
+    (format=collapsed — для flamegraph.pl / speedscope).
+    """
+    profile = profile_store.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "collapsed":
+        return PlainTextResponse(collapsed_stacks(profile))
+    return profile
+
+
+@app.get("/admin/media-cache", dependencies=[Depends(require_admin)])
+def media_cache_stats_endpoint():
+    """
+    Метрики локального кеша R2-объектов: hit ratio, сэкономленные байты, заполненность.
+    """
+    return media_cache.get().stats()
@@ -0,0 +1,52 @@
+"""
+Миграции схемы существующей базы. Запускаются один раз перед выкладкой новой версии,
+а не при старте каждого воркера (из папки back-end):
+
+    python -m app.models.migrate upgrade            # колонки, триггеры, индексы (CONCURRENTLY)
+    python -m app.models.migrate backfill-search    # search_vector для старых записей history
+    python -m app.models.migrate migrate-content    # перенос inline-текстов в contents
+    python -m app.models.migrate purge-contents     # удаление текстов, на которые нет ссылок
+"""
+
+import argparse
+import time
+from typing import List, Optional
+
+from app.models.database_ops import (
+    backfill_history_search_vector,
+    migrate_inline_content,
+    purge_orphaned_contents,
+    upgrade_schema,
+)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Миграции схемы БД")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("upgrade", help="Досоздать колонки, триггеры и индексы")
+    backfill = commands.add_parser("backfill-search", help="Заполнить search_vector старых записей")
+    backfill.add_argument("--batch-size", type=int, default=5000)
+    content = commands.add_parser("migrate-content", help="Перенести inline-тексты в contents")
+    content.add_argument("--batch-size", type=int, default=1000)
+    purge = commands.add_parser("purge-contents", help="Удалить тексты без ссылок из contents")
+    purge.add_argument("--batch-size", type=int, default=1000)
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    started = time.perf_counter()
+    if args.command == "upgrade":
+        upgrade_schema()
+        print("✅ Схема обновлена")
+    elif args.command == "backfill-search":
+        print(f"✅ search_vector заполнен: {backfill_history_search_vector(args.batch_size)} строк")
+    elif args.command == "migrate-content":
+        print(f"✅ Перенесено текстов: {migrate_inline_content(args.batch_size)}")
+    else:
+        print(f"✅ Удалено текстов без ссылок: {purge_orphaned_contents(args.batch_size)}")
+    print(f"   за {time.perf_counter() - started:.1f} с")
+
+
+if __name__ == "__main__":
+    main()
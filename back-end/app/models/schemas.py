@@ -1,8 +1,8 @@
-from datetime import datetime
-from typing import List, Dict, Any
+from datetime import date, datetime
+from typing import List, Dict, Any, Optional
 from uuid import UUID
 
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field
 
 
 class TextAnalyzeRequest(BaseModel):
@@ -23,6 +23,15 @@ class TextAnalyzeResponse(BaseModel):
     claims_evaluation: List[ClaimEvaluation]
     dangerous_phrases: List[str]
     summary: str
+    # Токены/стоимость вызовов LLM: пишется в history.usage, клиенту не отдаётся
+    usage: Optional[Dict[str, Any]] = Field(default=None, exclude=True)
+    # PipelineRun: по нему record_late_usage учитывает вызовы, брошенные по таймауту
+    detector_run: Optional[Any] = Field(default=None, exclude=True)
+
+
+class TextClassifyResponse(BaseModel):
+    label: str
+    probabilities: Dict[str, float]
 
 
 class ImageAnalyzeResponse(BaseModel):
@@ -32,6 +41,28 @@ class ImageAnalyzeResponse(BaseModel):
     realism: float
     anomalies: List[str]
     summary: str
+    usage: Optional[Dict[str, Any]] = Field(default=None, exclude=True)
+    detector_run: Optional[Any] = Field(default=None, exclude=True)
+
+
+class PresignedUploadRequest(BaseModel):
+    filename: str
+    content_type: str
+
+
+class PresignedUploadResponse(BaseModel):
+    """
+    Куда и как клиенту загрузить файл напрямую в бакет.
+    """
+    key: str
+    url: str
+    method: str
+    headers: Dict[str, str]
+    expires_in: int
+
+
+class ImageByKeyRequest(BaseModel):
+    key: str
 
 
 class HistoryItem(BaseModel):
@@ -46,3 +77,46 @@ class HistoryItem(BaseModel):
     raw_response: Dict[str, Any]
     created_at: datetime
     kind: str
+
+
+class HistorySearchHit(HistoryItem):
+    """
+    Результат /history/search: запись истории + релевантность (ts_rank_cd).
+    """
+    rank: float
+
+
+class SubmissionMetricsItem(BaseModel):
+    """
+    Строка выборки /submissions: заявка + горячие метрики из типизированных колонок.
+    """
+    submission_id: UUID
+    user_id: Optional[UUID]
+    media_type: str
+    status: str
+    created_at: datetime
+    verdict: Optional[str]
+    trust_score: Optional[float]
+    ai_likeliness: Optional[float]
+    manipulation_score: Optional[float]
+    emotion_intensity: Optional[float]
+    fake_probability: Optional[float]
+
+
+class UsageDailyItem(BaseModel):
+    """
+    Дневной агрегат расходов (/usage, /admin/usage): запросы, токены, стоимость, время внешних вызовов.
+    """
+    model_config = ConfigDict(from_attributes=True)
+
+    user_id: UUID
+    day: date
+    kind: str
+    requests: int
+    llm_calls: int
+    prompt_tokens: int
+    completion_tokens: int
+    cached_tokens: int
+    cost_usd: float
+    upstream_ms: float
+    input_bytes: int
@@ -2,44 +2,82 @@ import os
 import json
 import logging
 import math
+import time
 from typing import List, Dict, Any, Optional
 
 import requests
-from dotenv import load_dotenv
-from openai import OpenAI
+from requests.adapters import HTTPAdapter
 
+from app.core.container import LazyService, load_env
 from app.models.schemas import (
     TextAnalyzeResponse,
     ImageAnalyzeResponse,
     ClaimEvaluation,
 )
+from app.services.image_forensics import analyze_forensics, forensics_fallback
+from app.services.lexicon_matcher import lexicon_matcher, merge_phrases
+from app.services.metrics_assembler import DetectorPipeline, PipelineRun
+from app.services.stylometry import stylometry_scorer
+from app.services.telemetry import fallback_total, track_upstream
+from app.services.usage_accounting import completion_usage, usage_from_run
+from app.services.text_classifier_service import text_classifier
 
 # ----------------- ЛОГИ -----------------
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
 # ----------------- ENV -----------------
-load_dotenv()
+load_env()
 api_key = os.getenv("OPENAI_API_KEY")
 zerogpt_api_key = os.getenv("ZEROGPT_API_KEY")
 hf_api_key = os.getenv("HF_API_KEY")
-HF_IMAGE_MODEL_URL = "https://api-inference.huggingface.co/models/falconsai/Detect-Fake-Image-Using-ResNet50"
+HF_IMAGE_MODEL_URL = os.getenv(
+    "HF_IMAGE_MODEL_URL",
+    "https://api-inference.huggingface.co/models/falconsai/Detect-Fake-Image-Using-ResNet50",
+)
+# Адрес OpenAI-совместимого API (None — api.openai.com); нагрузочные тесты направляют его на bench/stub_servers.py
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+
+
+
+def _create_openai_client():
+    if not api_key:
+        raise RuntimeError("OPENAI_API_KEY не найден. Проверь файл .env в корне проекта.")
+    # Пакет openai импортируется ~0.5 с — только при первом вызове (или в lifespan), не при импорте
+    from openai import OpenAI
+
+    return OpenAI(api_key=api_key, base_url=OPENAI_BASE_URL)
 
 
+openai_client = LazyService("openai", _create_openai_client)
 
-if not api_key:
-    raise RuntimeError("OPENAI_API_KEY не найден. Проверь файл .env в корне проекта.")
+# Пул keep-alive соединений к ZeroGPT и HF: TLS-рукопожатие один раз на соединение, а не на запрос
+UPSTREAM_POOL_SIZE = int(os.getenv("UPSTREAM_POOL_SIZE", "10"))
 
-client = OpenAI(api_key=api_key)
+
+def _create_http_session() -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_maxsize=UPSTREAM_POOL_SIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+http_session = LazyService("http", _create_http_session)
+
+# Модели OpenAI для текста и изображений (цены — в usage_accounting.MODEL_PRICES_PER_MILLION)
+TEXT_MODEL = "gpt-4.1-mini"
+VISION_MODEL = "gpt-4.1-mini"  # или gpt-4o-mini, если доступен
 
 
 # =====================================================================
 #                       ZeroGPT интеграция
 # =====================================================================
 
-ZEROGPT_ENDPOINT = "https://api.zerogpt.com/api/detect/detectText"
+ZEROGPT_ENDPOINT = os.getenv("ZEROGPT_ENDPOINT", "https://api.zerogpt.com/api/detect/detectText")
 
 
+@track_upstream("zerogpt")
 def check_text_with_zerogpt(text: str) -> Optional[float]:
     """
     Отправляет текст в ZeroGPT и возвращает оценку ИИ-контента в диапазоне [0.0, 1.0],
@@ -72,7 +110,7 @@ def check_text_with_zerogpt(text: str) -> Optional[float]:
     payload = {"input_text": text}
 
     try:
-        resp = requests.post(
+        resp = http_session.get().post(
             ZEROGPT_ENDPOINT,
             headers=headers,
             data=json.dumps(payload),
@@ -210,11 +248,31 @@ def compute_trust_score(
 # =====================================================================
 
 
-def analyze_text(content: str) -> TextAnalyzeResponse:
+# Конвейер детекторов текста. Новый детектор — это функция с @text_pipeline.register(...),
+# analyze_text при этом не меняется. Детекторы с weight > 0, вернувшие ai_likeliness
+# (числом или в dict), входят во взвешенное среднее.
+text_pipeline = DetectorPipeline("text")
+
+
+def _text_fallback(summary: str) -> TextAnalyzeResponse:
+    """Безопасный дефолтный ответ, чтобы фронт не получал 500."""
+    return TextAnalyzeResponse(
+        trust_score=50,
+        ai_likeliness=0.0,
+        manipulation_score=0.0,
+        emotion_intensity=0.0,
+        claims_evaluation=[],
+        dangerous_phrases=[],
+        summary=summary,
+    )
+
+
+@text_pipeline.register("openai_text", inputs=("text",), timeout=60, weight=0.4)
+@track_upstream("openai_text")
+def detect_text_with_openai(text: str) -> Dict[str, Any]:
     """
-    Анализ текста через OpenAI + (опционально) ZeroGPT.
-    Если что-то ломается — логируем и возвращаем безопасный дефолтный ответ,
-    чтобы фронт не получал 500.
+    Анализ текста через OpenAI. Возвращает распарсенный JSON модели;
+    ошибки подключения и формата пробрасываются (их разбирает text_response_from_run).
     """
 
     system_prompt = (
@@ -237,12 +295,13 @@ def analyze_text(content: str) -> TextAnalyzeResponse:
 
     user_prompt = (
         "Вот текст, который нужно проанализировать на манипуляции, правдоподобие и стиль:\n\n"
-        f"{content}"
+        f"{text}"
     )
 
+    started = time.perf_counter()
     try:
-        completion = client.chat.completions.create(
-            model="gpt-4.1-mini",
+        completion = openai_client.get().chat.completions.create(
+            model=TEXT_MODEL,
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt},
@@ -251,33 +310,91 @@ def analyze_text(content: str) -> TextAnalyzeResponse:
         )
     except Exception as e:
         logger.exception("Ошибка при обращении к OpenAI: %s", e)
-        return TextAnalyzeResponse(
-            trust_score=50,
-            ai_likeliness=0.0,
-            manipulation_score=0.0,
-            emotion_intensity=0.0,
-            claims_evaluation=[],
-            dangerous_phrases=[],
-            summary="Анализ временно недоступен (ошибка подключения к модели).",
-        )
+        raise
+    usage = completion_usage(completion, TEXT_MODEL, (time.perf_counter() - started) * 1000)
 
     raw = completion.choices[0].message.content
 
     try:
         data = json.loads(raw)
-    except json.JSONDecodeError:
+    except json.JSONDecodeError as e:
         logger.exception("Не удалось распарсить JSON от модели. raw=%r", raw)
-        return TextAnalyzeResponse(
-            trust_score=50,
-            ai_likeliness=0.0,
-            manipulation_score=0.0,
-            emotion_intensity=0.0,
-            claims_evaluation=[],
-            dangerous_phrases=[],
-            summary="Модель вернула некорректный формат данных.",
-        )
+        # Ответ оплачен, даже если не разобран: usage забирает конвейер (DetectorOutcome.usage)
+        e.usage = usage
+        raise
+    # Токены и время вызова — для учёта расходов (usage_from_run)
+    data["usage"] = usage
+    return data
+
+
+@text_pipeline.register("stylometry", inputs=("text",), timeout=2)
+def detect_text_with_stylometry(text: str) -> Optional[Dict[str, Any]]:
+    """
+    Локальная стилометрия (перплексия n-граммной модели, burstiness, MATTR).
+    Сама в среднее не входит — подставляется в слот ZeroGPT, когда тот недоступен.
+    """
+    return stylometry_scorer.score(text)
+
+
+@text_pipeline.register("lexicon", inputs=("text",), timeout=2)
+def detect_dangerous_phrases(text: str) -> List[str]:
+    """Опасные выражения из локального словаря (EN/RU/SK), детерминированно и без токенов LLM."""
+    return lexicon_matcher.find(text)
+
+
+@text_pipeline.register("zerogpt", inputs=("text", "stylometry"), timeout=20, weight=0.6)
+def detect_text_with_zerogpt(text: str, stylometry: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    """
+    Дополнительная проверка через ZeroGPT. Если ключ не задан или сервис недоступен —
+    локальная стилометрическая оценка (так конвейер работает и без сети).
+    None, если нет ни того, ни другого (например, текст слишком короткий).
+    """
+    ai_likeliness = check_text_with_zerogpt(text)
+    if ai_likeliness is not None:
+        return {"ai_likeliness": ai_likeliness, "source": "zerogpt"}
+    if stylometry is not None:
+        fallback_total.inc("zerogpt_stylometry")
+        return {"ai_likeliness": stylometry["ai_likeliness"], "source": "stylometry"}
+    fallback_total.inc("zerogpt_none")
+    return None
+
+
+@text_pipeline.register("text_classifier", inputs=("text",), timeout=5)
+def detect_text_with_local_model(text: str) -> Optional[Dict[str, float]]:
+    """
+    Вероятности классов локальной модели ddd (без веса в ai_likeliness —
+    это дополнительный сигнал, он попадает в ai_metadata). None, если модели нет.
+    """
+    if not text_classifier.loaded:
+        return None
+    return text_classifier.predict_proba(text)
+
+
+def run_text_detectors(content: str, pipeline: Optional[DetectorPipeline] = None) -> PipelineRun:
+    """Параллельно прогоняет все детекторы текста."""
+    return (pipeline or text_pipeline).run({"text": content})
+
+
+def text_response_from_run(run: PipelineRun, input_bytes: int = 0) -> TextAnalyzeResponse:
+    """
+    Собирает ответ из результатов детекторов: метрики OpenAI +
+    взвешенный ai_likeliness по всем детекторам + trust_score.
+    В response.usage (не сериализуется) — токены/стоимость вызовов LLM для учёта расходов.
+    """
+    usage = usage_from_run(run, input_bytes)
+    outcome = run.outcomes.get("openai_text")
+    if outcome is None or not outcome.ok:
+        if outcome is not None and isinstance(outcome.error, json.JSONDecodeError):
+            fallback_total.inc("openai_text_format")
+            response = _text_fallback("Модель вернула некорректный формат данных.")
+        else:
+            fallback_total.inc("openai_text_unavailable")
+            response = _text_fallback("Анализ временно недоступен (ошибка подключения к модели).")
+        response.usage = usage
+        response.detector_run = run
+        return response
+    data = outcome.value
 
-    ai_likeliness = float(data.get("ai_likeliness", 0.0))
     manipulation_score = float(data.get("manipulation_score", 0.0))
     emotion_intensity = float(data.get("emotion_intensity", 0.0))
     dangerous_phrases_raw = data.get("dangerous_phrases", []) or []
@@ -294,22 +411,17 @@ def analyze_text(content: str) -> TextAnalyzeResponse:
             )
         )
 
-    dangerous_phrases = [str(p) for p in dangerous_phrases_raw]
-
-    # ---------- ДОПОЛНИТЕЛЬНАЯ ПРОВЕРКА ЧЕРЕЗ ZeroGPT ----------
-    zerogpt_ai = check_text_with_zerogpt(content)
-    if zerogpt_ai is not None:
-        # комбинируем оценки: 60% доверия ZeroGPT, 40% — OpenAI
-        combined_ai = 0.6 * zerogpt_ai + 0.4 * ai_likeliness
-        logger.info(
-            "Комбинированный ai_likeliness: openai=%.3f, zerogpt=%.3f -> combined=%.3f",
-            ai_likeliness,
-            zerogpt_ai,
-            combined_ai,
-        )
-        ai_likeliness = combined_ai
-    else:
-        logger.info("Используем только ai_likeliness от OpenAI: %.3f", ai_likeliness)
+    # Фразы от LLM + совпадения со словарём (без повторов)
+    dangerous_phrases = merge_phrases([str(p) for p in dangerous_phrases_raw], run.value("lexicon"))
+
+    # ---------- КОМБИНИРОВАННЫЙ ai_likeliness ПО ВСЕМ ДЕТЕКТОРАМ ----------
+    combined_ai = run.weighted("ai_likeliness")
+    ai_likeliness = combined_ai if combined_ai is not None else float(data.get("ai_likeliness", 0.0))
+    logger.info(
+        "Комбинированный ai_likeliness=%.3f (%s)",
+        ai_likeliness,
+        ", ".join(f"{name}={o.status}" for name, o in run.outcomes.items()),
+    )
 
     trust = compute_trust_score(
         ai_likeliness=ai_likeliness,
@@ -327,15 +439,27 @@ def analyze_text(content: str) -> TextAnalyzeResponse:
         claims_evaluation=claims,
         dangerous_phrases=dangerous_phrases,
         summary=summary,
+        usage=usage,
+        detector_run=run,
     )
 
 
+def analyze_text(content: str) -> TextAnalyzeResponse:
+    """
+    Анализ текста через OpenAI + ZeroGPT (или локальная стилометрия) и другие детекторы text_pipeline.
+    Если что-то ломается — логируем и возвращаем безопасный дефолтный ответ,
+    чтобы фронт не получал 500.
+    """
+    return text_response_from_run(run_text_detectors(content), len(content.encode("utf-8")))
+
+
 # =====================================================================
 #                          Анализ изображения
 # =====================================================================
 
 import base64
 
+@track_upstream("hf_image")
 def detect_ai_image_hf(image_bytes: bytes) -> Optional[float]:
     """
     Вызывает HuggingFace модель falconsai/Detect-Fake-Image-Using-ResNet50
@@ -350,7 +474,7 @@ def detect_ai_image_hf(image_bytes: bytes) -> Optional[float]:
     headers = {"Authorization": f"Bearer {hf_api_key}"}
 
     try:
-        resp = requests.post(
+        resp = http_session.get().post(
             HF_IMAGE_MODEL_URL,
             headers=headers,
             data=image_bytes,
@@ -395,6 +519,7 @@ def detect_ai_image_hf(image_bytes: bytes) -> Optional[float]:
     return ai_likelihood
 
 
+@track_upstream("openai_vision")
 def analyze_image_with_openai(image_bytes: bytes) -> Dict[str, Any]:
     """
     Анализ изображения через OpenAI Vision (gpt-4.1-mini / gpt-4o-mini).
@@ -449,9 +574,10 @@ def analyze_image_with_openai(image_bytes: bytes) -> Dict[str, Any]:
         },
     ]
 
+    started = time.perf_counter()
     try:
-        completion = client.chat.completions.create(
-            model="gpt-4.1-mini",  # или gpt-4o-mini, если доступен
+        completion = openai_client.get().chat.completions.create(
+            model=VISION_MODEL,
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_content},
@@ -461,13 +587,14 @@ def analyze_image_with_openai(image_bytes: bytes) -> Dict[str, Any]:
     except Exception as e:
         logger.exception("Ошибка при обращении к OpenAI Vision: %s", e)
         return default
+    usage = completion_usage(completion, VISION_MODEL, (time.perf_counter() - started) * 1000)
 
     raw = completion.choices[0].message.content
     try:
         data = json.loads(raw)
     except json.JSONDecodeError:
         logger.exception("Не удалось распарсить JSON от OpenAI Vision. raw=%r", raw)
-        return default
+        return {**default, "usage": usage}
 
     try:
         return {
@@ -476,10 +603,11 @@ def analyze_image_with_openai(image_bytes: bytes) -> Dict[str, Any]:
             "realism": float(data.get("realism", default["realism"])),
             "anomalies": data.get("anomalies", []) or [],
             "summary": str(data.get("summary", default["summary"])),
+            "usage": usage,
         }
     except Exception:
         logger.exception("Ошибка при приведении типов метрик изображения: %r", data)
-        return default
+        return {**default, "usage": usage}
 
 
 def compute_image_trust_score(
@@ -488,6 +616,7 @@ def compute_image_trust_score(
     manipulation_risk: float,
     realism: float,
     anomalies: List[str],
+    forensic_score: Optional[float] = None,
 ) -> int:
     """
     Аналог продвинутого trust-score, но для изображений.
@@ -496,6 +625,7 @@ def compute_image_trust_score(
       - integrity_score    : отсутствие манипуляций     (1 - manipulation_risk)
       - realism_score      : визуальная реалистичность  (realism)
       - anomaly_score      : отсутствие заметных аномалий (чем больше аномалий, тем хуже)
+      - forensic_score     : итог локальной проверки (ELA, шум, EXIF), если она прошла
 
     Используем взвешенное геометрическое среднее.
     """
@@ -517,13 +647,17 @@ def compute_image_trust_score(
     s_r = max(realism_score / 100.0, 1e-6)
     s_n = max(anomaly_score / 100.0, 1e-6)
 
-    total_weight = w_auth + w_integ + w_real + w_anom
+    w_forensic = 2.0 if forensic_score is not None else 0.0
+    s_f = max(forensic_score if forensic_score is not None else 1.0, 1e-6)
+
+    total_weight = w_auth + w_integ + w_real + w_anom + w_forensic
 
     log_trust = (
         w_auth * math.log(s_a)
         + w_integ * math.log(s_i)
         + w_real * math.log(s_r)
         + w_anom * math.log(s_n)
+        + w_forensic * math.log(s_f)
     ) / total_weight
 
     trust = math.exp(log_trust) * 100.0
@@ -531,47 +665,96 @@ def compute_image_trust_score(
     return trust
 
 
+# Уверенность локальной проверки, при которой HF и Vision не вызываются
+IMAGE_FORENSICS_SHORT_CIRCUIT = float(os.getenv("IMAGE_FORENSICS_SHORT_CIRCUIT", "0.85"))
+
+
+def forensics_is_conclusive(image_bytes: bytes = None, forensics: Optional[Dict[str, Any]] = None) -> bool:
+    """skip_if для удалённых детекторов: локальная проверка уже уверена."""
+    return forensics is not None and forensics["confidence"] >= IMAGE_FORENSICS_SHORT_CIRCUIT
+
+
+# Конвейер детекторов изображения (аналогично text_pipeline).
+# Локальная проверка занимает десятки миллисекунд, удалённые детекторы ждут её
+# и пропускаются, если она уже дала уверенный ответ.
+image_pipeline = DetectorPipeline("image")
+image_pipeline.register("forensics", inputs=("image_bytes",), timeout=5, weight=0.2)(analyze_forensics)
+
+
+@image_pipeline.register(
+    "hf_image", inputs=("image_bytes", "forensics"), timeout=30, weight=0.6, skip_if=forensics_is_conclusive
+)
+def detect_ai_image_hf_remote(image_bytes: bytes, forensics: Optional[Dict[str, Any]] = None) -> Optional[float]:
+    return detect_ai_image_hf(image_bytes)
+
+
+@image_pipeline.register(
+    "openai_vision", inputs=("image_bytes", "forensics"), timeout=60, weight=0.4, skip_if=forensics_is_conclusive
+)
+def analyze_image_with_openai_remote(image_bytes: bytes, forensics: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    return analyze_image_with_openai(image_bytes)
+
+
+# Ответ Vision, если детектор упал или не уложился в таймаут
+VISION_FALLBACK = {
+    "ai_likeliness": 0.5,
+    "manipulation_risk": 0.3,
+    "realism": 0.8,
+    "anomalies": [],
+    "summary": "Не удалось провести полноценный анализ изображения.",
+}
+
+
+def run_image_detectors(image_bytes: bytes, pipeline: Optional[DetectorPipeline] = None) -> PipelineRun:
+    """Параллельно прогоняет все детекторы изображения."""
+    return (pipeline or image_pipeline).run({"image_bytes": image_bytes})
+
+
 def analyze_image(image_bytes: bytes) -> ImageAnalyzeResponse:
     """
     Анализ изображения:
+      0. Локальная проверка (ELA, шумовой остаток, таблицы квантования, EXIF)
       1. HuggingFace детектор falconsai/Detect-Fake-Image-Using-ResNet50
       2. OpenAI Vision (gpt-4.1-mini)
       3. Комбинированный ai_likeliness и продвинутый trust_score.
+    Детекторы (и любые другие из image_pipeline) работают параллельно; при уверенной
+    локальной проверке 1 и 2 пропускаются.
     """
 
-    # 1) HF детектор
-    hf_ai = detect_ai_image_hf(image_bytes)
+    run = run_image_detectors(image_bytes)
 
-    # 2) OpenAI Vision
-    vision_metrics = analyze_image_with_openai(image_bytes)
-    vision_ai = vision_metrics["ai_likeliness"]
+    forensics = run.value("forensics")
+    vision_outcome = run.outcomes.get("openai_vision")
+    forensics_only = vision_outcome is not None and vision_outcome.status == "skipped"
+    if forensics_only:
+        fallback_total.inc("image_forensics_only")
+        vision_metrics = forensics_fallback(forensics)
+    else:
+        vision_metrics = run.value("openai_vision") or VISION_FALLBACK
+        if vision_metrics["summary"] == VISION_FALLBACK["summary"]:
+            fallback_total.inc("openai_vision_default")
     manipulation_risk = vision_metrics["manipulation_risk"]
     realism = vision_metrics["realism"]
     anomalies = [str(a) for a in (vision_metrics["anomalies"] or [])]
     summary = vision_metrics["summary"]
 
-    # 3) Комбинируем оценки AI-картинки
-    if hf_ai is not None and vision_ai is not None:
-        ai_likeliness = 0.6 * hf_ai + 0.4 * vision_ai
-        logger.info(
-            "Комбинированный image ai_likeliness: HF=%.3f, Vision=%.3f -> %.3f",
-            hf_ai,
-            vision_ai,
-            ai_likeliness,
-        )
-    elif hf_ai is not None:
-        ai_likeliness = hf_ai
-        logger.info("Используем только HF ai_likeliness для изображения: %.3f", ai_likeliness)
-    else:
-        ai_likeliness = vision_ai
-        logger.info("Используем только OpenAI Vision ai_likeliness для изображения: %.3f", ai_likeliness)
+    # Комбинируем оценки AI-картинки по всем детекторам с весом
+    combined_ai = run.weighted("ai_likeliness")
+    ai_likeliness = combined_ai if combined_ai is not None else vision_metrics["ai_likeliness"]
+    logger.info(
+        "Комбинированный image ai_likeliness=%.3f (%s)",
+        ai_likeliness,
+        ", ".join(f"{name}={o.status}" for name, o in run.outcomes.items()),
+    )
 
-    # 4) Итоговый trust-score
+    # Итоговый trust-score. Если оси Vision уже построены по локальной проверке,
+    # отдельная ось forensic_score учла бы тот же результат второй раз
     trust_score = compute_image_trust_score(
         ai_likeliness=ai_likeliness,
         manipulation_risk=manipulation_risk,
         realism=realism,
         anomalies=anomalies,
+        forensic_score=forensics["forensic_score"] if forensics and not forensics_only else None,
     )
 
     return ImageAnalyzeResponse(
@@ -581,4 +764,6 @@ def analyze_image(image_bytes: bytes) -> ImageAnalyzeResponse:
         realism=realism,
         anomalies=anomalies,
         summary=summary,
+        usage=usage_from_run(run, len(image_bytes)),
+        detector_run=run,
     )
\ No newline at end of file
@@ -0,0 +1,285 @@
+# app/services/async_storage_service.py
+
+import asyncio
+import logging
+import random
+from typing import Any, Awaitable, BinaryIO, Callable, Dict, List, Optional, TypeVar
+
+from sqlalchemy.orm import Session
+
+from app.models.database_ops import acquire_media_ref
+from app.services.storage_service import (
+    R2_ENDPOINT_URL,
+    R2_ACCESS_KEY_ID,
+    R2_SECRET_APPLICATION_KEY,
+    R2_BUCKET_NAME,
+    R2_MULTIPART_CHUNK_BYTES,
+    R2_PART_CONCURRENCY,
+    R2_MAX_CONCURRENT_UPLOADS,
+    R2_UPLOAD_MAX_ATTEMPTS,
+    R2_UPLOAD_BACKOFF_BASE,
+    R2_HEAD_CHECK_MIN_BYTES,
+    known_media_keys,
+)
+from app.services.media_keys import hash_and_spool, media_key_for
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# S3 (и R2) отклоняют complete_multipart_upload, если любая часть, кроме последней, меньше 5 МиБ
+S3_MIN_PART_BYTES = 5 * 1024 * 1024
+
+# Ограничение одновременных загрузок на процесс (общий для всех вызовов)
+_upload_semaphore: Optional[asyncio.Semaphore] = None
+
+
+def _get_upload_semaphore() -> asyncio.Semaphore:
+    global _upload_semaphore
+    if _upload_semaphore is None:
+        _upload_semaphore = asyncio.Semaphore(R2_MAX_CONCURRENT_UPLOADS)
+    return _upload_semaphore
+
+
+async def with_retries(
+    operation: Callable[[], Awaitable[T]],
+    *,
+    what: str,
+    max_attempts: int = R2_UPLOAD_MAX_ATTEMPTS,
+    backoff_base: float = R2_UPLOAD_BACKOFF_BASE,
+) -> T:
+    """
+    Выполняет операцию с повторами: задержка backoff_base * 2^попытка с джиттером.
+    """
+    for attempt in range(1, max_attempts + 1):
+        try:
+            return await operation()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if attempt == max_attempts:
+                raise
+            delay = backoff_base * (2 ** (attempt - 1)) * (0.5 + random.random())
+            logger.warning("R2 %s: попытка %d/%d не удалась (%s), повтор через %.2fс",
+                           what, attempt, max_attempts, e, delay)
+            await asyncio.sleep(delay)
+    raise RuntimeError("unreachable")
+
+
+class AsyncMultipartUploader:
+    """
+    Асинхронная загрузка в S3-совместимое хранилище (R2, MinIO, moto).
+
+    - файлы меньше chunk_size уходят одним put_object;
+    - большие — multipart: части читаются последовательно, а грузятся параллельно
+      (не больше part_concurrency частей в полёте, т.е. память ~ chunk_size * part_concurrency);
+      все части, кроме последней, ровно chunk_size и не меньше min_part_size (5 МиБ у S3);
+    - каждая операция повторяется с экспоненциальной задержкой;
+    - при неустранимой ошибке части чтение сразу прекращается, остальные части
+      отменяются, а multipart-загрузка отменяется (abort), чтобы не копить мусор.
+
+    client — async-клиент с API aiobotocore (await client.put_object(...) и т.д.).
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        bucket: str,
+        *,
+        chunk_size: int = R2_MULTIPART_CHUNK_BYTES,
+        part_concurrency: int = R2_PART_CONCURRENCY,
+        max_attempts: int = R2_UPLOAD_MAX_ATTEMPTS,
+        backoff_base: float = R2_UPLOAD_BACKOFF_BASE,
+        upload_semaphore: Optional[asyncio.Semaphore] = None,
+        min_part_size: int = S3_MIN_PART_BYTES,
+    ):
+        self.client = client
+        self.bucket = bucket
+        self.chunk_size = max(chunk_size, min_part_size)
+        self.part_concurrency = part_concurrency
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self._upload_semaphore = upload_semaphore
+
+    async def _retry(self, operation: Callable[[], Awaitable[T]], what: str) -> T:
+        return await with_retries(
+            operation, what=what, max_attempts=self.max_attempts, backoff_base=self.backoff_base
+        )
+
+    async def _read_chunk(self, file_stream: BinaryIO) -> bytes:
+        """Ровно chunk_size байт (короче — только в конце потока): read() может вернуть меньше."""
+        def read_full() -> bytes:
+            parts, remaining = [], self.chunk_size
+            while remaining:
+                data = file_stream.read(remaining)
+                if not data:
+                    break
+                parts.append(data)
+                remaining -= len(data)
+            return b"".join(parts)
+
+        return await asyncio.to_thread(read_full)
+
+    async def upload(self, file_stream: BinaryIO, key: str, content_type: str) -> str:
+        semaphore = self._upload_semaphore or _get_upload_semaphore()
+        async with semaphore:
+            first_chunk = await self._read_chunk(file_stream)
+            if len(first_chunk) < self.chunk_size:
+                await self._retry(
+                    lambda: self.client.put_object(
+                        Bucket=self.bucket, Key=key, Body=first_chunk, ContentType=content_type
+                    ),
+                    what=f"put_object {key}",
+                )
+                return key
+            await self._upload_multipart(file_stream, first_chunk, key, content_type)
+            return key
+
+    async def _upload_multipart(self, file_stream: BinaryIO, first_chunk: bytes, key: str, content_type: str):
+        created = await self._retry(
+            lambda: self.client.create_multipart_upload(Bucket=self.bucket, Key=key, ContentType=content_type),
+            what=f"create_multipart_upload {key}",
+        )
+        upload_id = created["UploadId"]
+        parts_in_flight = asyncio.Semaphore(self.part_concurrency)
+        tasks: List[asyncio.Task] = []
+        # Первая неустранимая ошибка части: после неё новые части не читаются и не запускаются
+        failures: List[Exception] = []
+
+        async def upload_part(part_number: int, body: bytes) -> Dict[str, Any]:
+            try:
+                response = await self._retry(
+                    lambda: self.client.upload_part(
+                        Bucket=self.bucket, Key=key, UploadId=upload_id, PartNumber=part_number, Body=body
+                    ),
+                    what=f"upload_part {key}#{part_number}",
+                )
+                return {"PartNumber": part_number, "ETag": response["ETag"]}
+            except Exception as e:
+                failures.append(e)
+                raise
+            finally:
+                parts_in_flight.release()
+
+        try:
+            chunk, part_number = first_chunk, 1
+            while chunk:
+                # Упавшая часть освобождает слот — ожидание здесь заканчивается и на ошибке
+                await parts_in_flight.acquire()
+                if failures:
+                    raise failures[0]
+                tasks.append(asyncio.create_task(upload_part(part_number, chunk)))
+                part_number += 1
+                chunk = await self._read_chunk(file_stream)
+                if failures:
+                    raise failures[0]
+            parts = await asyncio.gather(*tasks)
+            await self._retry(
+                lambda: self.client.complete_multipart_upload(
+                    Bucket=self.bucket,
+                    Key=key,
+                    UploadId=upload_id,
+                    MultipartUpload={"Parts": sorted(parts, key=lambda p: p["PartNumber"])},
+                ),
+                what=f"complete_multipart_upload {key}",
+            )
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            try:
+                await self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+            except Exception as e:
+                logger.warning("Не удалось отменить multipart-загрузку %s: %s", key, e)
+            raise
+
+
+# --- КЛИЕНТ (aiobotocore) ---
+
+_client_context = None
+_async_s3_client = None
+
+
+async def get_async_s3_client():
+    """Лениво создаёт один async-клиент на процесс (aiobotocore держит пул соединений)."""
+    global _client_context, _async_s3_client
+    if _async_s3_client is None:
+        try:
+            # Импорт aiobotocore (тянет botocore) — только когда async-клиент действительно нужен
+            from aiobotocore.session import get_session
+        except ImportError:  # async-бэкенд опционален, sync-путь работает без него
+            raise RuntimeError("aiobotocore не установлен: async-загрузка в R2 недоступна")
+        _client_context = get_session().create_client(
+            "s3",
+            endpoint_url=R2_ENDPOINT_URL,
+            aws_access_key_id=R2_ACCESS_KEY_ID,
+            aws_secret_access_key=R2_SECRET_APPLICATION_KEY,
+        )
+        _async_s3_client = await _client_context.__aenter__()
+    return _async_s3_client
+
+
+async def close_async_s3_client() -> None:
+    global _client_context, _async_s3_client
+    if _client_context is not None:
+        await _client_context.__aexit__(None, None, None)
+    _client_context = None
+    _async_s3_client = None
+
+
+async def object_exists_async(client: Any, s3_key: str) -> bool:
+    try:
+        await client.head_object(Bucket=R2_BUCKET_NAME, Key=s3_key)
+        return True
+    except Exception as e:
+        code = getattr(e, "response", {}).get("Error", {}).get("Code")
+        if code in ("404", "NoSuchKey", "NotFound"):
+            return False
+        raise
+
+
+async def needs_upload_async(client: Any, s3_key: str, size: int) -> bool:
+    """Та же логика, что storage_service.needs_upload (LRU -> Bloom/размер -> HEAD)."""
+    if known_media_keys.is_known(s3_key):
+        return False
+    if known_media_keys.maybe_known(s3_key) or size >= R2_HEAD_CHECK_MIN_BYTES:
+        try:
+            if await object_exists_async(client, s3_key):
+                known_media_keys.remember(s3_key)
+                return False
+        except Exception as e:
+            logger.warning("HEAD-проверка %s не удалась, загружаю файл: %s", s3_key, e)
+    return True
+
+
+async def upload_media_file_async(
+    file_stream: BinaryIO,
+    original_filename: str,
+    content_type: str,
+    db: Optional[Session] = None,
+) -> str:
+    """
+    Async-аналог storage_service.upload_media_file: не блокирует event loop.
+    Ключ — SHA-256 содержимого; дубликаты не передаются повторно.
+
+    :param db: Если передана сессия — увеличиваем счётчик ссылок на объект (commit за вызывающим;
+        при пустом результате транзакцию нужно откатить).
+    :return: Ключ файла в хранилище или пустая строка при ошибке (как и sync-версия).
+    """
+    try:
+        sha256_hex, spool, size = await asyncio.to_thread(hash_and_spool, file_stream)
+        s3_key = media_key_for(sha256_hex, original_filename)
+        # Ссылку берём до проверки наличия: объект со ссылкой чистка уже не удалит.
+        # Запрос к Postgres синхронный — в потоке, чтобы не держать event loop
+        if db is not None and await asyncio.to_thread(acquire_media_ref, db, s3_key, size, content_type) is None:
+            logger.warning("Объект %s сейчас удаляется из R2, повторите загрузку позже", s3_key)
+            return ""
+        with spool:
+            client = await get_async_s3_client()
+            if await needs_upload_async(client, s3_key, size):
+                await AsyncMultipartUploader(client, R2_BUCKET_NAME).upload(spool, s3_key, content_type)
+                known_media_keys.remember(s3_key)
+        return s3_key
+    except Exception as e:
+        logger.error("❌ Ошибка async-загрузки файла в R2: %s", e)
+        return ""
@@ -0,0 +1,261 @@
+# app/services/export_service.py
+
+import csv
+import io
+import json
+import os
+import uuid
+import zlib
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from sqlalchemy import select
+
+from app.models.database_ops import (
+    SessionLocal,
+    Content,
+    History,
+    Submission,
+    TrustScore,
+    read_session,
+    resolve_content_text,
+)
+
+# Сколько строк тянуть с сервера за один fetch (server-side cursor)
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "1000"))
+# Примерный размер отдаваемого куска (байт) до сжатия
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+HISTORY_EXPORT_FIELDS = [
+    "id",
+    "created_at",
+    "kind",
+    "question",
+    "trust_score",
+    "verdict",
+    "ai_likeliness",
+    "manipulation_score",
+    "raw_response",
+]
+
+SUBMISSIONS_EXPORT_FIELDS = [
+    "submission_id",
+    "user_id",
+    "media_type",
+    "status",
+    "content_text",
+    "media_url",
+    "created_at",
+    "updated_at",
+    "verdict",
+    "fake_probability",
+    "trust_score",
+    "ai_likeliness",
+    "manipulation_score",
+    "emotion_intensity",
+    "model_version",
+    "ai_metadata",
+]
+
+
+# ---------------------- ИСТОЧНИКИ СТРОК ----------------------
+
+
+def _with_content_text(row: Any, field: str, inline_key: str) -> Dict[str, Any]:
+    """Подставляет текст из contents (или старой inline-колонки) под именем field."""
+    data = dict(row._mapping)
+    data[field] = resolve_content_text(
+        data.pop(inline_key), data.pop("content_body"), data.pop("content_body_zstd")
+    )
+    return data
+
+
+def iter_history_rows(user_id: uuid.UUID, chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator[Dict[str, Any]]:
+    """
+    Построчно отдаёт историю пользователя через server-side cursor (yield_per),
+    не материализуя всю выборку в памяти.
+
+    Сессия открывается внутри генератора: StreamingResponse читает его уже после
+    того, как зависимость get_db закрыла свою сессию.
+    """
+    db = SessionLocal()
+    try:
+        with read_session(db, user_id) as rdb:
+            stmt = (
+                select(
+                    History.id,
+                    History.created_at,
+                    History.kind,
+                    History._question.label("inline_question"),
+                    Content.body.label("content_body"),
+                    Content.body_zstd.label("content_body_zstd"),
+                    History.trust_score,
+                    History.verdict,
+                    History.ai_likeliness,
+                    History.manipulation_score,
+                    History.raw_response,
+                )
+                .outerjoin(Content, Content.hash == History.content_hash)
+                .where(History.user_id == user_id)
+                .order_by(History.created_at.desc())
+            )
+            for row in rdb.execute(stmt, execution_options={"yield_per": chunk_rows}):
+                yield _with_content_text(row, "question", "inline_question")
+    finally:
+        db.close()
+
+
+def iter_submission_rows(
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    chunk_rows: int = EXPORT_CHUNK_ROWS,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Построчно отдаёт submissions вместе с trust_scores (LEFT JOIN) по всей системе.
+    """
+    db = SessionLocal()
+    try:
+        with read_session(db) as rdb:
+            stmt = select(
+                Submission.id.label("submission_id"),
+                Submission.user_id,
+                Submission.media_type,
+                Submission.status,
+                Submission._content_text.label("inline_content_text"),
+                Content.body.label("content_body"),
+                Content.body_zstd.label("content_body_zstd"),
+                Submission.media_url,
+                Submission.created_at,
+                Submission.updated_at,
+                TrustScore.verdict,
+                TrustScore.fake_probability,
+                TrustScore.trust_score,
+                TrustScore.ai_likeliness,
+                TrustScore.manipulation_score,
+                TrustScore.emotion_intensity,
+                TrustScore.model_version,
+                TrustScore.ai_metadata,
+            ).outerjoin(TrustScore, TrustScore.submission_id == Submission.id).outerjoin(
+                Content, Content.hash == Submission.content_hash
+            )
+            if created_from is not None:
+                stmt = stmt.where(Submission.created_at >= created_from)
+            if created_to is not None:
+                stmt = stmt.where(Submission.created_at <= created_to)
+            stmt = stmt.order_by(Submission.created_at)
+            for row in rdb.execute(stmt, execution_options={"yield_per": chunk_rows}):
+                yield _with_content_text(row, "content_text", "inline_content_text")
+    finally:
+        db.close()
+
+
+# ---------------------- КОДИРОВАНИЕ ----------------------
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _csv_value(value: Any) -> Any:
+    """Вложенные структуры (JSONB) пишем в CSV как JSON-строку."""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False, default=_json_default)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if value is None:
+        return ""
+    return value
+
+
+def encode_ndjson(rows: Iterable[Dict[str, Any]], chunk_bytes: int = EXPORT_CHUNK_BYTES) -> Iterator[bytes]:
+    """Одна JSON-строка на запись; строки склеиваются в куски ~chunk_bytes."""
+    buffer: List[bytes] = []
+    size = 0
+    for row in rows:
+        line = (json.dumps(row, ensure_ascii=False, default=_json_default) + "\n").encode("utf-8")
+        buffer.append(line)
+        size += len(line)
+        if size >= chunk_bytes:
+            yield b"".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+def encode_csv(
+    rows: Iterable[Dict[str, Any]],
+    fieldnames: List[str],
+    chunk_bytes: int = EXPORT_CHUNK_BYTES,
+) -> Iterator[bytes]:
+    """CSV с заголовком; буфер сбрасывается каждые ~chunk_bytes."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fieldnames, extrasaction="ignore")
+    writer.writeheader()
+    for row in rows:
+        writer.writerow({key: _csv_value(row.get(key)) for key in fieldnames})
+        if buffer.tell() >= chunk_bytes:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def gzip_stream(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """Потоковое gzip-сжатие: память не зависит от общего объёма."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    """
+    Принимает ли клиент gzip по Accept-Encoding (RFC 9110): с учётом q-значений,
+    "gzip;q=0" — явный отказ; без упоминания gzip решает "*". Нечитаемый q — как q=0.
+    """
+    weights: Dict[str, float] = {}
+    for item in (accept_encoding or "").split(","):
+        coding, *params = [part.strip() for part in item.split(";")]
+        if not coding:
+            continue
+        weight = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[coding.lower()] = weight
+    for coding in ("gzip", "x-gzip", "*"):
+        if coding in weights:
+            return weights[coding] > 0
+    return False
+
+
+def export_chunks(
+    rows: Iterable[Dict[str, Any]],
+    fmt: str,
+    fieldnames: List[str],
+    gzip: bool = False,
+) -> Iterator[bytes]:
+    """Собирает поток байтов для выгрузки в нужном формате (опционально gzip)."""
+    if fmt == "ndjson":
+        chunks = encode_ndjson(rows)
+    elif fmt == "csv":
+        chunks = encode_csv(rows, fieldnames)
+    else:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    return gzip_stream(chunks) if gzip else chunks
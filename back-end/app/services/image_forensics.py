@@ -0,0 +1,272 @@
+# app/services/image_forensics.py
+
+import io
+import os
+from typing import Any, BinaryIO, Dict, List, Optional
+
+import numpy as np
+from PIL import Image, ImageChops, ImageOps
+
+# Большие изображения уменьшаем: статистики шума и ELA от этого почти не меняются,
+# а время анализа остаётся в пределах десятков миллисекунд
+FORENSICS_MAX_SIDE = int(os.getenv("FORENSICS_MAX_SIDE", "1024"))
+ELA_QUALITY = 90
+# Режимы, для которых reduce усредняет именно цвета (у P усреднялись бы индексы палитры)
+REDUCIBLE_MODES = ("RGB", "RGBA", "L", "LA")
+BLOCK = 32
+# Больше пикселей не декодируем: проверяется по заголовку, до скачивания всего объекта
+IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", str(Image.MAX_IMAGE_PIXELS)))
+
+# Стандартная таблица квантования яркости (JPEG Annex K), естественный порядок
+STD_LUMINANCE_TABLE = np.array([
+    16, 11, 10, 16, 24, 40, 51, 61,
+    12, 12, 14, 19, 26, 58, 60, 55,
+    14, 13, 16, 24, 40, 57, 69, 56,
+    14, 17, 22, 29, 51, 87, 80, 62,
+    18, 22, 37, 56, 68, 109, 103, 77,
+    24, 35, 55, 64, 81, 104, 113, 92,
+    49, 64, 78, 87, 103, 121, 120, 101,
+    72, 92, 95, 98, 112, 100, 103, 99,
+])
+ZIGZAG = np.array([
+    0, 1, 8, 16, 9, 2, 3, 10, 17, 24, 32, 25, 18, 11, 4, 5,
+    12, 19, 26, 33, 40, 48, 41, 34, 27, 20, 13, 6, 7, 14, 21, 28,
+    35, 42, 49, 56, 57, 50, 43, 36, 29, 22, 15, 23, 30, 37, 44, 51,
+    58, 59, 52, 45, 38, 31, 39, 46, 53, 60, 61, 54, 47, 55, 62, 63,
+])
+
+# Теги EXIF
+TAG_MAKE, TAG_MODEL, TAG_SOFTWARE, TAG_DATETIME = 0x010F, 0x0110, 0x0131, 0x0132
+TAG_EXIF_IFD, TAG_DATETIME_ORIGINAL = 0x8769, 0x9003
+
+AI_SOFTWARE_MARKERS = (
+    "midjourney", "dall-e", "dall·e", "stable diffusion", "stablediffusion", "firefly",
+    "novelai", "comfyui", "automatic1111", "imagen", "flux",
+)
+EDITOR_SOFTWARE_MARKERS = ("photoshop", "gimp", "lightroom", "affinity", "pixelmator", "snapseed", "facetune")
+
+
+def _standard_table(quality: int) -> np.ndarray:
+    """Таблица libjpeg для заданного качества."""
+    scale = 5000 / quality if quality < 50 else 200 - 2 * quality
+    return np.clip((STD_LUMINANCE_TABLE * scale + 50) // 100, 1, 255)
+
+
+_STANDARD_TABLES = {q: _standard_table(q) for q in range(1, 101)}
+
+
+def quantization_fingerprint(image: Image.Image) -> Dict[str, Any]:
+    """
+    Сравнивает таблицу квантования яркости со стандартными libjpeg-таблицами.
+    Камеры и смартфоны обычно пишут свои таблицы, библиотеки (в т.ч. пайплайны
+    генераторов и повторное сохранение) — стандартные.
+    """
+    tables = getattr(image, "quantization", None)
+    if not tables or 0 not in tables:
+        return {"jpeg": False, "standard_table": None, "estimated_quality": None}
+    table = np.array(tables[0][:64])
+    # Pillow в разных версиях отдавал таблицы в естественном и в zigzag-порядке
+    natural_from_zigzag = np.empty(64, dtype=table.dtype)
+    natural_from_zigzag[ZIGZAG] = table
+    for quality, standard in _STANDARD_TABLES.items():
+        if np.array_equal(table, standard) or np.array_equal(natural_from_zigzag, standard):
+            return {"jpeg": True, "standard_table": True, "estimated_quality": quality}
+    # Нестандартная таблица: оцениваем качество по среднему шагу квантования
+    ratio = float(table.mean() / STD_LUMINANCE_TABLE.mean())
+    quality = int(np.clip(100 - ratio * 50 if ratio <= 1 else 5000 / (ratio * 100), 1, 100))
+    return {"jpeg": True, "standard_table": False, "estimated_quality": quality}
+
+
+def exif_consistency(image: Image.Image) -> Dict[str, Any]:
+    """Наличие и согласованность EXIF: камера, даты, ПО."""
+    exif = image.getexif()
+    sub_ifd = exif.get_ifd(TAG_EXIF_IFD) if exif else {}
+    make = str(exif.get(TAG_MAKE, "")).strip("\x00 ")
+    model = str(exif.get(TAG_MODEL, "")).strip("\x00 ")
+    software = str(exif.get(TAG_SOFTWARE, "")).strip("\x00 ")
+    modified = str(exif.get(TAG_DATETIME, "")).strip("\x00 ")
+    original = str(sub_ifd.get(TAG_DATETIME_ORIGINAL, "")).strip("\x00 ")
+    software_lower = software.lower()
+    return {
+        "has_exif": len(exif) > 0,
+        "camera": f"{make} {model}".strip() or None,
+        "software": software or None,
+        "has_original_datetime": bool(original),
+        "datetime_mismatch": bool(original and modified and original != modified),
+        "ai_software": any(marker in software_lower for marker in AI_SOFTWARE_MARKERS),
+        "editor_software": any(marker in software_lower for marker in EDITOR_SOFTWARE_MARKERS),
+    }
+
+
+def header_features(image: Image.Image) -> Dict[str, Any]:
+    """Признаки, которые есть уже после Image.open: формат, размеры, таблица квантования, EXIF."""
+    width, height = image.size
+    return {
+        "format": image.format,
+        "width": width,
+        "height": height,
+        **quantization_fingerprint(image),
+        **exif_consistency(image),
+    }
+
+
+def read_image_header(fp: BinaryIO) -> Dict[str, Any]:
+    """
+    Читает только заголовок изображения: Image.open не декодирует пиксели, а EXIF
+    и таблицы квантования JPEG лежат в начале файла. С RangedMediaReader это
+    один-два ranged GET вместо скачивания всего объекта.
+
+    Не изображение — PIL.UnidentifiedImageError.
+    """
+    with Image.open(fp) as image:
+        return header_features(image)
+
+
+def _block_view(arr: np.ndarray) -> np.ndarray:
+    """Режет 2D-массив на блоки BLOCK×BLOCK без копирования (хвосты отбрасываются)."""
+    h, w = arr.shape[0] // BLOCK * BLOCK, arr.shape[1] // BLOCK * BLOCK
+    return arr[:h, :w].reshape(h // BLOCK, BLOCK, w // BLOCK, BLOCK).swapaxes(1, 2)
+
+
+def error_level_analysis(rgb: Image.Image) -> Dict[str, float]:
+    """
+    ELA: пересохраняем в JPEG и смотрим на разницу. Вклеенные/перерисованные области
+    дают заметно другой уровень ошибки, чем остальное изображение.
+    """
+    buffer = io.BytesIO()
+    rgb.save(buffer, format="JPEG", quality=ELA_QUALITY)
+    buffer.seek(0)
+    # Разница и максимум по каналам — в C (ImageChops): max(axis=2) в NumPy по HxWx3
+    # uint8 в несколько раз дольше самого пересохранения
+    red, green, blue = ImageChops.difference(rgb, Image.open(buffer)).split()
+    diff = np.asarray(ImageChops.lighter(ImageChops.lighter(red, green), blue), dtype=np.float32)
+    blocks = _block_view(diff)
+    block_means = blocks.mean(axis=(2, 3)).ravel() if blocks.size else np.array([diff.mean()])
+    mean = float(diff.mean())
+    return {
+        "ela_mean": mean,
+        # Доля блоков, где ошибка сильно выше медианы — кандидаты в правки
+        "ela_outlier_ratio": float((block_means > np.median(block_means) * 3 + 2).mean()),
+        "ela_block_cv": float(block_means.std() / (block_means.mean() + 1e-6)),
+    }
+
+
+def noise_residuals(gray: np.ndarray) -> Dict[str, float]:
+    """
+    Остаток после 3×3 усреднения — высокочастотный шум. У фото с сенсора он есть
+    всегда и распределён довольно равномерно; у сгенерированных изображений он
+    слабее и «пятнистее».
+    """
+    padded = np.pad(gray, 1, mode="edge")
+    # Сепарабельный box-фильтр: 3 сдвига по строкам, затем 3 по столбцам
+    rows = padded[:, :-2] + padded[:, 1:-1] + padded[:, 2:]
+    smooth = (rows[:-2] + rows[1:-1] + rows[2:]) / 9.0
+    residual = gray - smooth
+    std = float(residual.std())
+    squared = np.square(residual - residual.mean())
+    kurtosis = float(np.mean(squared * squared) / (std ** 4 + 1e-9))
+    blocks = _block_view(residual)
+    block_std = blocks.std(axis=(2, 3)).ravel() if blocks.size else np.array([std])
+    return {
+        "noise_std": std,
+        "noise_kurtosis": kurtosis,
+        "noise_block_cv": float(block_std.std() / (block_std.mean() + 1e-6)),
+    }
+
+
+def analyze_forensics(image_bytes: bytes) -> Dict[str, Any]:
+    """
+    Локальный CPU-анализ изображения без внешних API.
+
+    :return: dict с признаками и итогом:
+      ai_likeliness (0–1), manipulation_risk (0–1), confidence (0–1 — насколько
+      уверенно можно обойтись без удалённых детекторов), forensic_score (0–1),
+      findings (строки для anomalies).
+    """
+    image = Image.open(io.BytesIO(image_bytes))
+    quant = quantization_fingerprint(image)
+    exif = exif_consistency(image)
+    image_format = image.format
+    original_side = max(image.size)
+
+    # JPEG сразу декодируем в уменьшенном масштабе (DCT scaling; draft выбирает масштаб
+    # 1/2…1/8, при котором обе стороны не меньше запрошенных). Остальные форматы декодируются
+    # целиком, поэтому до convert/exif_transpose (каждый — копия всего кадра) уменьшаем их
+    # reduce: усреднение блоков k×k в C за один проход
+    image.draft("RGB", (FORENSICS_MAX_SIDE // 2, FORENSICS_MAX_SIDE // 2))
+    if image_format != "JPEG" and image.mode in REDUCIBLE_MODES and original_side >= 2 * FORENSICS_MAX_SIDE:
+        # Множитель с округлением вверх: сторона сразу не больше FORENSICS_MAX_SIDE, thumbnail не нужен
+        image = image.reduce(-(-original_side // FORENSICS_MAX_SIDE))
+    rgb = ImageOps.exif_transpose(image).convert("RGB")
+    if max(rgb.size) > FORENSICS_MAX_SIDE:
+        rgb.thumbnail((FORENSICS_MAX_SIDE, FORENSICS_MAX_SIDE), resample=Image.BILINEAR, reducing_gap=2.0)
+    gray = np.asarray(rgb.convert("L"), dtype=np.float32)
+
+    features: Dict[str, Any] = {"format": image_format, **quant, **exif}
+    features.update(error_level_analysis(rgb))
+    features.update(noise_residuals(gray))
+    # Уменьшение в k раз усредняет шум сенсора примерно в k раз — приводим к исходному масштабу
+    features["noise_std"] *= original_side / max(rgb.size)
+
+    ai_evidence, camera_evidence, manipulation = 0.0, 0.0, 0.0
+    findings: List[str] = []
+
+    if exif["ai_software"]:
+        ai_evidence += 0.9
+        findings.append(f"EXIF software points to an AI generator: {exif['software']}")
+    if exif["camera"]:
+        camera_evidence += 0.35
+    if exif["has_original_datetime"]:
+        camera_evidence += 0.15
+    if quant["jpeg"] and quant["standard_table"] is False:
+        camera_evidence += 0.2
+    if not exif["has_exif"] and image_format in ("PNG", "WEBP"):
+        ai_evidence += 0.2
+        findings.append("No camera metadata in a lossless/web format")
+    if features["noise_std"] < 1.0:
+        ai_evidence += 0.25
+        findings.append("Unusually low sensor noise")
+    elif 1.5 <= features["noise_std"] <= 12.0 and features["noise_block_cv"] < 1.0:
+        camera_evidence += 0.15
+
+    if exif["editor_software"]:
+        manipulation += 0.4
+        findings.append(f"Edited with {exif['software']}")
+    if exif["datetime_mismatch"]:
+        manipulation += 0.2
+        findings.append("EXIF modification date differs from capture date")
+    if features["ela_outlier_ratio"] > 0.05:
+        manipulation += min(0.4, features["ela_outlier_ratio"] * 4)
+        findings.append("Inconsistent JPEG error levels across regions")
+
+    balance = ai_evidence - camera_evidence
+    features.update({
+        "ai_likeliness": float(np.clip(0.5 + 0.5 * balance, 0.0, 1.0)),
+        "manipulation_risk": float(np.clip(manipulation, 0.0, 1.0)),
+        "confidence": float(np.clip(abs(balance), 0.0, 1.0)),
+        "findings": findings,
+    })
+    # Ось для compute_image_trust_score: 1 — чистое фото с камеры
+    features["forensic_score"] = (1.0 - features["ai_likeliness"]) * (1.0 - features["manipulation_risk"])
+    return features
+
+
+def forensics_summary(result: Dict[str, Any]) -> str:
+    """Короткое объяснение, если решение принято только по локальной проверке."""
+    if result["ai_likeliness"] >= 0.5:
+        return "Local forensic checks indicate a likely AI-generated image: " + "; ".join(result["findings"])
+    camera = result.get("camera") or "unknown camera"
+    return f"Camera-original photo ({camera}) with consistent metadata and sensor noise; remote checks were skipped."
+
+
+def forensics_fallback(result: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Метрики в формате OpenAI Vision, построенные по локальной проверке."""
+    if result is None:
+        return None
+    return {
+        "ai_likeliness": result["ai_likeliness"],
+        "manipulation_risk": result["manipulation_risk"],
+        "realism": 1.0 - result["ai_likeliness"] * 0.5,
+        "anomalies": list(result["findings"]),
+        "summary": forensics_summary(result),
+    }
@@ -0,0 +1,182 @@
+# app/services/lexicon_matcher.py
+
+import logging
+import os
+import threading
+import time
+import unicodedata
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    import ahocorasick  # pyahocorasick: автомат на C, нужен для больших словарей и текстов
+except ImportError:  # без него работает автомат на чистом Python (медленнее, результат тот же)
+    ahocorasick = None
+
+logger = logging.getLogger(__name__)
+
+# Словари опасных выражений: по файлу на язык (en.txt, ru.txt, sk.txt), одна фраза на строку,
+# строки с # — комментарии. Файлы перечитываются на лету при изменении.
+LEXICON_DIR = os.getenv("LEXICON_DIR", os.path.join(os.path.dirname(__file__), "..", "..", "lexicon"))
+# Как часто проверять mtime файлов словаря, сек
+LEXICON_RELOAD_INTERVAL = float(os.getenv("LEXICON_RELOAD_INTERVAL", "30"))
+
+# Комбинирующие диакритики (U+0300–U+036F) после NFD: «zabiť» == «zabit», «ёж» == «еж»
+_STRIP_MARKS = {code: None for code in range(0x0300, 0x0370)}
+
+
+def normalize_text(text: str) -> str:
+    """
+    NFKC (совместимые формы: полноширинные буквы, лигатуры) + casefold + без диакритики.
+    Длина строки может измениться, поэтому совпадения отдаются в форме словаря.
+    """
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = unicodedata.normalize("NFD", text).translate(_STRIP_MARKS)
+    return " ".join(text.split())
+
+
+def _is_boundary(text: str, index: int) -> bool:
+    return index < 0 or index >= len(text) or not text[index].isalnum()
+
+
+class _PythonAutomaton:
+    """Aho–Corasick на словарях Python: тот же интерфейс, что нужен от pyahocorasick."""
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[int, str]]] = [[]]
+
+    def add_word(self, key: str, value: Tuple[int, str]) -> None:
+        node = 0
+        for char in key:
+            nxt = self._goto[node].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][char] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append(value)
+
+    def make_automaton(self) -> None:
+        # BFS: ссылка неудачи узла — самый длинный собственный суффикс, который есть в боре
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def iter(self, text: str):
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for end, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for value in out[node]:
+                yield end, value
+
+
+class LexiconMatcher:
+    """
+    Поиск всех фраз словаря в тексте за один линейный проход (Aho–Corasick).
+    Совпадения засчитываются только по границам слов.
+    """
+
+    def __init__(self, directory: str = LEXICON_DIR, reload_interval: float = LEXICON_RELOAD_INTERVAL):
+        self.directory = directory
+        self.reload_interval = reload_interval
+        self.phrases: List[str] = []
+        self._automaton = None
+        self._mtimes: Dict[str, float] = {}
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _lexicon_files(self) -> Dict[str, float]:
+        if not os.path.isdir(self.directory):
+            return {}
+        files = {}
+        for name in sorted(os.listdir(self.directory)):
+            if name.endswith(".txt"):
+                path = os.path.join(self.directory, name)
+                files[path] = os.path.getmtime(path)
+        return files
+
+    def build(self, phrases: Iterable[str]) -> None:
+        """Строит новый автомат и атомарно подменяет им текущий (поиск не блокируется)."""
+        automaton = ahocorasick.Automaton() if ahocorasick is not None else _PythonAutomaton()
+        display: List[str] = []
+        seen = set()
+        for phrase in phrases:
+            key = normalize_text(phrase)
+            if not key or key in seen:
+                continue
+            seen.add(key)
+            automaton.add_word(key, (len(key), phrase.strip()))
+            display.append(phrase.strip())
+        automaton.make_automaton()
+        self._automaton, self.phrases = automaton, display
+
+    def load(self) -> int:
+        """Перечитывает все файлы словаря. Возвращает число фраз."""
+        files = self._lexicon_files()
+        phrases: List[str] = []
+        for path in files:
+            with open(path, "r", encoding="utf-8") as f:
+                phrases.extend(line.strip() for line in f if line.strip() and not line.lstrip().startswith("#"))
+        started = time.perf_counter()
+        self.build(phrases)
+        self._mtimes = files
+        logger.info(
+            "Словарь опасных фраз: %d фраз из %d файлов (%.0f мс)",
+            len(self.phrases), len(files), (time.perf_counter() - started) * 1000,
+        )
+        return len(self.phrases)
+
+    def reload_if_changed(self, force: bool = False) -> bool:
+        now = time.monotonic()
+        if not force and self._automaton is not None and now - self._checked_at < self.reload_interval:
+            return False
+        with self._lock:
+            self._checked_at = now
+            if self._lexicon_files() == self._mtimes and self._automaton is not None:
+                return False
+            self.load()
+            return True
+
+    def find(self, text: str) -> List[str]:
+        """
+        Фразы словаря, встретившиеся в тексте (в форме словаря, без повторов,
+        в порядке первого появления).
+        """
+        self.reload_if_changed()
+        automaton = self._automaton
+        if automaton is None or not self.phrases:
+            return []
+        normalized = normalize_text(text)
+        found: Dict[str, None] = {}
+        for end, (length, phrase) in automaton.iter(normalized):
+            start = end - length + 1
+            if phrase not in found and _is_boundary(normalized, start - 1) and _is_boundary(normalized, end + 1):
+                found[phrase] = None
+        return list(found)
+
+
+def merge_phrases(primary: Iterable[str], extra: Optional[Iterable[str]]) -> List[str]:
+    """Объединяет списки фраз (от LLM и из словаря) без повторов с точностью до нормализации."""
+    merged: Dict[str, str] = {}
+    for phrase in list(primary) + list(extra or []):
+        key = normalize_text(phrase)
+        if key and key not in merged:
+            merged[key] = phrase
+    return list(merged.values())
+
+
+lexicon_matcher = LexiconMatcher()
@@ -0,0 +1,210 @@
+# app/services/media_cache.py
+
+import hashlib
+import mmap
+import os
+import tempfile
+import threading
+import time
+from typing import BinaryIO, Callable, Dict, List, Optional, Tuple
+
+# Каталог и лимит локального кеша скачанных из R2 объектов (0 — кеш выключен).
+# Лимит общий на каталог: воркеры с одним MEDIA_CACHE_DIR делят и объекты, и MEDIA_CACHE_MAX_MB
+MEDIA_CACHE_DIR = os.getenv("MEDIA_CACHE_DIR", os.path.join(tempfile.gettempdir(), "amkid-media-cache"))
+MEDIA_CACHE_MAX_BYTES = int(os.getenv("MEDIA_CACHE_MAX_MB", "1024")) * 1024 * 1024
+
+TMP_SUFFIX = ".tmp"
+# Временные файлы старше этого срока остались от оборванной записи (свежие может писать другой воркер)
+STALE_TMP_SECONDS = 3600
+
+
+def _map_file(path: str) -> memoryview:
+    """Отдаёт содержимое файла через mmap, без копирования в память процесса."""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return memoryview(b"")
+        # mmap остаётся валидным и после закрытия файла (и даже после его удаления)
+        return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+class DiskLRUCache:
+    """
+    Ограниченный по размеру дисковый кеш с вытеснением давно не читанных файлов.
+
+    - имя файла — SHA-256 ключа, поэтому любые S3-ключи безопасны для ФС;
+    - состояние хранится в самом каталоге, а не в памяти процесса: есть файл — попадание,
+      mtime — время последнего чтения. Поэтому воркеры с общим каталогом видят объекты,
+      скачанные друг другом, а max_bytes ограничивает каталог целиком, а не каждый процесс;
+    - вытеснение после каждой записи: сканируем каталог и удаляем файлы с самым старым mtime,
+      пока не уложимся в лимит (запись — это промах и скачивание из R2, на его фоне scandir незаметен);
+    - запись атомарная: данные пишутся во временный файл и переименовываются os.replace,
+      так что читатель никогда не увидит недокачанный объект;
+    - single-flight: параллельные запросы одного ключа в процессе ждут единственную загрузку
+      (разные воркеры в худшем случае скачают объект дважды и запишут одинаковые байты).
+
+    Инвалидации нет, поэтому класть сюда можно только неизменяемые ключи — по содержимому
+    (submissions/<sha256>); изменяемые uploads/ storage_service читает мимо кеша.
+    Счётчики hits/misses/bytes_saved — свои у каждого процесса.
+    """
+
+    def __init__(self, directory: str = MEDIA_CACHE_DIR, max_bytes: int = MEDIA_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, threading.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        if self.enabled:
+            os.makedirs(directory, exist_ok=True)
+            self._remove_stale_tmp()
+            self._evict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _name(self, key: str) -> str:
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _remove_stale_tmp(self) -> None:
+        deadline = time.time() - STALE_TMP_SECONDS
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.name.endswith(TMP_SUFFIX) and entry.stat().st_mtime < deadline:
+                    self._remove_file(entry.name)
+            except FileNotFoundError:
+                pass
+
+    def _scan(self) -> List[Tuple[int, str, int]]:
+        """(mtime_ns, имя, размер) готовых файлов каталога."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(TMP_SUFFIX):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue  # файл только что вытеснил другой процесс
+            if entry.is_file():
+                entries.append((stat.st_mtime_ns, entry.name, stat.st_size))
+        return entries
+
+    def _remove_file(self, name: str) -> None:
+        try:
+            os.remove(self._path(name))
+        except FileNotFoundError:
+            pass
+
+    def _touch(self, path: str) -> None:
+        # Явное время, а не «сейчас» ФС: у части ФС отметки времени грубее порядка чтений
+        now = time.time_ns()
+        try:
+            os.utime(path, ns=(now, now))
+        except FileNotFoundError:
+            pass  # уже вытеснен другим процессом; открытый mmap остаётся валидным
+
+    def _evict(self) -> None:
+        entries = self._scan()
+        total = sum(size for _, _, size in entries)
+        for _, name, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove_file(name)
+            total -= size
+
+    def _lookup(self, name: str) -> Optional[memoryview]:
+        path = self._path(name)
+        try:
+            view = _map_file(path)
+        except FileNotFoundError:
+            return None
+        self._touch(path)
+        with self._lock:
+            self.hits += 1
+            self.bytes_saved += len(view)
+        return view
+
+    def get(self, key: str) -> Optional[memoryview]:
+        if not self.enabled:
+            return None
+        return self._lookup(self._name(key))
+
+    def get_or_fetch(self, key: str, fetch: Callable[[BinaryIO], None]) -> memoryview:
+        """
+        Возвращает объект из кеша или скачивает его через fetch(file_obj).
+        Если кеш выключен, fetch пишет в память.
+        """
+        if not self.enabled:
+            with self._lock:
+                self.misses += 1
+            with tempfile.SpooledTemporaryFile() as buffer:
+                fetch(buffer)
+                buffer.seek(0)
+                return memoryview(buffer.read())
+
+        name = self._name(key)
+        view = self._lookup(name)
+        if view is not None:
+            return view
+
+        with self._lock:
+            flight = self._inflight.setdefault(name, threading.Lock())
+        with flight:
+            # Пока ждали, объект мог скачать другой поток
+            view = self._lookup(name)
+            if view is not None:
+                return view
+            with self._lock:
+                self.misses += 1
+            try:
+                return self._fill(name, fetch)
+            finally:
+                with self._lock:
+                    self._inflight.pop(name, None)
+
+    def _fill(self, name: str, fetch: Callable[[BinaryIO], None]) -> memoryview:
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=TMP_SUFFIX)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                fetch(f)
+            # mmap до переименования: файл может тут же вытеснить другой процесс
+            view = _map_file(tmp_path)
+            if len(view) > self.max_bytes:
+                # Объект больше всего кеша: отдаём, но не сохраняем
+                os.remove(tmp_path)
+                return view
+            self._touch(tmp_path)
+            os.replace(tmp_path, self._path(name))
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        self._evict()
+        return view
+
+    def discard(self, key: str) -> None:
+        """Удаляет объект из кеша (например, после удаления его из бакета)."""
+        if not self.enabled:
+            return
+        self._remove_file(self._name(key))
+
+    def stats(self) -> Dict[str, float]:
+        entries = self._scan() if self.enabled else []
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(entries),
+                "size_bytes": sum(size for _, _, size in entries),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "bytes_saved": self.bytes_saved,
+            }
@@ -0,0 +1,136 @@
+# app/services/media_keys.py
+
+import hashlib
+import math
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import BinaryIO, Callable, Optional, Tuple
+
+# Файлы до этого размера при хешировании держим в памяти, больше — во временном файле
+MEDIA_SPOOL_MAX_MEMORY = int(os.getenv("MEDIA_SPOOL_MAX_MEMORY_MB", "8")) * 1024 * 1024
+HASH_CHUNK_BYTES = 1024 * 1024
+
+# Размер локального индекса известных ключей
+KNOWN_KEYS_LRU_SIZE = int(os.getenv("KNOWN_KEYS_LRU_SIZE", "100000"))
+KNOWN_KEYS_BLOOM_CAPACITY = int(os.getenv("KNOWN_KEYS_BLOOM_CAPACITY", "1000000"))
+# Запись в LRU живёт меньше, чем orphan-объект ждёт удаления (MEDIA_ORPHAN_GRACE_SECONDS),
+# поэтому пропуск загрузки по LRU не может сослаться на уже удалённый объект.
+KNOWN_KEYS_TTL_SECONDS = float(os.getenv("KNOWN_KEYS_TTL_SECONDS", "3600"))
+
+
+# Префикс ключей по содержимому: байты под таким ключом никогда не меняются
+CONTENT_KEY_PREFIX = "submissions/"
+
+
+def media_key_for(sha256_hex: str, original_filename: str) -> str:
+    """Ключ по содержимому: одинаковые файлы получают один и тот же ключ."""
+    file_extension = os.path.splitext(original_filename)[1].lower()
+    return f"{CONTENT_KEY_PREFIX}{sha256_hex}{file_extension}"
+
+
+def is_content_key(s3_key: str) -> bool:
+    """Неизменяемый ключ по содержимому (его можно кешировать без инвалидации)."""
+    return s3_key.startswith(CONTENT_KEY_PREFIX)
+
+
+def hash_and_spool(file_stream: BinaryIO) -> Tuple[str, BinaryIO, int]:
+    """
+    За один проход считает SHA-256 потока и копирует его в SpooledTemporaryFile,
+    чтобы потом загрузить те же байты, не читая исходный поток повторно.
+
+    :return: (hex-дайджест, буфер с данными на позиции 0, размер в байтах)
+    """
+    digest = hashlib.sha256()
+    spool = tempfile.SpooledTemporaryFile(max_size=MEDIA_SPOOL_MAX_MEMORY)
+    size = 0
+    while True:
+        chunk = file_stream.read(HASH_CHUNK_BYTES)
+        if not chunk:
+            break
+        digest.update(chunk)
+        spool.write(chunk)
+        size += len(chunk)
+    spool.seek(0)
+    return digest.hexdigest(), spool, size
+
+
+class BloomFilter:
+    """
+    Простой Bloom-фильтр на bytearray. Позиции берутся из SHA-256 ключа
+    (double hashing), поэтому дополнительных зависимостей не нужно.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        # Классические формулы: m = -n*ln(p)/ln(2)^2, k = m/n*ln(2)
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self._bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, item: str):
+        h = hashlib.sha256(item.encode("utf-8")).digest()
+        h1 = int.from_bytes(h[:8], "little")
+        h2 = int.from_bytes(h[8:16], "little") | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, item: str) -> None:
+        for pos in self._positions(item):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+class KnownMediaKeys:
+    """
+    Локальный индекс ключей, которые уже точно лежат в бакете.
+
+    - LRU (с TTL): попадание — объект есть, загрузку и HEAD можно пропустить;
+    - Bloom-фильтр: помнит все когда-либо виденные ключи. «Нет» — ключ точно новый
+      для этого процесса, «возможно» — нужно подтвердить HEAD-запросом.
+    """
+
+    def __init__(
+        self,
+        lru_size: int = KNOWN_KEYS_LRU_SIZE,
+        bloom_capacity: int = KNOWN_KEYS_BLOOM_CAPACITY,
+        ttl_seconds: float = KNOWN_KEYS_TTL_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.lru_size = lru_size
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._lru: "OrderedDict[str, float]" = OrderedDict()
+        self._bloom = BloomFilter(bloom_capacity)
+        self._lock = threading.Lock()
+
+    def remember(self, key: str) -> None:
+        with self._lock:
+            self._bloom.add(key)
+            self._lru.pop(key, None)
+            self._lru[key] = self._clock()
+            while len(self._lru) > self.lru_size:
+                self._lru.popitem(last=False)
+
+    def forget(self, key: str) -> None:
+        """Убирает ключ из LRU (Bloom не умеет удалять — он лишь вызовет лишний HEAD)."""
+        with self._lock:
+            self._lru.pop(key, None)
+
+    def is_known(self, key: str) -> bool:
+        with self._lock:
+            seen_at: Optional[float] = self._lru.get(key)
+            if seen_at is None:
+                return False
+            if self._clock() - seen_at > self.ttl_seconds:
+                self._lru.pop(key, None)
+                return False
+            self._lru.move_to_end(key)
+            return True
+
+    def maybe_known(self, key: str) -> bool:
+        with self._lock:
+            return key in self._bloom
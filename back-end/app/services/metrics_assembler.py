@@ -1,8 +1,325 @@
 # app/services/ai_service.py
 
-from typing import Dict, Any, List, Optional
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Dict, Any, Callable, Iterable, List, Optional, Tuple
 from app.models.database_ops import create_trust_score, Submission # Предполагаем, что этот импорт нужен
 
+# Сколько детекторов одного прогона может работать одновременно (пул потоков — на каждый прогон)
+DETECTOR_MAX_WORKERS = int(os.getenv("DETECTOR_MAX_WORKERS", "8"))
+# Как часто проверять, стартовал ли детектор, ждущий свободного потока, сек
+DETECTOR_START_POLL = 0.01
+# Таймаут детектора по умолчанию, сек
+DETECTOR_DEFAULT_TIMEOUT = float(os.getenv("DETECTOR_DEFAULT_TIMEOUT", "30"))
+
+
+# =====================================================================
+#                       Конвейер детекторов
+# =====================================================================
+
+class Detector:
+    """
+    Один детектор-плагин.
+
+    :param name: Имя; под ним результат попадает в контекст и в ai_metadata.
+    :param func: Функция, получающая входы keyword-аргументами (func(text=..., openai_text=...)).
+    :param inputs: Имена входов: ключи исходного контекста или имена других детекторов.
+    :param timeout: Сколько ждать результат, сек.
+    :param weight: Вес в взвешенном среднем (PipelineRun.weighted); 0 — не участвует.
+    :param skip_if: Предикат над теми же входами; True — детектор не запускается
+        (статус skipped, потребители получают None). Например, дорогой удалённый
+        детектор пропускается, если локальный уже уверен.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable[..., Any],
+        inputs: Iterable[str] = (),
+        timeout: float = DETECTOR_DEFAULT_TIMEOUT,
+        weight: float = 0.0,
+        skip_if: Optional[Callable[..., bool]] = None,
+    ):
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.timeout = timeout
+        self.weight = weight
+        self.skip_if = skip_if
+
+
+def reported_usage(result: Any) -> Optional[Dict[str, Any]]:
+    """
+    usage платного вызова из результата детектора: dict-значение с ключом "usage"
+    или исключение с атрибутом usage (ответ получен и оплачен, но не разобран).
+    """
+    usage = result.get("usage") if isinstance(result, dict) else getattr(result, "usage", None)
+    return usage if isinstance(usage, dict) else None
+
+
+class DetectorOutcome:
+    """
+    Результат одного детектора: статус, значение и время работы.
+    usage — токены платного вызова, в том числе упавшего после ответа модели.
+    abandoned — future детектора, брошенного по таймауту (см. PipelineRun.on_late_usage).
+    """
+
+    def __init__(
+        self,
+        status: str,
+        value: Any = None,
+        elapsed_ms: float = 0.0,
+        error: Optional[BaseException] = None,
+        usage: Optional[Dict[str, Any]] = None,
+        abandoned: Optional[Future] = None,
+    ):
+        self.status = status  # ok | error | timeout | skipped
+        self.value = value
+        self.elapsed_ms = elapsed_ms
+        self.error = error
+        self.usage = usage
+        self.abandoned = abandoned
+
+    @property
+    def ok(self) -> bool:
+        return self.status == "ok"
+
+
+def _metadata_value(value: Any) -> Any:
+    """В JSONB кладём только то, что туда сериализуется как есть."""
+    if value is None or isinstance(value, (bool, int, float, str, list, dict)):
+        return value
+    return repr(value)
+
+
+class PipelineRun:
+    """Результаты одного прогона конвейера."""
+
+    def __init__(self, detectors: Dict[str, Detector], outcomes: Dict[str, DetectorOutcome], elapsed_ms: float):
+        self.detectors = detectors
+        self.outcomes = outcomes
+        self.elapsed_ms = elapsed_ms
+
+    def value(self, name: str) -> Any:
+        outcome = self.outcomes.get(name)
+        return outcome.value if outcome is not None and outcome.ok else None
+
+    def weighted(self, key: str) -> Optional[float]:
+        """
+        Взвешенное среднее метрики key по успешным детекторам с weight > 0.
+        Детектор может вернуть число или dict с этим ключом; None не учитывается.
+        """
+        total = weight_sum = 0.0
+        for name, outcome in self.outcomes.items():
+            weight = self.detectors[name].weight
+            if not outcome.ok or weight <= 0:
+                continue
+            value = outcome.value.get(key) if isinstance(outcome.value, dict) else outcome.value
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            total += weight * float(value)
+            weight_sum += weight
+        return total / weight_sum if weight_sum else None
+
+    @property
+    def has_abandoned(self) -> bool:
+        return any(outcome.abandoned is not None for outcome in self.outcomes.values())
+
+    def on_late_usage(self, callback: Callable[[str, Dict[str, Any]], None]) -> None:
+        """
+        callback(имя детектора, usage) для детекторов, брошенных по таймауту: их вызов
+        продолжается в своём потоке и, если всё же получит (оплаченный) ответ, сообщит usage.
+        """
+        def report(name: str, future: Future) -> None:
+            if future.cancelled():
+                return
+            _, result, _ = future.result()
+            usage = reported_usage(result)
+            if usage is not None:
+                callback(name, usage)
+
+        for name, outcome in self.outcomes.items():
+            if outcome.abandoned is not None:
+                outcome.abandoned.add_done_callback(lambda future, name=name: report(name, future))
+
+    def as_metadata(self) -> Dict[str, Any]:
+        """Результат и тайминг каждого детектора — для ai_metadata."""
+        detectors: Dict[str, Any] = {}
+        for name, outcome in self.outcomes.items():
+            entry = {
+                "status": outcome.status,
+                "elapsed_ms": round(outcome.elapsed_ms, 1),
+                "weight": self.detectors[name].weight,
+                "value": _metadata_value(outcome.value),
+            }
+            if outcome.error is not None:
+                entry["error"] = f"{type(outcome.error).__name__}: {outcome.error}"
+            detectors[name] = entry
+        return {"elapsed_ms": round(self.elapsed_ms, 1), "detectors": detectors}
+
+
+def _call_detector(detector: Detector, kwargs: Dict[str, Any], starts: Dict[str, float]) -> Tuple[str, Any, float]:
+    # Таймаут отсчитывается отсюда, а не от submit: ожидание свободного потока в него не входит
+    starts[detector.name] = time.monotonic()
+    started = time.perf_counter()
+    try:
+        value = detector.func(**kwargs)
+        return "ok", value, (time.perf_counter() - started) * 1000
+    except Exception as e:
+        return "error", e, (time.perf_counter() - started) * 1000
+
+
+class DetectorPipeline:
+    """
+    Небольшой DAG детекторов. Независимые детекторы работают параллельно в пуле потоков,
+    детектор с входом от другого детектора стартует, когда тот завершился.
+
+    Упавший или не уложившийся в таймаут детектор даёт None своим потребителям,
+    а не роняет весь конвейер. Поток с зависшим детектором не прерывается
+    (Python этого не умеет) — его результат просто больше не ждут.
+
+    Пул потоков создаётся на каждый прогон: общий пул на процесс ставил детекторы
+    параллельных запросов в одну очередь, и под нагрузкой они выбывали по таймауту,
+    ещё не начав работу.
+    """
+
+    def __init__(self, name: str, max_workers: int = DETECTOR_MAX_WORKERS):
+        self.name = name
+        self.detectors: Dict[str, Detector] = {}
+        self.max_workers = max_workers
+
+    def add(self, detector: Detector) -> Detector:
+        if detector.name in self.detectors:
+            raise ValueError(f"Detector '{detector.name}' is already registered in '{self.name}'")
+        self.detectors[detector.name] = detector
+        return detector
+
+    def register(
+        self,
+        name: str,
+        inputs: Iterable[str] = (),
+        timeout: float = DETECTOR_DEFAULT_TIMEOUT,
+        weight: float = 0.0,
+        skip_if: Optional[Callable[..., bool]] = None,
+    ):
+        """Декоратор: регистрирует функцию как детектор."""
+        def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
+            self.add(Detector(name, func, inputs=inputs, timeout=timeout, weight=weight, skip_if=skip_if))
+            return func
+        return decorator
+
+    def _check_graph(self, context: Dict[str, Any]) -> None:
+        """Все входы известны и в графе нет циклов."""
+        for detector in self.detectors.values():
+            for dep in detector.inputs:
+                if dep not in self.detectors and dep not in context:
+                    raise ValueError(f"Detector '{detector.name}' needs unknown input '{dep}'")
+        visiting, done = set(), set()
+
+        def visit(name: str) -> None:
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Detector graph '{self.name}' has a cycle through '{name}'")
+            visiting.add(name)
+            for dep in self.detectors[name].inputs:
+                if dep in self.detectors:
+                    visit(dep)
+            visiting.discard(name)
+            done.add(name)
+
+        for name in self.detectors:
+            visit(name)
+
+    def run(self, context: Dict[str, Any]) -> PipelineRun:
+        """
+        Прогоняет все детекторы над исходным контекстом (например, {"text": ...}).
+        """
+        self._check_graph(context)
+        started = time.perf_counter()
+        values: Dict[str, Any] = dict(context)
+        outcomes: Dict[str, DetectorOutcome] = {}
+        pending = dict(self.detectors)
+        running: Dict[Future, Detector] = {}
+        # Момент старта каждого детектора (пишет поток пула, см. _call_detector)
+        starts: Dict[str, float] = {}
+        workers = max(1, min(self.max_workers, len(self.detectors)))
+        # Потоки, занятые детекторами, которых уже не ждём (таймаут): они не освободятся
+        abandoned = 0
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"detector-{self.name}")
+
+        def give_up(future: Future, detector: Detector, reason: str) -> None:
+            future.cancel()
+            running.pop(future)
+            print(f"Warning: detector '{detector.name}' {reason}")
+            outcomes[detector.name] = DetectorOutcome(
+                "timeout", None, detector.timeout * 1000,
+                error=TimeoutError(f"no result in {detector.timeout}s"),
+                abandoned=future,
+            )
+            values[detector.name] = None
+
+        try:
+            while pending or running:
+                # Запускаем всё, чьи входы уже готовы (пропуск детектора может сразу
+                # освободить его потребителей, поэтому проходим, пока есть изменения)
+                scheduled = True
+                while scheduled:
+                    scheduled = False
+                    for name, detector in list(pending.items()):
+                        if not all(dep in outcomes or dep not in self.detectors for dep in detector.inputs):
+                            continue
+                        scheduled = True
+                        del pending[name]
+                        kwargs = {dep: values.get(dep) for dep in detector.inputs}
+                        if detector.skip_if is not None and detector.skip_if(**kwargs):
+                            outcomes[detector.name] = DetectorOutcome("skipped")
+                            values[detector.name] = None
+                            continue
+                        running[executor.submit(_call_detector, detector, kwargs, starts)] = detector
+
+                if not running:
+                    break
+                deadlines = [starts[d.name] + d.timeout for d in running.values() if d.name in starts]
+                waiting_for_thread = len(deadlines) < len(running)
+                timeout = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+                if waiting_for_thread:
+                    # Детектор в очереди пула получит дедлайн, когда стартует
+                    timeout = DETECTOR_START_POLL if timeout is None else min(timeout, DETECTOR_START_POLL)
+                done, _ = wait(list(running), timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    detector = running.pop(future)
+                    status, value, elapsed_ms = future.result()
+                    if status == "ok":
+                        outcomes[detector.name] = DetectorOutcome("ok", value, elapsed_ms, usage=reported_usage(value))
+                        values[detector.name] = value
+                    else:
+                        print(f"Warning: detector '{detector.name}' failed: {value}")
+                        outcomes[detector.name] = DetectorOutcome(
+                            "error", None, elapsed_ms, error=value, usage=reported_usage(value)
+                        )
+                        values[detector.name] = None
+                now = time.monotonic()
+                for future, detector in list(running.items()):
+                    start = starts.get(detector.name)
+                    if start is not None and start + detector.timeout <= now:
+                        give_up(future, detector, f"timed out after {detector.timeout}s")
+                        abandoned += 1
+                    elif start is None and abandoned >= workers:
+                        # Все потоки заняты зависшими детекторами — этот не стартует никогда
+                        give_up(future, detector, "got no free worker (all are stuck in timed-out detectors)")
+        finally:
+            # Не ждём зависшие потоки: они завершатся сами, их результат уже не нужен
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        return PipelineRun(self.detectors, outcomes, (time.perf_counter() - started) * 1000)
+
+
+# =====================================================================
+#                       Сборка TrustScore
+# =====================================================================
+
 class TrustScoreAssembler:
     """
     Сервис для централизованной сборки всех метрик контента 
@@ -31,6 +348,10 @@ class TrustScoreAssembler:
         else:
             print(f"Warning: Skipping empty or invalid data for metric '{metric_name}'")
 
+    def add_pipeline_run(self, run: PipelineRun):
+        """Сохраняет результаты и тайминги всех детекторов конвейера под ключом 'pipeline'."""
+        self._metrics["pipeline"] = run.as_metadata()
+
     def set_overall_score(self, verdict: str, probability: float):
         """Устанавливает основной вердикт и вероятность."""
         self._verdict = verdict
@@ -38,7 +359,7 @@ class TrustScoreAssembler:
 
     def assemble(self) -> Dict[str, Any]:
         """
-        Возвращает финальный словарь metrics_data, готовый для сохранения в JSONB.
+        Возвращает финальный словарь ai_metadata, готовый для сохранения в JSONB.
         """
         return self._metrics
     
@@ -54,7 +375,7 @@ class TrustScoreAssembler:
             submission_id=self.submission.id,
             verdict=self._verdict,
             fake_probability=self._fake_probability,
-            metrics_data=self._metrics
+            ai_metadata=self._metrics
         )
         print(f"✅ TrustScore для заявки {self.submission.id} сохранен.")
 
@@ -0,0 +1,67 @@
+# app/services/onnx_text_model.py
+
+import json
+from typing import Any, List, Sequence
+
+import numpy as np
+
+# Токенизатор onnxruntime работает на RE2, где \w — только ASCII. Этот шаблон
+# повторяет (?u)\b\w\w+\b из sklearn для любых алфавитов (кириллица и т.д.).
+ONNX_TOKEN_PATTERN = r"[\p{L}\p{M}\p{N}_]{2,}"
+# Локаль StringNormalizer; регистр мы всё равно понижаем в Python до вызова модели
+ONNX_LOCALE = "C.UTF-8"
+ONNX_TARGET_OPSET = 17
+INPUT_NAME = "input"
+
+
+def export_to_onnx(pipeline: Any, path: str) -> None:
+    """
+    Конвертирует обученный Pipeline(TfidfVectorizer, линейный классификатор) в ONNX.
+    Имена классов сохраняются в метаданных модели ("classes").
+    """
+    from skl2onnx import convert_sklearn
+    from skl2onnx.common.data_types import StringTensorType
+
+    vectorizer = pipeline.steps[0][1]
+    classifier = pipeline.steps[-1][1]
+    onnx_model = convert_sklearn(
+        pipeline,
+        initial_types=[(INPUT_NAME, StringTensorType([None, 1]))],
+        options={
+            id(vectorizer): {"tokenexp": ONNX_TOKEN_PATTERN, "locale": ONNX_LOCALE},
+            id(classifier): {"zipmap": False},
+        },
+        target_opset=ONNX_TARGET_OPSET,
+    )
+    meta = onnx_model.metadata_props.add()
+    meta.key = "classes"
+    meta.value = json.dumps([str(c) for c in classifier.classes_], ensure_ascii=False)
+    with open(path, "wb") as f:
+        f.write(onnx_model.SerializeToString())
+
+
+class OnnxTextModel:
+    """
+    Тот же интерфейс, что у sklearn-пайплайна (classes_, predict_proba, predict),
+    но инференс идёт в onnxruntime на CPU: без Python-оверхеда на шаги пайплайна
+    и без распаковки pickle при старте.
+    """
+
+    def __init__(self, path: str, intra_op_threads: int = 1):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        # Параллелизм даёт батчинг и воркеры; внутри одного вызова хватит одного потока
+        options.intra_op_num_threads = intra_op_threads
+        self.session = ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+        meta = self.session.get_modelmeta().custom_metadata_map
+        self.classes_ = np.array(json.loads(meta["classes"]))
+        self._probabilities_output = self.session.get_outputs()[1].name
+
+    def predict_proba(self, texts: Sequence[str]) -> np.ndarray:
+        batch = np.array([text.lower() for text in texts], dtype=object).reshape(-1, 1)
+        (probabilities,) = self.session.run([self._probabilities_output], {INPUT_NAME: batch})
+        return probabilities
+
+    def predict(self, texts: Sequence[str]) -> List[str]:
+        return list(self.classes_[self.predict_proba(texts).argmax(axis=1)])
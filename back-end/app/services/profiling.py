@@ -0,0 +1,282 @@
+# app/services/profiling.py
+
+import asyncio
+import hmac
+import json
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+# Профилирование выключено по умолчанию: тогда middleware даже не подключается (ноль накладных расходов)
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+# Доля запросов, профилируемых без заголовка (0.01 = 1%)
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# Период сэмплирования стеков, мс
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+# tracemalloc заметно замедляет аллокации — только для профилируемого запроса, и его можно выключить
+PROFILE_TRACEMALLOC = os.getenv("PROFILE_TRACEMALLOC", "1") == "1"
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join("/tmp", "amkid-profiles"))
+# Сколько последних профилей хранить на диске
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+PROFILE_TOP_ALLOCATIONS = 30
+
+# Заголовок, которым админ просит профиль конкретного запроса (вместе с X-Admin-Token)
+PROFILE_HEADER = b"x-profile"
+ADMIN_HEADER = b"x-admin-token"
+
+# Листовые функции простаивающих потоков: такие стеки в профиль не попадают
+IDLE_LEAVES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+    ("_asyncio.py", "run"),
+}
+
+
+def _frame_label(code) -> str:
+    # Первая строка функции, а не текущая — иначе один вызов дробится на много стеков
+    path = code.co_filename.replace("\\", "/")
+    short = "/".join(path.rsplit("/", 2)[-2:])
+    return f"{code.co_name} ({short}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """
+    Сэмплирующий профайлер: фоновый поток раз в interval снимает стеки всех потоков
+    (sys._current_frames) и считает одинаковые стеки. Код запроса не инструментируется,
+    поэтому накладные расходы — только сам опрос, ~десятки мкс на снимок.
+    Результат — collapsed stacks (формат flamegraph.pl / speedscope): "поток;f1;f2 N".
+    Снимаются все потоки процесса: параллельные запросы тоже попадут в профиль.
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL_MS / 1000):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            if len(names) != len(frames):
+                names = {t.ident: t.name for t in threading.enumerate()}
+            self.samples += 1
+            for ident, frame in frames.items():
+                if ident == own:
+                    continue
+                leaf = frame.f_code
+                if (os.path.basename(leaf.co_filename), leaf.co_name) in IDLE_LEAVES:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+
+
+class RequestProfiler:
+    """Стек-сэмплер + (опционально) tracemalloc на время одного запроса."""
+
+    # Профилируется не больше одного запроса за раз: tracemalloc глобален для процесса
+    _busy = threading.Lock()
+
+    def __init__(self, trace_allocations: bool = PROFILE_TRACEMALLOC):
+        self.sampler = StackSampler()
+        self.trace_allocations = trace_allocations
+        self._started_tracemalloc = False
+        self._started = 0.0
+
+    @classmethod
+    def try_start(cls, trace_allocations: bool = PROFILE_TRACEMALLOC) -> Optional["RequestProfiler"]:
+        """Профайлер или None, если уже профилируется другой запрос."""
+        if not cls._busy.acquire(blocking=False):
+            return None
+        profiler = cls(trace_allocations)
+        if trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            profiler._started_tracemalloc = True
+        profiler._started = time.perf_counter()
+        profiler.sampler.start()
+        return profiler
+
+    def stop(self) -> Dict[str, Any]:
+        try:
+            self.sampler.stop()
+            duration_ms = (time.perf_counter() - self._started) * 1000
+            allocations: List[Dict[str, Any]] = []
+            peak = None
+            if self.trace_allocations and tracemalloc.is_tracing():
+                snapshot = tracemalloc.take_snapshot().filter_traces((
+                    tracemalloc.Filter(False, tracemalloc.__file__),
+                    tracemalloc.Filter(False, __file__),
+                ))
+                peak = tracemalloc.get_traced_memory()[1]
+                for stat in snapshot.statistics("lineno")[:PROFILE_TOP_ALLOCATIONS]:
+                    frame = stat.traceback[0]
+                    allocations.append({"where": f"{frame.filename}:{frame.lineno}", "size": stat.size, "count": stat.count})
+                if self._started_tracemalloc:
+                    tracemalloc.stop()
+        finally:
+            RequestProfiler._busy.release()
+        return {
+            "duration_ms": round(duration_ms, 1),
+            "interval_ms": self.sampler.interval * 1000,
+            "samples": self.sampler.samples,
+            "stacks": dict(self.sampler.stacks.most_common()),
+            "allocations": allocations,
+            "peak_traced_bytes": peak,
+        }
+
+
+class ProfileStore:
+    """Профили — JSON-файлы в каталоге (общем для всех воркеров uvicorn), хранятся последние keep."""
+
+    def __init__(self, directory: str = PROFILE_DIR, keep: int = PROFILE_KEEP):
+        self.directory = directory
+        self.keep = keep
+
+    def _path(self, profile_id: str) -> str:
+        return os.path.join(self.directory, f"{profile_id}.json")
+
+    def save(self, profile: Dict[str, Any]) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = self._path(profile["id"]) + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(profile, f, ensure_ascii=False)
+        os.replace(tmp, self._path(profile["id"]))
+        self._prune()
+
+    def _files(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                path = os.path.join(self.directory, name)
+                try:
+                    files.append((os.path.getmtime(path), path))
+                except FileNotFoundError:  # удалён другим воркером
+                    continue
+        return [path for _, path in sorted(files, reverse=True)]
+
+    def _prune(self) -> None:
+        for path in self._files()[self.keep:]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def list(self) -> List[Dict[str, Any]]:
+        """Краткие сведения о профилях, новые сверху (без стеков и аллокаций)."""
+        items = []
+        for path in self._files():
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    profile = json.load(f)
+            except (OSError, ValueError):
+                continue
+            items.append({k: v for k, v in profile.items() if k not in ("stacks", "allocations")})
+        return items
+
+    def get(self, profile_id: str) -> Optional[Dict[str, Any]]:
+        # id — hex uuid4; всё прочее (в т.ч. "../") отбрасываем, не трогая файловую систему
+        if len(profile_id) != 32 or any(c not in "0123456789abcdef" for c in profile_id):
+            return None
+        try:
+            with open(self._path(profile_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+
+def collapsed_stacks(profile: Dict[str, Any]) -> str:
+    """Стеки профиля в формате collapsed (flamegraph.pl, speedscope, inferno)."""
+    return "".join(f"{stack} {count}\n" for stack, count in profile["stacks"].items())
+
+
+profile_store = ProfileStore()
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware: профилирует запрос, если пришёл X-Profile: 1 с верным X-Admin-Token,
+    или случайно с вероятностью sample_rate. Id профиля — в заголовке ответа X-Profile-Id.
+    Подключается только при PROFILING_ENABLED=1.
+    """
+
+    def __init__(
+        self,
+        app,
+        admin_token: Optional[str] = None,
+        sample_rate: float = PROFILE_SAMPLE_RATE,
+        store: ProfileStore = profile_store,
+    ):
+        self.app = app
+        # Сравниваем байты: compare_digest на str падает с TypeError для не-ASCII символов
+        self.admin_token = admin_token.encode("utf-8") if admin_token else None
+        self.sample_rate = sample_rate
+        self.store = store
+
+    def _requested(self, scope) -> bool:
+        if self.admin_token:
+            headers = dict(scope["headers"])
+            if headers.get(PROFILE_HEADER) == b"1":
+                if hmac.compare_digest(headers.get(ADMIN_HEADER, b""), self.admin_token):
+                    return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._requested(scope):
+            await self.app(scope, receive, send)
+            return
+        profiler = RequestProfiler.try_start()
+        if profiler is None:
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = uuid.uuid4().hex
+        status = 500
+
+        async def send_with_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message = {**message, "headers": [*message.get("headers", []), (b"x-profile-id", profile_id.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            # Снимок tracemalloc и запись на диск — десятки миллисекунд, не в цикле событий
+            result = await asyncio.to_thread(profiler.stop)
+            route = scope.get("route")
+            await asyncio.to_thread(self.store.save, {
+                "id": profile_id,
+                "created_at": time.time(),
+                "method": scope["method"],
+                "path": scope["path"],
+                "route": getattr(route, "path", None),
+                "status": status,
+                **result,
+            })
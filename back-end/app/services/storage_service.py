@@ -1,11 +1,25 @@
+import hashlib
+import io
 import os
 import uuid
-from typing import BinaryIO
-import boto3
-from dotenv import load_dotenv
+from datetime import datetime, timedelta, timezone
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+from botocore.exceptions import ClientError
+from sqlalchemy.orm import Session
+
+from app.core.container import LazyService, load_env
+from app.models.database_ops import (
+    SessionLocal,
+    acquire_media_ref,
+    claim_orphaned_media,
+    forget_media_objects,
+    release_media_ref,
+)
+from app.services.media_cache import DiskLRUCache
+from app.services.media_keys import CONTENT_KEY_PREFIX, KnownMediaKeys, hash_and_spool, is_content_key, media_key_for
 
 # Загрузка переменных окружения из .env
-load_dotenv()
+load_env()
 
 # --- КОНФИГУРАЦИЯ R2 ---
 R2_ENDPOINT_URL = os.getenv("R2_ENDPOINT_URL")
@@ -13,45 +27,178 @@ R2_ACCESS_KEY_ID = os.getenv("R2_ACCESS_KEY_ID")
 R2_SECRET_APPLICATION_KEY = os.getenv("R2_SECRET_APPLICATION_KEY")
 R2_BUCKET_NAME = os.getenv("R2_BUCKET_NAME")
 
-s3_client = None 
+# --- ПАРАМЕТРЫ ЗАГРУЗКИ (общие для sync и async путей) ---
+# Размер части multipart-загрузки; файлы меньше одной части уходят одним PUT
+R2_MULTIPART_CHUNK_BYTES = int(os.getenv("R2_MULTIPART_CHUNK_MB", "8")) * 1024 * 1024
+# Сколько частей одного файла грузится параллельно
+R2_PART_CONCURRENCY = int(os.getenv("R2_PART_CONCURRENCY", "4"))
+# Сколько загрузок одновременно (на процесс) — чтобы не съесть память и канал
+R2_MAX_CONCURRENT_UPLOADS = int(os.getenv("R2_MAX_CONCURRENT_UPLOADS", "8"))
+# Повторы с экспоненциальной задержкой при сетевых ошибках
+R2_UPLOAD_MAX_ATTEMPTS = int(os.getenv("R2_UPLOAD_MAX_ATTEMPTS", "4"))
+R2_UPLOAD_BACKOFF_BASE = float(os.getenv("R2_UPLOAD_BACKOFF_BASE", "0.2"))
+
+# --- ДЕДУПЛИКАЦИЯ ---
+# Файлы от этого размера проверяются HEAD-запросом, даже если Bloom-фильтр их не видел
+# (их мог загрузить другой воркер, а лишний HEAD дешевле повторной передачи)
+R2_HEAD_CHECK_MIN_BYTES = int(os.getenv("R2_HEAD_CHECK_MIN_KB", "256")) * 1024
+# Сколько объект с ref_count = 0 ждёт удаления (должно быть больше KNOWN_KEYS_TTL_SECONDS)
+MEDIA_ORPHAN_GRACE_SECONDS = int(os.getenv("MEDIA_ORPHAN_GRACE_SECONDS", str(24 * 3600)))
+
+# --- ПРЯМАЯ ЗАГРУЗКА КЛИЕНТОМ (presigned PUT) ---
+# Клиент грузит файл сразу в бакет, минуя API; сюда попадают только такие объекты
+DIRECT_UPLOAD_PREFIX = "uploads/"
+PRESIGNED_URL_EXPIRES_SECONDS = int(os.getenv("PRESIGNED_URL_EXPIRES_SECONDS", "900"))
+# Presigned PUT не ограничивает размер, поэтому проверяем его HEAD-запросом перед анализом
+DIRECT_UPLOAD_MAX_BYTES = int(os.getenv("DIRECT_UPLOAD_MAX_MB", "25")) * 1024 * 1024
+# Объекты в uploads/ старше этого срока брошены (загружены, но не отданы на анализ) и удаляются
+DIRECT_UPLOAD_TTL_SECONDS = int(os.getenv("DIRECT_UPLOAD_TTL_SECONDS", "3600"))
+# Период фоновой уборки бакета (брошенные загрузки и т.п.), сек
+MEDIA_MAINTENANCE_INTERVAL_SECONDS = int(os.getenv("MEDIA_MAINTENANCE_INTERVAL_SECONDS", "600"))
+
+# Изображения из /analyze-image тоже сохраняются в R2 (async-загрузкой) и привязываются
+# к записи истории, как и загруженные напрямую; без бакета — только анализ
+ANALYZE_IMAGE_STORE_MEDIA = os.getenv("ANALYZE_IMAGE_STORE_MEDIA", "1") == "1" and bool(R2_BUCKET_NAME)
+
+# --- ЧАСТИЧНОЕ ЧТЕНИЕ ---
+# Минимальный размер ranged-запроса: мелкие read() из RangedMediaReader добираются
+# блоками, а не отдельным GET на каждый (заголовок и EXIF JPEG обычно целиком в первом блоке)
+MEDIA_RANGE_BLOCK_BYTES = int(os.getenv("MEDIA_RANGE_BLOCK_KB", "64")) * 1024
+# Сколько первых байт достаточно, чтобы определить формат изображения
+MEDIA_SNIFF_BYTES = 32
+
+known_media_keys = KnownMediaKeys()
+
+# Локальный дисковый кеш скачанных объектов (MEDIA_CACHE_DIR, MEDIA_CACHE_MAX_MB).
+# Конструктор сканирует каталог кеша (вытеснение, старые tmp) — поэтому при первом обращении
+# или в init_services, а не при импорте
+media_cache = LazyService("media_cache", DiskLRUCache)
+
+# Подменяется в тестах (patch storage_service.s3_client); в работе клиент создаётся лениво
+s3_client = None
+
+
+def _create_s3_client():
+    # boto3 импортируется и грузит описания сервисов ~0.3 с — только при первом обращении
+    import boto3
+    from botocore.config import Config as BotoConfig
+
+    try:
+        client = boto3.client(
+            's3',
+            endpoint_url=R2_ENDPOINT_URL,
+            aws_access_key_id=R2_ACCESS_KEY_ID,
+            aws_secret_access_key=R2_SECRET_APPLICATION_KEY,
+            # s3v4 обязателен для presigned URL в R2
+            config=BotoConfig(
+                signature_version='s3v4',
+                retries={'max_attempts': R2_UPLOAD_MAX_ATTEMPTS, 'mode': 'adaptive'},
+            ),
+        )
+        print("✅ Boto3 клиент для R2 успешно инициализирован.")
+        return client
+    except Exception as e:
+        # Клиента нет (None) — функции ниже это проверяют
+        print(f"❌ Ошибка инициализации Boto3: {e}")
+        return None
+
+
+r2_client = LazyService("r2", _create_s3_client)
+_transfer_config = None
+
+
+def get_s3_client():
+    """Клиент R2: подменённый в тестах s3_client или созданный при первом обращении."""
+    if s3_client is not None:
+        return s3_client
+    return r2_client.get()
+
+
+def get_transfer_config():
+    """Параметры multipart для upload_fileobj/download_fileobj (boto3 тоже импортируется лениво)."""
+    global _transfer_config
+    if _transfer_config is None:
+        from boto3.s3.transfer import TransferConfig
+
+        _transfer_config = TransferConfig(
+            multipart_threshold=R2_MULTIPART_CHUNK_BYTES,
+            multipart_chunksize=R2_MULTIPART_CHUNK_BYTES,
+            max_concurrency=R2_PART_CONCURRENCY,
+        )
+    return _transfer_config
 
-try:
-    s3_client = boto3.client(
-        's3',
-        endpoint_url=R2_ENDPOINT_URL,
-        aws_access_key_id=R2_ACCESS_KEY_ID,
-        aws_secret_access_key=R2_SECRET_APPLICATION_KEY,
-    )
-    print("✅ Boto3 клиент для R2 успешно инициализирован.")
-except Exception as e:
-    # Здесь s3_client остается равным None, но он существует.
-    print(f"❌ Ошибка инициализации Boto3: {e}")
 
 # --- ФУНКЦИИ ХРАНИЛИЩА ---
 
-def upload_media_file(file_stream: BinaryIO, original_filename: str, content_type: str) -> str:
+def object_exists(s3_key: str) -> bool:
+    """HEAD-запрос: есть ли объект в бакете."""
+    try:
+        get_s3_client().head_object(Bucket=R2_BUCKET_NAME, Key=s3_key)
+        return True
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            return False
+        raise
+
+
+def needs_upload(s3_key: str, size: int) -> bool:
+    """
+    Решает, нужно ли передавать файл в R2:
+    - ключ в локальном LRU — объект точно есть, ничего не делаем;
+    - Bloom-фильтр «возможно видел» или файл крупный — подтверждаем HEAD-запросом;
+    - иначе ключ для этого процесса новый — грузим сразу, без лишнего HEAD.
+    """
+    if known_media_keys.is_known(s3_key):
+        return False
+    if known_media_keys.maybe_known(s3_key) or size >= R2_HEAD_CHECK_MIN_BYTES:
+        try:
+            if object_exists(s3_key):
+                known_media_keys.remember(s3_key)
+                return False
+        except Exception as e:
+            print(f"⚠️ HEAD-проверка {s3_key} не удалась, загружаю файл: {e}")
+    return True
+
+
+def upload_media_file(
+    file_stream: BinaryIO,
+    original_filename: str,
+    content_type: str,
+    db: Optional[Session] = None,
+) -> str:
     """
-    Загружает файл в Backblaze R2.
+    Загружает файл в Backblaze R2 под ключом по SHA-256 содержимого.
+    Если такой файл уже есть в бакете, повторной передачи не будет.
     
     :param file_stream: Поток данных файла (полученный, например, от FastAPI UploadFile).
     :param original_filename: Имя файла для определения расширения.
     :param content_type: MIME-тип файла (например, 'image/jpeg').
+    :param db: Если передана сессия — увеличиваем счётчик ссылок на объект (commit за вызывающим;
+        при пустом результате транзакцию нужно откатить).
     :return: Ключ файла в хранилище (S3 Key), который мы сохраним в DB.
     """
     
-    # Генерируем уникальный ключ, чтобы избежать конфликтов имен
-    file_extension = os.path.splitext(original_filename)[1]
-    s3_key = f"submissions/{uuid.uuid4()}{file_extension}"
+    # Ключ по содержимому: хеш считаем за один проход, попутно буферизуя данные
+    sha256_hex, spool, size = hash_and_spool(file_stream)
+    s3_key = media_key_for(sha256_hex, original_filename)
     
     try:
-        s3_client.upload_fileobj(
-            file_stream,
-            R2_BUCKET_NAME,
-            s3_key,
-            ExtraArgs={
-                'ContentType': content_type
-            }
-        )
+        # Ссылку берём до проверки наличия: объект со ссылкой чистка уже не удалит
+        if db is not None and acquire_media_ref(db, s3_key, size, content_type) is None:
+            print(f"⚠️ Объект {s3_key} сейчас удаляется из R2, повторите загрузку позже")
+            return ""
+        with spool:
+            if needs_upload(s3_key, size):
+                get_s3_client().upload_fileobj(
+                    spool,
+                    R2_BUCKET_NAME,
+                    s3_key,
+                    ExtraArgs={
+                        'ContentType': content_type
+                    },
+                    Config=get_transfer_config(),
+                )
+                known_media_keys.remember(s3_key)
         # В БД мы сохраняем ключ (s3_key), а не полный URL
         return s3_key 
     except Exception as e:
@@ -59,43 +206,404 @@ def upload_media_file(file_stream: BinaryIO, original_filename: str, content_typ
         # Если загрузка не удалась, возвращаем пустую строку или вызываем исключение
         return ""
 
+
+def release_media_file(db: Session, s3_key: str) -> Optional[int]:
+    """
+    Снимает одну ссылку на объект. Сам объект удалит purge_orphaned_media,
+    когда ссылок не останется дольше MEDIA_ORPHAN_GRACE_SECONDS.
+    """
+    return release_media_ref(db, s3_key)
+
+
+def purge_orphaned_media(db: Session, grace_seconds: int = MEDIA_ORPHAN_GRACE_SECONDS, limit: int = 100) -> List[str]:
+    """
+    Удаляет из бакета объекты без ссылок (старше grace-периода). Возвращает удалённые ключи.
+
+    Порядок важен: сначала запись помечается deleting_at (и это коммитится) — с этого момента
+    новые ссылки на объект не выдаются; потом удаляется объект; и только потом запись.
+    Если удаление из бакета не удалось, запись остаётся помеченной и будет забрана повторно.
+    """
+    keys = claim_orphaned_media(db, datetime.now() - timedelta(seconds=grace_seconds), limit=limit)
+    db.commit()
+    deleted = []
+    for key in keys:
+        known_media_keys.forget(key)
+        media_cache.get().discard(key)
+        try:
+            get_s3_client().delete_object(Bucket=R2_BUCKET_NAME, Key=key)
+            deleted.append(key)
+        except Exception as e:
+            print(f"❌ Ошибка удаления {key} из R2: {e}")
+    forget_media_objects(db, deleted)
+    db.commit()
+    return deleted
+
+
+def warm_known_media_keys(prefix: str = CONTENT_KEY_PREFIX, limit: int = 100000) -> int:
+    """
+    Заполняет локальный индекс ключами из бакета (при старте воркера, см. warmup.warm_media_keys),
+    чтобы дубликаты старых файлов сразу шли через HEAD, а не через загрузку.
+    """
+    count = 0
+    paginator = get_s3_client().get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=R2_BUCKET_NAME, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            known_media_keys.remember(obj["Key"])
+            count += 1
+            if count >= limit:
+                return count
+    return count
+
+
 def get_file_url(s3_key: str) -> str:
     """Генерирует публичный URL для доступа к файлу."""
     # Замените домен на ваш публичный URL для корзины R2 (если настроено CDN)
     return f"{R2_ENDPOINT_URL}/{R2_BUCKET_NAME}/{s3_key}"
 
 
-def download_media_file(s3_key: str) -> bytes | None:
+def direct_upload_key(user_id: uuid.UUID, original_filename: str) -> str:
+    """Ключ для прямой загрузки: у каждого пользователя свой префикс."""
+    file_extension = os.path.splitext(original_filename)[1].lower()
+    return f"{DIRECT_UPLOAD_PREFIX}{user_id}/{uuid.uuid4()}{file_extension}"
+
+
+def owns_upload_key(user_id: uuid.UUID, s3_key: str) -> bool:
+    """Можно ли пользователю анализировать объект по этому ключу."""
+    return s3_key.startswith(f"{DIRECT_UPLOAD_PREFIX}{user_id}/") and ".." not in s3_key
+
+
+def create_presigned_upload(user_id: uuid.UUID, original_filename: str, content_type: str) -> Dict[str, Any]:
     """
-    Скачивает файл из Backblaze R2 по его S3-ключу.
-    
-    :param s3_key: Ключ файла в хранилище (например, submissions/uuid.jpg).
-    :return: Содержимое файла в виде байтов (bytes) или None в случае ошибки.
+    Выдаёт presigned PUT URL, по которому клиент сам загрузит файл в бакет.
+    Content-Type входит в подпись, поэтому клиент обязан отправить тот же заголовок.
+
+    :return: {"key", "url", "method", "headers", "expires_in"}
+    """
+    s3_key = direct_upload_key(user_id, original_filename)
+    url = get_s3_client().generate_presigned_url(
+        'put_object',
+        Params={
+            'Bucket': R2_BUCKET_NAME,
+            'Key': s3_key,
+            'ContentType': content_type,
+        },
+        ExpiresIn=PRESIGNED_URL_EXPIRES_SECONDS,
+    )
+    return {
+        "key": s3_key,
+        "url": url,
+        "method": "PUT",
+        "headers": {"Content-Type": content_type},
+        "expires_in": PRESIGNED_URL_EXPIRES_SECONDS,
+    }
+
+
+def head_media_file(s3_key: str) -> Optional[Dict[str, Any]]:
+    """
+    Метаданные объекта без скачивания: {"size", "content_type", "etag"} или None, если объекта нет.
+    """
+    try:
+        response = get_s3_client().head_object(Bucket=R2_BUCKET_NAME, Key=s3_key)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            return None
+        raise
+    return {
+        "size": response["ContentLength"],
+        "content_type": response.get("ContentType"),
+        "etag": response.get("ETag"),
+    }
+
+
+def claim_direct_upload(
+    s3_key: str,
+    meta: Dict[str, Any],
+    db: Optional[Session] = None,
+) -> Optional[Tuple[str, memoryview]]:
     """
-    if s3_client is None:
+    Забирает объект, загруженный клиентом по presigned URL, и переносит его под ключ по содержимому.
+
+    Presigned URL можно использовать повторно до истечения, поэтому скачиваем ровно ту версию
+    и тот размер, что проверил head_media_file (IfMatch + Range): перезапись объекта после
+    проверки не подменит байты и не обойдёт DIRECT_UPLOAD_MAX_BYTES. Копия под submissions/<sha256>
+    неизменяема (её можно кешировать), исходный объект в uploads/ удаляется.
+
+    :param meta: Результат head_media_file для s3_key.
+    :param db: Если передана сессия — увеличиваем счётчик ссылок на объект (commit за вызывающим).
+    :return: (ключ по содержимому, байты) или None, если объект изменился, недоступен
+             или ключ по содержимому как раз удаляется чисткой.
+    """
+    client = get_s3_client()
+    if client is None:
         print("🛑 Клиент R2 не инициализирован, скачивание невозможно.")
         return None
-        
+    size = meta["size"]
+    source = {"Bucket": R2_BUCKET_NAME, "Key": s3_key}
     try:
-        # Используем get_object для получения ответа, содержащего данные файла
-        response = s3_client.get_object(
+        request = {**source, "IfMatch": meta["etag"]}
+        if size > 0:
+            request["Range"] = f"bytes=0-{size - 1}"
+        body = client.get_object(**request)["Body"]
+        try:
+            data = body.read(size)
+        finally:
+            body.close()
+        if len(data) != size:
+            print(f"⚠️ Объект {s3_key} короче, чем показал HEAD ({len(data)} из {size} байт)")
+            return None
+
+        content_key = media_key_for(hashlib.sha256(data).hexdigest(), s3_key)
+        # Ссылку берём до проверки наличия (см. upload_media_file)
+        if db is not None and acquire_media_ref(db, content_key, size, meta.get("content_type")) is None:
+            print(f"⚠️ Объект {content_key} сейчас удаляется из R2, повторите загрузку позже")
+            return None
+        if needs_upload(content_key, size):
+            # Копия внутри бакета: байты не идут через API повторно
+            client.copy_object(
+                Bucket=R2_BUCKET_NAME,
+                Key=content_key,
+                CopySource=source,
+                CopySourceIfMatch=meta["etag"],
+                ContentType=meta.get("content_type") or "application/octet-stream",
+                MetadataDirective="REPLACE",
+            )
+            known_media_keys.remember(content_key)
+    except ClientError as e:
+        # 412 PreconditionFailed — объект перезаписали после HEAD
+        print(f"❌ Не удалось забрать загрузку {s3_key}: {e}")
+        return None
+
+    try:
+        client.delete_object(Bucket=R2_BUCKET_NAME, Key=s3_key)
+    except Exception as e:
+        # Не страшно: брошенные загрузки удалит purge_stale_uploads
+        print(f"⚠️ Не удалось удалить {s3_key} после переноса: {e}")
+    view = media_cache.get().get_or_fetch(content_key, lambda f: f.write(data))
+    return content_key, view
+
+
+def purge_stale_uploads(max_age_seconds: int = DIRECT_UPLOAD_TTL_SECONDS, limit: int = 1000) -> List[str]:
+    """
+    Удаляет из uploads/ объекты старше max_age_seconds: presigned URL выдан и использован,
+    но анализ так и не был запрошен (или клиент повторно загрузил файл по тому же URL).
+    """
+    client = get_s3_client()
+    if client is None:
+        return []
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=max_age_seconds)
+    stale: List[str] = []
+    paginator = client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=R2_BUCKET_NAME, Prefix=DIRECT_UPLOAD_PREFIX):
+        stale.extend(obj["Key"] for obj in page.get("Contents", []) if obj["LastModified"] < cutoff)
+        if len(stale) >= limit:
+            stale = stale[:limit]
+            break
+    # delete_objects принимает до 1000 ключей за запрос
+    for start in range(0, len(stale), 1000):
+        batch = stale[start:start + 1000]
+        client.delete_objects(
             Bucket=R2_BUCKET_NAME,
-            Key=s3_key
+            Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True},
         )
-        
-        # Читаем содержимое файла в байты
-        file_content = response['Body'].read()
-        return file_content
-        
+    return stale
+
+
+def run_media_maintenance() -> Dict[str, int]:
+    """
+    Фоновая уборка бакета (из lifespan раз в MEDIA_MAINTENANCE_INTERVAL_SECONDS):
+    брошенные presigned-загрузки и объекты без ссылок старше grace-периода.
+    """
+    db = SessionLocal()
+    try:
+        orphaned = purge_orphaned_media(db)
+    finally:
+        db.close()
+    return {"stale_uploads": len(purge_stale_uploads()), "orphaned_media": len(orphaned)}
+
+
+def open_media_file(s3_key: str) -> memoryview | None:
+    """
+    Скачивает файл из Backblaze R2 по его S3-ключу, без копирования в память процесса.
+    Ключи по содержимому (submissions/...) читаются через локальный дисковый кеш: повторные
+    запросы того же ключа обслуживаются из него. Изменяемые ключи (uploads/...) кеш обходят.
+
+    :param s3_key: Ключ файла в хранилище (например, submissions/<sha256>.jpg).
+    :return: memoryview поверх mmap файла кеша (для изменяемых ключей — поверх байтов в памяти)
+             или None в случае ошибки.
+    """
+    if get_s3_client() is None:
+        print("🛑 Клиент R2 не инициализирован, скачивание невозможно.")
+        return None
+
+    def fetch(f: BinaryIO) -> None:
+        get_s3_client().download_fileobj(R2_BUCKET_NAME, s3_key, f, Config=get_transfer_config())
+
+    try:
+        if not is_content_key(s3_key):
+            buffer = io.BytesIO()
+            fetch(buffer)
+            return buffer.getbuffer()
+        # Пишем поток прямо в файл кеша; параллельные запросы ключа ждут одну загрузку
+        return media_cache.get().get_or_fetch(s3_key, fetch)
+
     except Exception as e:
         print(f"❌ Ошибка скачивания файла из R2 (ключ: {s3_key}): {e}")
         return None
+
+
+def download_media_file(s3_key: str) -> bytes | None:
+    """
+    Скачивает файл из Backblaze R2 по его S3-ключу (через кеш, см. open_media_file).
     
+    :param s3_key: Ключ файла в хранилище (например, submissions/<sha256>.jpg).
+    :return: Содержимое файла в виде байтов (bytes) или None в случае ошибки.
+             Без копирования — open_media_file.
+    """
+    view = open_media_file(s3_key)
+    return None if view is None else view.tobytes()
+
+
+class MediaChangedError(RuntimeError):
+    """Объект перезаписан после проверки: ETag не совпал с ожидаемым (IfMatch)."""
+
+
+def read_media_range(s3_key: str, start: int, end: Optional[int] = None, etag: Optional[str] = None) -> bytes:
+    """
+    Ranged GET: байты [start, end] включительно (end=None — до конца объекта).
+    Начало за концом объекта даёт пустой результат.
+
+    :param etag: Читать только эту версию объекта (IfMatch); другая — MediaChangedError.
+    """
+    cached = media_cache.get().get(s3_key) if is_content_key(s3_key) else None
+    if cached is not None:
+        stop = len(cached) if end is None else end + 1
+        return cached[start:stop].tobytes()
+    request = {"Bucket": R2_BUCKET_NAME, "Key": s3_key,
+               "Range": f"bytes={start}-" if end is None else f"bytes={start}-{end}"}
+    if etag is not None:
+        request["IfMatch"] = etag
+    try:
+        response = get_s3_client().get_object(**request)
+    except ClientError as e:
+        code = e.response.get("Error", {}).get("Code")
+        if code == "InvalidRange":
+            return b""
+        if code in ("PreconditionFailed", "412"):
+            raise MediaChangedError(s3_key) from e
+        raise
+    return response['Body'].read()
+
+
+class RangedMediaReader(io.RawIOBase):
+    """
+    Файлоподобный объект поверх ranged GET: поддерживает seek/tell/read,
+    скачивая только те участки, которые реально читаются.
+
+    Подходит для библиотек, которым нужен seekable-файл, но не весь объект
+    (PIL.Image.open читает лишь заголовок, EXIF лежит в начале JPEG и т.д.).
+    """
+
+    def __init__(
+        self,
+        s3_key: str,
+        size: Optional[int] = None,
+        block_size: int = MEDIA_RANGE_BLOCK_BYTES,
+        etag: Optional[str] = None,
+    ):
+        super().__init__()
+        self.s3_key = s3_key
+        self.block_size = block_size
+        self.etag = etag
+        self._size = size
+        self._pos = 0
+        self._block_start = 0
+        self._block = b""
+        self.requests = 0
+
+    @property
+    def size(self) -> int:
+        if self._size is None:
+            meta = head_media_file(self.s3_key)
+            if meta is None:
+                raise FileNotFoundError(self.s3_key)
+            self._size = meta["size"]
+        return self._size
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._pos + offset
+        elif whence == io.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError(f"invalid whence ({whence})")
+        if position < 0:
+            raise ValueError(f"negative seek position {position}")
+        self._pos = position
+        return position
+
+    def readinto(self, buffer) -> int:
+        wanted = len(buffer)
+        if wanted == 0 or self._pos >= self.size:
+            return 0
+        offset = self._pos - self._block_start
+        if not (0 <= offset < len(self._block)):
+            # Нужного участка нет в буфере — докачиваем блок не меньше block_size
+            length = max(wanted, self.block_size)
+            end = min(self._pos + length, self.size) - 1
+            self._block = read_media_range(self.s3_key, self._pos, end, etag=self.etag)
+            self._block_start = self._pos
+            self.requests += 1
+            offset = 0
+        data = self._block[offset:offset + wanted]
+        buffer[:len(data)] = data
+        self._pos += len(data)
+        return len(data)
+
+
+IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"BM", "image/bmp"),
+    (b"II*\x00", "image/tiff"),
+    (b"MM\x00*", "image/tiff"),
+)
+
+
+def sniff_image_type(header: bytes) -> Optional[str]:
+    """Определяет формат изображения по первым байтам (magic numbers)."""
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "image/webp"
+    if header[4:8] == b"ftyp" and header[8:12] in (b"heic", b"heix", b"mif1", b"avif"):
+        return "image/avif" if header[8:12] == b"avif" else "image/heic"
+    for signature, mime in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return mime
+    return None
+
+
+def sniff_media_file(s3_key: str, etag: Optional[str] = None) -> Optional[str]:
+    """MIME-тип изображения по первым MEDIA_SNIFF_BYTES байтам, без скачивания всего объекта."""
+    return sniff_image_type(read_media_range(s3_key, 0, MEDIA_SNIFF_BYTES - 1, etag=etag))
+
+
 # --- ПРОВЕРКА (ОПЦИОНАЛЬНО) ---
 # Если нужно проверить, что клиент работает:
 def check_connection():
     try:
-        s3_client.list_buckets()
+        get_s3_client().list_buckets()
         print("✅ Успешное подключение к Backblaze R2.")
         return True
     except Exception as e:
@@ -105,7 +613,7 @@ def check_connection():
 if __name__ == '__main__':
     
     # 1. Проверяем, что клиент R2/S3 инициализирован
-    if s3_client is None:
+    if get_s3_client() is None:
         print("🛑 Клиент R2 не инициализирован. Проверьте переменные окружения.")
     else:
         check_connection()
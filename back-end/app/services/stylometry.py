@@ -0,0 +1,274 @@
+# app/services/stylometry.py
+
+import logging
+import math
+import os
+import re
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Модель строится скриптом ddd/build_stylometry_lm.py из нашего корпуса
+_DDD_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "ddd")
+STYLOMETRY_LM_PATH = os.getenv("STYLOMETRY_LM_PATH", os.path.join(_DDD_DIR, "stylometry_lm.npz"))
+# Короче этого текста признаки слишком шумные — детектор возвращает None
+STYLOMETRY_MIN_WORDS = int(os.getenv("STYLOMETRY_MIN_WORDS", "25"))
+# С какой длины (в словах) оценке можно доверять полностью
+STYLOMETRY_FULL_CONFIDENCE_WORDS = 200
+
+DEFAULT_ORDER = 3
+DEFAULT_BUCKETS = 2 ** 18
+_HASH_MULTIPLIER = np.uint64(1000003)
+
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+SENTENCE_END_RE = re.compile(r"[.!?…]+(?:\s+|$)")
+WHITESPACE_RE = re.compile(r"\s+")
+
+# Направление признаков: + значит «чем больше z-оценка, тем вероятнее ИИ».
+# У сгенерированного текста ниже перплексия и ровнее предложения (меньше burstiness).
+FEATURE_WEIGHTS = {
+    "cross_entropy": -1.2,
+    "perplexity_burstiness": -0.8,
+    "sentence_burstiness": -0.8,
+    "mattr": -0.3,
+}
+# Опорные статистики человеческого текста, если модели нет (подобраны на живых отзывах и постах)
+DEFAULT_REFERENCE = {
+    "sentence_burstiness": (0.55, 0.25),
+    "mattr": (0.80, 0.08),
+}
+
+
+def normalize(text: str) -> str:
+    return WHITESPACE_RE.sub(" ", text.lower()).strip()
+
+
+def _codes(text: str) -> np.ndarray:
+    """Кодовые точки Unicode как uint64 — без Python-цикла по символам."""
+    return np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+
+
+def _ngram_hashes(codes: np.ndarray, n: int, buckets: int) -> np.ndarray:
+    """
+    Хеши всех n-грамм текста: h = ((c0 * P + c1) * P + c2) mod buckets,
+    считается сдвигами массива (переполнение uint64 — просто часть хеша).
+    """
+    count = len(codes) - n + 1
+    if count <= 0:
+        return np.empty(0, dtype=np.int64)
+    h = codes[:count].copy()
+    for j in range(1, n):
+        h = h * _HASH_MULTIPLIER + codes[j:j + count]
+    return (h % np.uint64(buckets)).astype(np.int64)
+
+
+class NgramLanguageModel:
+    """
+    Символьная n-граммная модель с хешированием n-грамм в фиксированное число корзин
+    (память не зависит от корпуса) и интерполяцией порядков 1..order.
+    """
+
+    def __init__(self, tables: List[np.ndarray], total: int, vocab_size: int, lambdas=None):
+        self.tables = tables  # tables[k] — счётчики (k+1)-грамм
+        self.order = len(tables)
+        self.buckets = len(tables[0])
+        self.total = total
+        self.vocab_size = vocab_size
+        # Веса интерполяции Елинека–Мерсера; по умолчанию каждый следующий порядок вдвое весомее
+        self.lambdas = np.array(lambdas if lambdas is not None else 2.0 ** np.arange(self.order), dtype=np.float64)
+        self.lambdas /= self.lambdas.sum()
+
+    @classmethod
+    def fit(cls, texts: Iterable[str], order: int = DEFAULT_ORDER, buckets: int = DEFAULT_BUCKETS) -> "NgramLanguageModel":
+        tables = [np.zeros(buckets, dtype=np.uint32) for _ in range(order)]
+        total = 0
+        vocab = set()
+        for text in texts:
+            text = normalize(text)
+            if not text:
+                continue
+            codes = _codes(f" {text} ")
+            vocab.update(np.unique(codes).tolist())
+            total += len(codes)
+            for k in range(order):
+                tables[k] += np.bincount(_ngram_hashes(codes, k + 1, buckets), minlength=buckets).astype(np.uint32)
+        return cls(tables, total, len(vocab))
+
+    def char_log_probs(self, text: str) -> np.ndarray:
+        """
+        log2 p(символ | предыдущие order-1) для каждого символа начиная с позиции order-1.
+        """
+        codes = _codes(f" {text} ")
+        n = self.order
+        count = len(codes) - n + 1
+        if count <= 0:
+            return np.empty(0)
+        probs = np.zeros(count)
+        for k in range(n):
+            # (k+1)-граммы, заканчивающиеся в тех же позициях, что и n-граммы
+            grams = self.tables[k][_ngram_hashes(codes, k + 1, self.buckets)[n - 1 - k:]].astype(np.float64)
+            if k == 0:
+                p = (grams + 1.0) / (self.total + self.vocab_size)
+            else:
+                contexts = self.tables[k - 1][_ngram_hashes(codes, k, self.buckets)[n - 1 - k:][:count]]
+                p = np.divide(grams, contexts, out=np.zeros(count), where=contexts > 0)
+                p = np.minimum(p, 1.0)
+            probs += self.lambdas[k] * p
+        return np.log2(probs)
+
+    def save(self, path: str, **extra: np.ndarray) -> None:
+        np.savez_compressed(
+            path,
+            tables=np.stack(self.tables),
+            total=self.total,
+            vocab_size=self.vocab_size,
+            lambdas=self.lambdas,
+            **extra,
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "NgramLanguageModel":
+        with np.load(path) as data:
+            return cls(list(data["tables"]), int(data["total"]), int(data["vocab_size"]), tuple(data["lambdas"]))
+
+
+def _moving_ttr(words: List[str], window: int = 50) -> float:
+    """MATTR: средняя доля уникальных слов в скользящем окне (не зависит от длины текста)."""
+    n = len(words)
+    if n <= window:
+        return len(set(words)) / n
+    ids = np.unique(np.array(words), return_inverse=True)[1]
+    # previous[i] — позиция предыдущего вхождения того же слова (или -1)
+    order = np.argsort(ids, kind="stable")
+    same = ids[order][1:] == ids[order][:-1]
+    previous = np.full(n, -1, dtype=np.int64)
+    previous[order[1:][same]] = order[:-1][same]
+    # Слово i — первое вхождение в окнах, начинающихся в (previous[i], i] ∩ [i-window+1, n-window].
+    # Складываем эти отрезки разностным массивом: число уникальных слов в каждом окне за O(n).
+    first = np.maximum(previous + 1, np.arange(n) - window + 1)
+    last = np.minimum(np.arange(n), n - window)
+    valid = first <= last
+    diff = np.zeros(n - window + 2, dtype=np.int64)
+    np.add.at(diff, first[valid], 1)
+    np.add.at(diff, last[valid] + 1, -1)
+    unique_per_window = np.cumsum(diff)[: n - window + 1]
+    return float(unique_per_window.mean() / window)
+
+
+def extract_features(text: str, model: Optional[NgramLanguageModel] = None) -> Optional[Dict[str, float]]:
+    """Стилометрические признаки текста; None, если текст слишком короткий."""
+    text = normalize(text)
+    words = WORD_RE.findall(text)
+    if len(words) < STYLOMETRY_MIN_WORDS:
+        return None
+
+    sentences = [s for s in SENTENCE_END_RE.split(text) if WORD_RE.search(s)]
+    lengths = np.array([len(WORD_RE.findall(s)) for s in sentences], dtype=np.float64)
+    features = {
+        "words": float(len(words)),
+        "sentences": float(len(sentences)),
+        "mattr": _moving_ttr(words),
+    }
+    # Разброс длины предложений: у людей он заметно больше (на 1–2 предложениях не считаем)
+    if len(lengths) >= 3:
+        features["sentence_burstiness"] = float(lengths.std() / lengths.mean())
+
+    if model is not None:
+        log_probs = model.char_log_probs(text)
+        features["cross_entropy"] = float(-log_probs.mean())
+        features["perplexity"] = float(2 ** features["cross_entropy"])
+        # Перплексия по предложениям: суммы по отрезкам одним reduceat.
+        # log_probs[i] относится к символу текста i + order - 2 (текст дополнен пробелами)
+        starts = [0] + [m.end() for m in SENTENCE_END_RE.finditer(text) if m.end() < len(text)]
+        offsets = np.unique(np.clip(np.array(starts) - model.order + 2, 0, len(log_probs) - 1))
+        if len(offsets) >= 3:
+            sums = np.add.reduceat(log_probs, offsets)
+            sizes = np.diff(np.append(offsets, len(log_probs)))
+            features["perplexity_burstiness"] = float((-sums / sizes).std())
+    return features
+
+
+class StylometryScorer:
+    """
+    Локальная оценка «похожести на ИИ» по стилометрии: перплексия n-граммной модели,
+    её разброс по предложениям, разброс длины предложений, MATTR.
+    Признаки сравниваются с опорной статистикой человеческого корпуса (z-оценки).
+    """
+
+    def __init__(self, path: str = STYLOMETRY_LM_PATH):
+        self.path = path
+        self.model: Optional[NgramLanguageModel] = None
+        self.reference: Dict[str, tuple] = dict(DEFAULT_REFERENCE)
+        self._lock = threading.Lock()
+        self._load_attempted = False
+
+    def load(self) -> bool:
+        """Загружает модель и опорную статистику, если файл есть; без него работают только простые признаки."""
+        with self._lock:
+            self._load_attempted = True
+            if self.model is not None:
+                return True
+            if not os.path.exists(self.path):
+                logger.info("Стилометрическая модель %s не найдена, перплексия не считается.", self.path)
+                return False
+            self.model = NgramLanguageModel.load(self.path)
+            with np.load(self.path) as data:
+                if "feature_names" in data:
+                    for name, mean, std in zip(data["feature_names"], data["feature_mean"], data["feature_std"]):
+                        self.reference[str(name)] = (float(mean), float(std))
+            missing = [name for name in FEATURE_WEIGHTS if name not in self.reference]
+            if missing:
+                # Признаки без опорной статистики в оценку не входят
+                logger.warning("В %s нет опорной статистики для %s — эти признаки не учитываются.",
+                               self.path, ", ".join(missing))
+            logger.info("Стилометрическая модель загружена из %s", self.path)
+            return True
+
+    def score(self, text: str) -> Optional[Dict[str, Any]]:
+        """
+        :return: {"ai_likeliness", "confidence", "features"} или None для короткого текста.
+        ai_likeliness стянут к 0.5 пропорционально неуверенности (короткие тексты почти не влияют).
+        """
+        if not self._load_attempted:
+            self.load()
+        features = extract_features(text, self.model)
+        if features is None:
+            return None
+        logit = 0.0
+        for name, weight in FEATURE_WEIGHTS.items():
+            if name not in features or name not in self.reference:
+                continue
+            mean, std = self.reference[name]
+            z = (features[name] - mean) / max(std, 1e-6)
+            logit += weight * max(-3.0, min(3.0, z))
+        raw = 1.0 / (1.0 + math.exp(-logit))
+        confidence = min(1.0, features["words"] / STYLOMETRY_FULL_CONFIDENCE_WORDS)
+        return {
+            "ai_likeliness": 0.5 + (raw - 0.5) * confidence,
+            "confidence": confidence,
+            "features": features,
+        }
+
+
+def reference_stats(model: NgramLanguageModel, texts: Iterable[str]) -> Dict[str, np.ndarray]:
+    """Средние и СКО признаков по корпусу — сохраняются рядом с моделью."""
+    rows: Dict[str, List[float]] = {name: [] for name in FEATURE_WEIGHTS}
+    for text in texts:
+        features = extract_features(text, model)
+        if features is None:
+            continue
+        for name in rows:
+            if name in features:
+                rows[name].append(features[name])
+    names = [name for name, values in rows.items() if len(values) > 1]
+    return {
+        "feature_names": np.array(names),
+        "feature_mean": np.array([np.mean(rows[name]) for name in names]),
+        "feature_std": np.array([np.std(rows[name]) for name in names]),
+    }
+
+
+stylometry_scorer = StylometryScorer()
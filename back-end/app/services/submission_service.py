@@ -8,9 +8,9 @@ from sqlalchemy.exc import SQLAlchemyError # Для точного отлова
 
 # Предполагаемые импорты:
 # Убедитесь, что ваш database_ops содержит create_submission, create_trust_score, Submission
-from app.models.database_ops import create_submission, create_trust_score, Submission 
+from app.models.database_ops import create_submission, create_trust_score, note_user_write, Submission 
 from app.models.schemas import TextAnalyzeResponse, ClaimEvaluation
-from app.services.ai_service import analyze_text # Ваша функция анализа
+from app.services.ai_service import run_text_detectors, text_response_from_run
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO) 
@@ -39,7 +39,8 @@ def process_text_submission_fixed(db: Session, user_id: str, content: str) -> Te
     
     # 1. Получение ответа AI
     try:
-        ai_response: TextAnalyzeResponse = analyze_text(content)
+        run = run_text_detectors(content)
+        ai_response: TextAnalyzeResponse = text_response_from_run(run, len(content.encode("utf-8")))
     except Exception as e:
         logger.error(f"Ошибка при получении ответа от AI: {e}")
         raise e
@@ -53,12 +54,17 @@ def process_text_submission_fixed(db: Session, user_id: str, content: str) -> Te
     clean_claims = to_clean_dict(ai_response.claims_evaluation)
     
     ai_metadata: Dict[str, Any] = {
+        "trust_score": trust_score,
         "ai_likeliness": ai_response.ai_likeliness,
         "manipulation_score": ai_response.manipulation_score,
         "emotion_intensity": ai_response.emotion_intensity,
         "dangerous_phrases": ai_response.dangerous_phrases,
         "claims_evaluation": clean_claims, # <-- ЧИСТЫЙ СПИСОК СЛОВАРЕЙ
         "summary": ai_response.summary,
+        # Результат и время работы каждого детектора
+        "pipeline": run.as_metadata(),
+        # Токены, стоимость и время вызовов LLM
+        "usage": ai_response.usage,
     }
     
     # === НАЧАЛО ТРАНЗАКЦИИ ===
@@ -86,6 +92,7 @@ def process_text_submission_fixed(db: Session, user_id: str, content: str) -> Te
         # 5. Фиксация транзакции
         submission.status = 'completed'
         db.commit()
+        note_user_write(db, submission.user_id)
         logger.info(f"🎉 УСПЕХ! Данные для Submission {submission.id} зафиксированы.")
         
         return ai_response
@@ -0,0 +1,312 @@
+# app/services/telemetry.py
+
+import functools
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Сколько разных наборов значений меток допускается на одну метрику; остальное
+# попадает в "other", чтобы случайная метка (user id, сырой путь) не раздула /metrics
+MAX_SERIES_PER_METRIC = 200
+OVERFLOW_LABEL = "other"
+
+# Границы бакетов по умолчанию, сек: от быстрых локальных шагов до таймаутов внешних API
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        """
+        Дочерняя серия для значений меток. Вызов — поиск в dict; на горячих путях
+        лучше взять серию один раз и переиспользовать.
+        """
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is not None:
+            return child
+        with self._lock:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {key}")
+            if key not in self._children and len(self._children) >= MAX_SERIES_PER_METRIC:
+                key = (OVERFLOW_LABEL,) * len(self.labelnames)
+            return self._children.setdefault(key, self._new_child())
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in sorted(self._children.items()):
+            lines.extend(self._render_child(key, child))
+        return lines
+
+    def _render_child(self, key, child) -> List[str]:
+        raise NotImplementedError
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._lock.acquire()
+        self.value += amount
+        self._lock.release()
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, *values: str, amount: float = 1.0) -> None:
+        self.labels(*values).inc(amount)
+
+    def _render_child(self, key, child) -> List[str]:
+        return [f"{self.name}_total{_label_text(self.labelnames, key)} {_format_value(child.value)}"]
+
+
+class _HistogramChild:
+    __slots__ = ("_upper", "counts", "sum", "_lock")
+
+    def __init__(self, upper: Tuple[float, ...]):
+        self._upper = upper
+        self.counts = [0] * len(upper)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        # Бинарный поиск по границам + два инкремента под локом: ~0.5 мкс.
+        # acquire/release напрямую заметно дешевле with; между ними исключений быть не может.
+        index = bisect_left(self._upper, value)
+        lock = self._lock
+        lock.acquire()
+        self.counts[index] += 1
+        self.sum += value
+        lock.release()
+
+    def time(self) -> "_Timer":
+        return _Timer(self)
+
+
+class _Timer:
+    __slots__ = ("_child", "_started")
+
+    def __init__(self, child: _HistogramChild):
+        self._child = child
+
+    def __enter__(self) -> "_Timer":
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._child.observe(time.perf_counter() - self._started)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets=LATENCY_BUCKETS):
+        self._upper = tuple(sorted(float(b) for b in buckets)) + (float("inf"),)
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self._upper)
+
+    def observe(self, value: float, *values: str) -> None:
+        self.labels(*values).observe(value)
+
+    def _render_child(self, key, child) -> List[str]:
+        with child._lock:
+            counts, total = list(child.counts), child.sum
+        lines, cumulative = [], 0
+        for upper, count in zip(self._upper, counts):
+            cumulative += count
+            le = f'le="{_format_value(upper)}"'
+            lines.append(f"{self.name}_bucket{_label_text(self.labelnames, key, le)} {cumulative}")
+        lines.append(f"{self.name}_sum{_label_text(self.labelnames, key)} {_format_value(total)}")
+        lines.append(f"{self.name}_count{_label_text(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+REGISTRY: List[_Metric] = []
+
+
+def render_metrics() -> str:
+    """Все метрики в текстовом формате Prometheus (exposition format 0.0.4)."""
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# =====================================================================
+#                       Метрики приложения
+# =====================================================================
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ("route", "method", "status"),
+)
+http_request_size = Histogram(
+    "http_request_size_bytes",
+    "HTTP request body size (Content-Length) by route template",
+    ("route",),
+    buckets=SIZE_BUCKETS,
+)
+upstream_duration = Histogram(
+    "upstream_request_duration_seconds",
+    "Latency of external calls (OpenAI, ZeroGPT, HuggingFace)",
+    ("upstream", "outcome"),
+)
+db_commit_duration = Histogram(
+    "db_commit_duration_seconds",
+    "SQLAlchemy session commit latency (flush included)",
+)
+fallback_total = Counter(
+    "analysis_fallback",
+    "Responses built from a fallback instead of the primary detector",
+    ("kind",),
+)
+event_loop_lag = Histogram(
+    "event_loop_lag_seconds",
+    "How late the asyncio event loop wakes up a periodic probe",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0),
+)
+
+
+def track_upstream(upstream: str) -> Callable:
+    """
+    Декоратор для внешних вызовов: latency с outcome ok | empty (вернул None) | error (исключение).
+    """
+    def decorator(func: Callable) -> Callable:
+        series = {outcome: upstream_duration.labels(upstream, outcome) for outcome in ("ok", "empty", "error")}
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except BaseException:
+                series["error"].observe(time.perf_counter() - started)
+                raise
+            series["ok" if result is not None else "empty"].observe(time.perf_counter() - started)
+            return result
+        return wrapper
+    return decorator
+
+
+def instrument_db_commits(session_class) -> None:
+    """Меряет каждый commit сессий SQLAlchemy (события before_commit/after_commit/after_rollback)."""
+    from sqlalchemy import event
+
+    series = db_commit_duration.labels()
+
+    def before_commit(session) -> None:
+        session.info["_commit_started"] = time.perf_counter()
+
+    def after_commit(session) -> None:
+        started = session.info.pop("_commit_started", None)
+        if started is not None:
+            series.observe(time.perf_counter() - started)
+
+    def after_rollback(session) -> None:
+        session.info.pop("_commit_started", None)
+
+    event.listen(session_class, "before_commit", before_commit)
+    event.listen(session_class, "after_commit", after_commit)
+    event.listen(session_class, "after_rollback", after_rollback)
+
+
+async def monitor_event_loop(interval: float = 0.5) -> None:
+    """Фоновая задача: насколько позже запланированного просыпается цикл событий."""
+    import asyncio
+
+    series = event_loop_lag.labels()
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        series.observe(max(0.0, time.perf_counter() - started - interval))
+
+
+def route_label(scope: Dict, fallback: Optional[str] = "unmatched") -> str:
+    """Шаблон маршрута (/history/{history_id}), а не сырой путь — число серий ограничено."""
+    route = scope.get("route")
+    return getattr(route, "path", None) or fallback
+
+
+class RequestMetricsMiddleware:
+    """
+    ASGI middleware: latency и размер тела запроса по шаблону маршрута.
+
+    Время засекается по отправке последнего куска тела (http.response.body с more_body=False),
+    а не заголовков: потоковые ответы (экспорт) учитываются целиком, а фоновые задачи,
+    которые Starlette выполняет уже после ответа, — нет. Если последний кусок так и
+    не ушёл (исключение, клиент отключился), — по завершении приложения.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        finished: Optional[float] = None
+        status = 500
+
+        async def send_and_time(message):
+            nonlocal finished, status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                finished = time.perf_counter()
+
+        try:
+            await self.app(scope, receive, send_and_time)
+        finally:
+            # Маршрут роутер записывает в тот же scope
+            route = route_label(scope)
+            elapsed = (finished if finished is not None else time.perf_counter()) - started
+            http_request_duration.labels(route, scope["method"], f"{status // 100}xx").observe(elapsed)
+            content_length = dict(scope["headers"]).get(b"content-length")
+            if content_length and content_length.isdigit():
+                http_request_size.labels(route).observe(int(content_length))
@@ -0,0 +1,185 @@
+# app/services/text_classifier_service.py
+
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Артефакты из ddd/ClassificationModer.py (TF-IDF + LogisticRegression).
+# По умолчанию берём ONNX-версию, если она есть, иначе joblib.
+_DDD_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "ddd")
+_DEFAULT_ONNX_PATH = os.path.join(_DDD_DIR, "sentiment_tfidf_logreg.onnx")
+_DEFAULT_JOBLIB_PATH = os.path.join(_DDD_DIR, "sentiment_tfidf_logreg.joblib")
+TEXT_MODEL_PATH = os.getenv(
+    "TEXT_MODEL_PATH",
+    _DEFAULT_ONNX_PATH if os.path.exists(_DEFAULT_ONNX_PATH) else _DEFAULT_JOBLIB_PATH,
+)
+# Сколько ждать попутчиков для батча и максимальный размер батча
+TEXT_MODEL_BATCH_WAIT_MS = float(os.getenv("TEXT_MODEL_BATCH_WAIT_MS", "5"))
+TEXT_MODEL_MAX_BATCH = int(os.getenv("TEXT_MODEL_MAX_BATCH", "64"))
+# Сколько ждать ответа модели в синхронном вызове, сек
+TEXT_MODEL_TIMEOUT = float(os.getenv("TEXT_MODEL_TIMEOUT", "5"))
+
+
+def load_text_model(path: str = TEXT_MODEL_PATH) -> Any:
+    """
+    .onnx — OnnxTextModel (onnxruntime, тот же интерфейс predict_proba/classes_).
+
+    .joblib — загрузка с mmap_mode='r': numpy-массивы (коэффициенты, idf) не копируются
+    в память процесса, а отображаются из файла, так что воркеры, форкнутые после загрузки
+    (gunicorn --preload), делят одни и те же страницы.
+    """
+    if path.endswith(".onnx"):
+        from app.services.onnx_text_model import OnnxTextModel
+
+        return OnnxTextModel(path)
+
+    import joblib
+
+    return joblib.load(path, mmap_mode="r")
+
+
+class MicroBatcher:
+    """
+    Собирает одиночные запросы в батчи: первый запрос ждёт до batch_wait_ms попутчиков
+    (или пока батч не наберёт max_batch), после чего модель вызывается один раз на весь батч.
+
+    predict_batch(texts) -> список результатов в том же порядке.
+    """
+
+    def __init__(
+        self,
+        predict_batch,
+        batch_wait_ms: float = TEXT_MODEL_BATCH_WAIT_MS,
+        max_batch: int = TEXT_MODEL_MAX_BATCH,
+    ):
+        self.predict_batch = predict_batch
+        self.batch_wait = batch_wait_ms / 1000.0
+        self.max_batch = max_batch
+        self._queue: "queue.Queue[Optional[Tuple[str, Future]]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+
+    def _ensure_started(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="text-model-batcher", daemon=True)
+                self._thread.start()
+
+    def submit(self, text: str) -> Future:
+        self._ensure_started()
+        future: Future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def close(self) -> None:
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None and thread.is_alive():
+            self._queue.put(None)
+            thread.join(timeout=1)
+
+    def _collect(self, first: Tuple[str, Future]) -> Tuple[List[Tuple[str, Future]], bool]:
+        batch = [first]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _loop(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch, stop = self._collect(first)
+            # Отменённые (например, по таймауту вызывающего) не считаем
+            batch = [(text, future) for text, future in batch if future.set_running_or_notify_cancel()]
+            if batch:
+                try:
+                    results = self.predict_batch([text for text, _ in batch])
+                    for (_, future), result in zip(batch, results):
+                        future.set_result(result)
+                except Exception as e:
+                    for _, future in batch:
+                        future.set_exception(e)
+                self.batches += 1
+                self.items += len(batch)
+            if stop:
+                return
+
+
+class TextClassifier:
+    """
+    Модель ddd в процессе API: загружается один раз, предсказания идут через MicroBatcher.
+    """
+
+    def __init__(self, path: str = TEXT_MODEL_PATH, **batcher_options):
+        self.path = path
+        self.model: Any = None
+        self.labels: List[str] = []
+        self.batcher = MicroBatcher(self._predict_batch, **batcher_options)
+
+    @property
+    def loaded(self) -> bool:
+        return self.model is not None
+
+    def load(self) -> bool:
+        """Загружает модель, если файл есть. Без модели API работает, просто без этого сигнала."""
+        if self.loaded:
+            return True
+        if not os.path.exists(self.path):
+            logger.info("Модель текста %s не найдена, классификатор выключен.", self.path)
+            return False
+        self.set_model(load_text_model(self.path))
+        logger.info("Модель текста загружена из %s (классы: %s)", self.path, self.labels)
+        return True
+
+    def set_model(self, model: Any) -> None:
+        self.model = model
+        self.labels = [str(label) for label in model.classes_]
+
+    def _predict_batch(self, texts: List[str]) -> List[Dict[str, float]]:
+        probabilities = self.model.predict_proba(texts)
+        return [
+            {label: float(p) for label, p in zip(self.labels, row)}
+            for row in probabilities
+        ]
+
+    def predict_proba_async(self, text: str) -> Future:
+        if not self.loaded:
+            raise RuntimeError("Text model is not loaded")
+        return self.batcher.submit(text)
+
+    def predict_proba(self, text: str, timeout: float = TEXT_MODEL_TIMEOUT) -> Dict[str, float]:
+        """Вероятности классов для одного текста (под капотом — общий батч)."""
+        future = self.predict_proba_async(text)
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    def classify(self, text: str) -> Dict[str, Any]:
+        probabilities = self.predict_proba(text)
+        label = max(probabilities, key=probabilities.get)
+        return {"label": label, "probabilities": probabilities}
+
+
+text_classifier = TextClassifier()
@@ -0,0 +1,99 @@
+# app/services/usage_accounting.py
+
+import uuid
+from typing import Any, Dict, Optional
+
+# Цены OpenAI, USD за 1M токенов: (вход, вход из кеша, выход)
+MODEL_PRICES_PER_MILLION = {
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+}
+
+
+def call_cost_usd(model: str, prompt_tokens: int, cached_tokens: int, completion_tokens: int) -> Optional[float]:
+    """Стоимость одного вызова; None, если цены модели неизвестны."""
+    prices = MODEL_PRICES_PER_MILLION.get(model)
+    if prices is None:
+        return None
+    input_price, cached_price, output_price = prices
+    uncached = max(0, prompt_tokens - cached_tokens)
+    return (uncached * input_price + cached_tokens * cached_price + completion_tokens * output_price) / 1_000_000
+
+
+def completion_usage(completion: Any, model: str, latency_ms: float) -> Dict[str, Any]:
+    """
+    Токены и время одного chat.completions-вызова (completion.usage из ответа OpenAI).
+    cached_tokens — часть prompt_tokens, попавшая в кеш префиксов OpenAI.
+    """
+    usage = getattr(completion, "usage", None)
+    prompt_tokens = int(getattr(usage, "prompt_tokens", 0) or 0)
+    completion_tokens = int(getattr(usage, "completion_tokens", 0) or 0)
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = int(getattr(details, "cached_tokens", 0) or 0)
+    return {
+        "model": getattr(completion, "model", None) or model,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "cached_tokens": cached_tokens,
+        "latency_ms": round(latency_ms, 1),
+        "cost_usd": call_cost_usd(model, prompt_tokens, cached_tokens, completion_tokens),
+    }
+
+
+def summarize_usage(calls: Dict[str, Dict[str, Any]], input_bytes: int) -> Dict[str, Any]:
+    """
+    Итог по запросу: сумма токенов и стоимости по всем вызовам LLM + размер входа.
+    calls — {имя детектора: completion_usage(...)}.
+    Этот dict хранится в history.usage / trust_scores.ai_metadata["usage"] и идёт в дневные агрегаты.
+    """
+    totals: Dict[str, Any] = {
+        "input_bytes": input_bytes,
+        "llm_calls": len(calls),
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "cached_tokens": 0,
+        "upstream_ms": 0.0,
+        "cost_usd": 0.0,
+    }
+    for call in calls.values():
+        for key in ("prompt_tokens", "completion_tokens", "cached_tokens"):
+            totals[key] += call[key]
+        totals["upstream_ms"] += call["latency_ms"]
+        totals["cost_usd"] += call["cost_usd"] or 0.0
+    totals["upstream_ms"] = round(totals["upstream_ms"], 1)
+    totals["calls"] = calls
+    return totals
+
+
+def usage_from_run(run: Any, input_bytes: int) -> Dict[str, Any]:
+    """
+    Собирает usage детекторов (DetectorOutcome.usage) — и успешных, и упавших после
+    оплаченного ответа модели (например, на разборе JSON).
+    """
+    calls: Dict[str, Dict[str, Any]] = {
+        name: outcome.usage for name, outcome in run.outcomes.items() if outcome.usage is not None
+    }
+    return summarize_usage(calls, input_bytes)
+
+
+def record_late_usage(run: Any, user_id: uuid.UUID, kind: str) -> None:
+    """
+    Вызовы LLM, брошенные конвейером по таймауту, оплачиваются, когда модель всё же ответит.
+    Их usage дописывается в usage_daily по мере завершения (запрос уже учтён в history).
+    """
+    if run is None or not run.has_abandoned:
+        return
+
+    def on_usage(name: str, usage: Dict[str, Any]) -> None:
+        from app.models.database_ops import SessionLocal, record_usage
+
+        db = SessionLocal()
+        try:
+            record_usage(db, user_id, kind, summarize_usage({name: usage}, 0), requests=0)
+            db.commit()
+        except Exception as e:
+            print(f"⚠️ Не удалось записать usage детектора {name} после таймаута: {e}")
+        finally:
+            db.close()
+
+    run.on_late_usage(on_usage)
@@ -0,0 +1,257 @@
+# app/services/warmup.py
+
+import io
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from botocore.exceptions import ClientError
+from sqlalchemy import text
+
+from app.models.database_ops import get_engine, replica_router
+from app.services.ai_service import (
+    HF_IMAGE_MODEL_URL,
+    ZEROGPT_ENDPOINT,
+    compute_image_trust_score,
+    hf_api_key,
+    http_session,
+    openai_client,
+    text_pipeline,
+    text_response_from_run,
+    zerogpt_api_key,
+)
+from app.services.image_forensics import analyze_forensics
+from app.services.metrics_assembler import DetectorOutcome, DetectorPipeline, PipelineRun
+from app.services.storage_service import R2_BUCKET_NAME, get_s3_client, warm_known_media_keys
+
+# Прогрев после старта: соединения к внешним API и БД, локальные модели, пробный скоринг.
+# Пока он не закончился, /ready отвечает 503 (а /health — 200: процесс жив)
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "1") == "1"
+# Сколько соединений открыть заранее к каждому внешнему API и к каждой БД (primary и реплики)
+WARMUP_CONNECTIONS = int(os.getenv("WARMUP_CONNECTIONS", "4"))
+# Дольше прогрев не ждём: воркер объявляется готовым, недогретое догреется первыми запросами
+WARMUP_TIMEOUT_SECONDS = float(os.getenv("WARMUP_TIMEOUT_SECONDS", "30"))
+# Таймаут одного прогревочного запроса к внешнему API
+WARMUP_REQUEST_TIMEOUT = float(os.getenv("WARMUP_REQUEST_TIMEOUT", "5"))
+# Индекс ключей бакета (known_media_keys) заполняется при старте воркера: с пустым индексом
+# дубликаты файлов меньше R2_HEAD_CHECK_MIN_BYTES загружались бы заново без HEAD-проверки.
+# Листинг идёт в потоке прогрева и, если не уложился в таймаут, дочитывается в фоне
+WARMUP_MEDIA_KEYS = os.getenv("WARMUP_MEDIA_KEYS", "1") == "1"
+WARMUP_MEDIA_KEYS_LIMIT = int(os.getenv("WARMUP_MEDIA_KEYS_LIMIT", "100000"))
+
+WARMUP_TEXT = (
+    "The city council approved the new budget on Tuesday. According to the report, spending on "
+    "public transport will grow by 12 percent. Городской совет утвердил бюджет; эксперты "
+    "считают, что это решение изменит всё. You must act now before it is too late!"
+)
+# Ответ OpenAI для пробного скоринга: формат как у detect_text_with_openai
+WARMUP_MODEL_OUTPUT = {
+    "ai_likeliness": 0.4,
+    "manipulation_score": 0.3,
+    "emotion_intensity": 0.5,
+    "dangerous_phrases": [],
+    "claims_evaluation": [{"text": "Spending grows by 12 percent.", "true_likeliness": 0.7, "comment": "warm-up"}],
+    "summary": "warm-up",
+}
+
+# Локальные детекторы текста: их прогоняем на WARMUP_TEXT (удалённые не вызываем — это платные запросы)
+LOCAL_TEXT_DETECTORS = ("stylometry", "lexicon", "text_classifier")
+
+
+def open_connections(open_one: Callable[[], Any], count: int) -> int:
+    """
+    Вызывает open_one одновременно из count потоков. Одновременно — чтобы пул не отдал
+    всем одно и то же keep-alive соединение, а открыл count разных (TCP + TLS).
+    Возвращает число удачных вызовов; если не удался ни один — пробрасывает последнюю ошибку.
+    """
+    if count <= 0:
+        return 0
+    barrier = threading.Barrier(count, timeout=WARMUP_REQUEST_TIMEOUT)
+
+    def worker() -> None:
+        try:
+            barrier.wait()
+        except threading.BrokenBarrierError:
+            pass  # какой-то поток не стартовал вовремя — просто идём без синхронизации
+        open_one()
+
+    errors: List[Exception] = []
+    with ThreadPoolExecutor(max_workers=count, thread_name_prefix="warmup-conn") as executor:
+        for future in [executor.submit(worker) for _ in range(count)]:
+            error = future.exception()
+            if error is not None:
+                errors.append(error)
+    if len(errors) == count:
+        raise errors[-1]
+    return count - len(errors)
+
+
+def warm_db_pool(engine, count: int) -> int:
+    """
+    Открывает до count соединений пула engine (не больше pool_size — лишние пул закрыл бы
+    при возврате) и возвращает их в пул уже установленными.
+    """
+    size = engine.pool.size() if hasattr(engine.pool, "size") else count
+    connections = []
+    try:
+        for _ in range(min(count, size)):
+            connection = engine.connect()
+            connection.execute(text("SELECT 1"))
+            connections.append(connection)
+    finally:
+        for connection in connections:
+            connection.close()
+    return len(connections)
+
+
+# ---------------------- ШАГИ ПРОГРЕВА ----------------------
+# Шаг возвращает короткий итог (число соединений, trust_score) или None, если пропущен
+
+
+def warm_postgres(count: int = WARMUP_CONNECTIONS) -> Dict[str, int]:
+    opened = {"primary": warm_db_pool(get_engine(), count)}
+    for replica in replica_router.replicas:
+        try:
+            opened[replica.name] = warm_db_pool(replica.engine, count)
+        except Exception as e:
+            # Реплика недоступна — роутер и так читает с primary
+            print(f"⚠️ Прогрев реплики {replica.name} не удался: {e}")
+            opened[replica.name] = 0
+    return opened
+
+
+def warm_openai(count: int = WARMUP_CONNECTIONS) -> Optional[int]:
+    from openai import APIStatusError
+
+    client = openai_client.get().with_options(max_retries=0, timeout=WARMUP_REQUEST_TIMEOUT)
+
+    def open_one() -> None:
+        try:
+            client.models.list()
+        except APIStatusError:
+            pass  # любой HTTP-ответ значит, что соединение установлено
+
+    return open_connections(open_one, count)
+
+
+def _warm_http(url: str, count: int) -> int:
+    session = http_session.get()
+    # HEAD без тела: код ответа не важен, важно открытое соединение в пуле сессии
+    return open_connections(lambda: session.head(url, timeout=WARMUP_REQUEST_TIMEOUT), count)
+
+
+def warm_zerogpt(count: int = WARMUP_CONNECTIONS) -> Optional[int]:
+    if not zerogpt_api_key:
+        return None
+    return _warm_http(ZEROGPT_ENDPOINT, count)
+
+
+def warm_hf(count: int = WARMUP_CONNECTIONS) -> Optional[int]:
+    if not hf_api_key:
+        return None
+    return _warm_http(HF_IMAGE_MODEL_URL, count)
+
+
+def warm_r2(count: int = WARMUP_CONNECTIONS) -> Optional[int]:
+    client = get_s3_client()
+    if client is None or not R2_BUCKET_NAME:
+        return None
+
+    def open_one() -> None:
+        try:
+            client.head_bucket(Bucket=R2_BUCKET_NAME)
+        except ClientError:
+            pass  # 403/404 от R2 — соединение всё равно открыто
+
+    return open_connections(open_one, count)
+
+
+def warm_media_keys(limit: int = WARMUP_MEDIA_KEYS_LIMIT) -> Optional[int]:
+    if not WARMUP_MEDIA_KEYS or get_s3_client() is None or not R2_BUCKET_NAME:
+        return None
+    return warm_known_media_keys(limit=limit)
+
+
+def _warmup_image() -> bytes:
+    """Небольшой JPEG с шумом: форензика проходит декодирование, квантование и анализ шума."""
+    import numpy as np
+    from PIL import Image
+
+    pixels = np.random.default_rng(0).integers(0, 256, size=(96, 128, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+
+_local_text_pipeline: Optional[DetectorPipeline] = None
+
+
+def _local_pipeline() -> DetectorPipeline:
+    global _local_text_pipeline
+    if _local_text_pipeline is None:
+        _local_text_pipeline = DetectorPipeline("warmup", max_workers=len(LOCAL_TEXT_DETECTORS))
+        for name in LOCAL_TEXT_DETECTORS:
+            _local_text_pipeline.add(text_pipeline.detectors[name])
+    return _local_text_pipeline
+
+
+def warm_scoring() -> Dict[str, Any]:
+    """
+    Пробный скоринг без внешних API: локальные детекторы текста (первый вызов модели ddd
+    подтягивает mmap-массивы и запускает батчер), сборка ответа и trust_score,
+    форензика и скоринг изображения.
+    """
+    local = _local_pipeline().run({"text": WARMUP_TEXT})
+    outcomes = dict(local.outcomes)
+    outcomes["openai_text"] = DetectorOutcome("ok", WARMUP_MODEL_OUTPUT, 0.0)
+    response = text_response_from_run(PipelineRun(text_pipeline.detectors, outcomes, local.elapsed_ms))
+
+    forensics = analyze_forensics(_warmup_image())
+    image_score = compute_image_trust_score(
+        ai_likeliness=forensics["ai_likeliness"],
+        manipulation_risk=forensics["manipulation_risk"],
+        realism=0.5,
+        anomalies=forensics["findings"],
+        forensic_score=forensics["forensic_score"],
+    )
+    return {
+        "text_trust_score": response.trust_score,
+        "image_trust_score": image_score,
+        "local_detectors": {name: outcome.status for name, outcome in local.outcomes.items()},
+    }
+
+
+WARMUP_STEPS: Tuple[Tuple[str, Callable[[], Any]], ...] = (
+    ("postgres", warm_postgres),
+    ("openai", warm_openai),
+    ("zerogpt", warm_zerogpt),
+    ("hf", warm_hf),
+    ("r2", warm_r2),
+    ("media_keys", warm_media_keys),
+    ("scoring", warm_scoring),
+)
+
+
+def run_warmup(steps: Tuple[Tuple[str, Callable[[], Any]], ...] = WARMUP_STEPS) -> Dict[str, Dict[str, Any]]:
+    """
+    Выполняет шаги параллельно (они почти все ждут сеть). Упавший шаг не останавливает
+    остальные: в отчёте у него status=error. {шаг: {status, elapsed_ms, result | error}}.
+    """
+
+    def run_step(step: Callable[[], Any]) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            result = step()
+            entry: Dict[str, Any] = {"status": "skipped" if result is None else "ok", "result": result}
+        except Exception as e:
+            entry = {"status": "error", "error": f"{type(e).__name__}: {e}"}
+        entry["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return entry
+
+    if not steps:
+        return {}
+    with ThreadPoolExecutor(max_workers=len(steps), thread_name_prefix="warmup") as executor:
+        futures = {name: executor.submit(run_step, step) for name, step in steps}
+        return {name: future.result() for name, future in futures.items()}
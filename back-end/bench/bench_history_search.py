@@ -0,0 +1,141 @@
+"""
+Задержка полнотекстового поиска по истории (search_user_history) на большой таблице.
+
+Нужен отдельный Postgres под замер (DB_* переменные как у бэкенда), например:
+    docker run -e POSTGRES_PASSWORD=bench -p 5432:5432 postgres:16
+Скрипт создаёт таблицы, применяет миграции (upgrade_schema), заполняет history
+синтетическими записями на трёх языках (INSERT ... SELECT generate_series, триггер
+строит search_vector), делает ANALYZE и гоняет поиск случайных слов от случайных
+пользователей. Печатает p50/p95/p99 и план одного запроса; код возврата 1, если p95 выше
+бюджета. Повторный запуск дозаполняет таблицу только до --rows.
+
+Примеры (из папки back-end):
+    python bench/bench_history_search.py --rows 2000000 --users 2000
+    python bench/bench_history_search.py --rows 5000000 --queries 500 --budget-ms 50
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text  # noqa: E402
+
+from app.models.database_ops import Base, SessionLocal, get_engine, search_user_history, upgrade_schema  # noqa: E402
+
+WORDS = {
+    "en": "election budget vaccine climate report council minister percent study market war border".split(),
+    "ru": "выборы бюджет вакцина климат доклад совет министр процент исследование рынок война граница".split(),
+    "sk": "voľby rozpočet vakcína klíma správa rada minister percento štúdia trh vojna hranica".split(),
+}
+BATCH_ROWS = 100_000
+
+SEED_USERS = """
+INSERT INTO users (id, username, hashed_password, is_active, created_at)
+SELECT gen_random_uuid(), 'bench-search-' || n, 'x', true, now()
+FROM generate_series(1, :count) AS n
+ON CONFLICT (username) DO NOTHING
+"""
+
+# Вопрос и summary — 8–40 случайных слов одного языка; пользователь — случайный из bench-search-*
+SEED_HISTORY = """
+WITH bench_users AS (
+    SELECT array_agg(id) AS ids FROM users WHERE username LIKE 'bench-search-%'
+), rows AS (
+    SELECT n, CASE n % 3 WHEN 0 THEN CAST(:en AS text[]) WHEN 1 THEN CAST(:ru AS text[]) ELSE CAST(:sk AS text[]) END
+        AS vocabulary
+    FROM generate_series(1, :count) AS n
+)
+INSERT INTO history (id, user_id, question, raw_response, created_at, kind)
+SELECT
+    gen_random_uuid(),
+    bench_users.ids[1 + floor(random() * array_length(bench_users.ids, 1))::int],
+    (SELECT string_agg(vocabulary[1 + floor(random() * array_length(vocabulary, 1))::int], ' ')
+     FROM generate_series(1, 8 + (n % 33)) WHERE n > 0),
+    jsonb_build_object(
+        'trust_score', round((random() * 100)::numeric, 1),
+        'summary', (SELECT string_agg(vocabulary[1 + floor(random() * array_length(vocabulary, 1))::int], ' ')
+                    FROM generate_series(1, 8 + (n % 17)) WHERE n > 0)
+    ),
+    now() - random() * interval '365 days',
+    'text'
+FROM rows, bench_users
+"""
+
+
+def seed(rows: int, users: int) -> None:
+    engine = get_engine()
+    with engine.begin() as conn:
+        conn.execute(text(SEED_USERS), {"count": users})
+        existing = conn.execute(text("SELECT count(*) FROM history")).scalar()
+    started = time.perf_counter()
+    while existing < rows:
+        count = min(BATCH_ROWS, rows - existing)
+        with engine.begin() as conn:
+            conn.execute(text(SEED_HISTORY), {"count": count, **WORDS})
+        existing += count
+        print(f"  history: {existing}/{rows} ({time.perf_counter() - started:.0f} с)")
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.exec_driver_sql("ANALYZE history")
+
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Задержка поиска по истории на большой таблице")
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--budget-ms", type=float, default=50.0, help="Порог p95, мс")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=get_engine())
+    upgrade_schema()
+    print(f"Заполнение history до {args.rows} строк...")
+    seed(args.rows, args.users)
+
+    with get_engine().connect() as conn:
+        user_ids = list(conn.execute(text("SELECT id FROM users WHERE username LIKE 'bench-search-%'")).scalars())
+    rng = random.Random(0)
+    all_words = [word for words in WORDS.values() for word in words]
+
+    db = SessionLocal()
+    try:
+        # Первый запрос прогревает кэш страниц и соединение — в замер не идёт
+        search_user_history(db, user_ids[0], all_words[0], limit=args.limit)
+        timings = []
+        for _ in range(args.queries):
+            user_id, query = rng.choice(user_ids), rng.choice(all_words)
+            started = time.perf_counter()
+            search_user_history(db, user_id, query, limit=args.limit)
+            timings.append((time.perf_counter() - started) * 1000)
+            db.rollback()
+
+        plan = db.execute(
+            text(
+                "EXPLAIN (ANALYZE, BUFFERS) SELECT id FROM history "
+                "WHERE user_id = :user_id AND search_vector @@ websearch_to_tsquery('simple', :q)"
+            ),
+            {"user_id": user_ids[0], "q": all_words[0]},
+        ).scalars()
+        print("\n".join(plan))
+    finally:
+        db.close()
+
+    p50, p95, p99 = (percentile(timings, q) for q in (0.5, 0.95, 0.99))
+    print(f"\n{args.queries} запросов: p50={p50:.1f} мс p95={p95:.1f} мс p99={p99:.1f} мс (бюджет p95 {args.budget_ms:g} мс)")
+    if p95 > args.budget_ms:
+        print("❌ p95 выше бюджета")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
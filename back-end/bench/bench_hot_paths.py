@@ -0,0 +1,166 @@
+"""
+Микробенчмарки Python-части горячего пути (pytest-benchmark).
+
+Что меряем — то, что выполняется на каждом запросе, на реалистичных размерах:
+- compute_trust_score / compute_image_trust_score (0–200 утверждений, 0–30 аномалий);
+- text_response_from_run — разбор ответа модели в analyze_text;
+- to_clean_dict — подготовка claims для JSONB;
+- сериализация TextAnalyzeResponse (dict для history и JSON для ответа API);
+- страница /history (ORM-объекты → HistoryItem → JSON) на 20–500 записей.
+
+Внешние API и БД не вызываются. Запуск с базовыми замерами и порогом — через run_benchmarks.py.
+"""
+
+import json
+import os
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from typing import List
+
+import pytest
+from pydantic import TypeAdapter
+
+os.environ.setdefault("OPENAI_API_KEY", "bench-key")
+
+from app.models.schemas import ClaimEvaluation, HistoryItem, TextAnalyzeResponse  # noqa: E402
+from app.services.ai_service import compute_image_trust_score, compute_trust_score, text_pipeline, text_response_from_run  # noqa: E402
+from app.services.metrics_assembler import DetectorOutcome, PipelineRun  # noqa: E402
+from app.services.submission_service import to_clean_dict  # noqa: E402
+
+CLAIM_COUNTS = [0, 10, 50, 200]
+HISTORY_PAGES = [20, 100, 500]
+SUMMARY_CHARS = 4000
+
+_rng = random.Random(42)
+_WORDS = "claim source evidence context government study report percent według источник утверждение".split()
+
+
+def _sentence(words: int) -> str:
+    return " ".join(_rng.choice(_WORDS) for _ in range(words)).capitalize() + "."
+
+
+def _claims_raw(count: int) -> List[dict]:
+    return [
+        {"text": _sentence(18), "true_likeliness": round(_rng.random(), 3), "comment": _sentence(30)}
+        for _ in range(count)
+    ]
+
+
+def _model_output(claims: int) -> dict:
+    """JSON, который возвращает OpenAI для текста (после json.loads)."""
+    return {
+        "ai_likeliness": 0.42,
+        "manipulation_score": 0.31,
+        "emotion_intensity": 0.57,
+        "dangerous_phrases": ["kill them all", "you must act now"][: claims % 3],
+        "claims_evaluation": _claims_raw(claims),
+        "summary": (_sentence(20) + " ") * (SUMMARY_CHARS // 150),
+    }
+
+
+def _text_run(claims: int) -> PipelineRun:
+    outcomes = {
+        "openai_text": DetectorOutcome("ok", _model_output(claims), 900.0),
+        "stylometry": DetectorOutcome("ok", {"ai_likeliness": 0.35}, 3.0),
+        "lexicon": DetectorOutcome("ok", ["kill them all"], 0.2),
+        "zerogpt": DetectorOutcome("ok", {"ai_likeliness": 0.5, "source": "zerogpt"}, 400.0),
+    }
+    return PipelineRun(text_pipeline.detectors, outcomes, 905.0)
+
+
+def _response(claims: int) -> TextAnalyzeResponse:
+    return text_response_from_run(_text_run(claims), 2048)
+
+
+def _history_rows(count: int) -> List[SimpleNamespace]:
+    """Объекты с атрибутами History (from_attributes читает их так же, как ORM-строки)."""
+    raw = _response(10).model_dump()
+    started = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    return [
+        SimpleNamespace(
+            id=uuid.uuid4(),
+            question=_sentence(60),
+            raw_response=raw,
+            created_at=started + timedelta(minutes=i),
+            kind="text",
+        )
+        for i in range(count)
+    ]
+
+
+# =====================================================================
+#                               Скоринг
+# =====================================================================
+
+
+@pytest.mark.parametrize("claims", CLAIM_COUNTS)
+def test_compute_trust_score(benchmark, claims):
+    evaluated = [ClaimEvaluation(**c) for c in _claims_raw(claims)]
+    result = benchmark(
+        compute_trust_score,
+        ai_likeliness=0.42,
+        manipulation_score=0.31,
+        emotion_intensity=0.57,
+        claims=evaluated,
+        dangerous_phrases=["kill them all", "you must act now"],
+    )
+    assert 0 <= result <= 100
+
+
+@pytest.mark.parametrize("anomalies", [0, 5, 30])
+def test_compute_image_trust_score(benchmark, anomalies):
+    result = benchmark(
+        compute_image_trust_score,
+        ai_likeliness=0.6,
+        manipulation_risk=0.2,
+        realism=0.9,
+        anomalies=[_sentence(5) for _ in range(anomalies)],
+        forensic_score=0.71,
+    )
+    assert 0 <= result <= 100
+
+
+@pytest.mark.parametrize("claims", CLAIM_COUNTS)
+def test_text_response_from_run(benchmark, claims):
+    run = _text_run(claims)
+    response = benchmark(text_response_from_run, run, 2048)
+    assert len(response.claims_evaluation) == claims
+
+
+# =====================================================================
+#                            Сериализация
+# =====================================================================
+
+
+@pytest.mark.parametrize("claims", CLAIM_COUNTS)
+def test_to_clean_dict(benchmark, claims):
+    evaluated = _response(claims).claims_evaluation
+    assert len(benchmark(to_clean_dict, evaluated)) == claims
+
+
+@pytest.mark.parametrize("claims", CLAIM_COUNTS)
+def test_text_response_to_dict(benchmark, claims):
+    # raw_response=ai_response.dict() при записи в history
+    response = _response(claims)
+    assert "usage" not in benchmark(response.model_dump)
+
+
+@pytest.mark.parametrize("claims", CLAIM_COUNTS)
+def test_text_response_to_json(benchmark, claims):
+    # Тело ответа /analyze-text
+    response = _response(claims)
+    assert json.loads(benchmark(response.model_dump_json))["trust_score"] == response.trust_score
+
+
+@pytest.mark.parametrize("page", HISTORY_PAGES)
+def test_history_page_serialization(benchmark, page):
+    # Как FastAPI отдаёт response_model=List[HistoryItem]: валидация из атрибутов + JSON
+    adapter = TypeAdapter(List[HistoryItem])
+    rows = _history_rows(page)
+
+    def serialize():
+        return adapter.dump_json(adapter.validate_python(rows, from_attributes=True))
+
+    assert len(json.loads(benchmark(serialize))) == page
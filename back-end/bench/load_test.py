@@ -0,0 +1,337 @@
+"""
+Нагрузочный прогон бэкенда: RPS, p50/p95/p99 по эндпоинтам и разбивка по этапам.
+
+Что нужно поднять заранее:
+1. Локальный Postgres (например, docker run -e POSTGRES_PASSWORD=bench -p 5432:5432 postgres:16)
+   и DB_* переменные для бэкенда.
+2. Заглушки внешних API: python stub_servers.py (или --mode replay с трейсом реальных вызовов).
+3. Бэкенд с переменными из вывода stub_servers.py:
+   uvicorn app.main:app --workers 4 --port 8000
+
+Драйвер регистрирует --users пользователей, затем для каждого уровня конкурентности
+гоняет смесь запросов /analyze-text, /analyze-image и /history заданное время.
+Разбивка по этапам берётся из /metrics бэкенда (разница гистограмм до и после уровня):
+внешние вызовы (upstream_request_duration_seconds), коммиты БД, время маршрутов на сервере.
+
+Тексты — реальные примеры из ddd/dataset_*.json (или --texts: .json-массив / .jsonl с полем text / .txt).
+--save-requests пишет фактическую последовательность запросов в JSONL, --replay-requests
+проигрывает её снова (тот же порядок и те же тексты — для сравнения двух версий).
+
+Примеры (из папки bench):
+    python load_test.py --concurrency 1,8,32 --duration 30
+    python load_test.py --mix analyze-text=1 --concurrency 64 --duration 60 --out results.json
+    python load_test.py --replay-requests traces/requests.jsonl --concurrency 16
+"""
+
+import argparse
+import itertools
+import json
+import math
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import requests
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+DEFAULT_TEXTS = [os.path.join(BACKEND_DIR, "ddd", "dataset_5000.json")]
+DEFAULT_IMAGE = os.path.join(BACKEND_DIR, "tests", "test_image.jpg")
+DEFAULT_MIX = "analyze-text=6,analyze-image=2,history=2"
+ENDPOINTS = ("analyze-text", "analyze-image", "history")
+
+# Гистограммы из app/services/telemetry.py, по которым строится разбивка по этапам
+STAGE_METRICS = (
+    "upstream_request_duration_seconds",
+    "db_commit_duration_seconds",
+    "http_request_duration_seconds",
+)
+
+_SAMPLE_RE = re.compile(r'^(\w+?)(_bucket|_sum|_count)(\{.*\})? (\S+)$')
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Перцентиль по ближайшему рангу (значения уже отсортированы)."""
+    if not sorted_values:
+        return float("nan")
+    index = max(0, min(len(sorted_values) - 1, math.ceil(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def load_texts(paths: List[str], limit: int) -> List[str]:
+    texts: List[str] = []
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            if path.endswith(".jsonl"):
+                texts.extend(json.loads(line)["text"] for line in f if line.strip())
+            elif path.endswith(".json"):
+                texts.extend(item["text"] for item in json.load(f))
+            else:
+                texts.extend(block.strip() for block in f.read().split("\n\n") if block.strip())
+        if len(texts) >= limit:
+            break
+    if not texts:
+        raise SystemExit("Нет текстов для /analyze-text: укажите --texts")
+    return texts[:limit]
+
+
+def parse_mix(spec: str) -> List[Tuple[str, float]]:
+    mix = []
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"Неизвестный эндпоинт {name!r}, доступны: {', '.join(ENDPOINTS)}")
+        mix.append((name, float(weight or 1)))
+    return mix
+
+
+# =====================================================================
+#                       Метрики бэкенда (/metrics)
+# =====================================================================
+
+
+def scrape_histograms(base_url: str) -> Optional[Dict[Tuple[str, str], Dict[str, Any]]]:
+    """{(метрика, метки без le): {"sum", "count", "buckets": {le: n}}} для STAGE_METRICS."""
+    try:
+        resp = requests.get(f"{base_url}/metrics", timeout=10)
+        resp.raise_for_status()
+    except requests.RequestException:
+        return None
+    series: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    for line in resp.text.splitlines():
+        match = _SAMPLE_RE.match(line)
+        if not match or match.group(1) not in STAGE_METRICS:
+            continue
+        name, suffix, labels, value = match.groups()
+        labels = labels or ""
+        le = None
+        if suffix == "_bucket":
+            le = re.search(r'le="([^"]+)"', labels).group(1)
+            labels = re.sub(r',?le="[^"]+"', "", labels).replace("{}", "")
+        entry = series.setdefault((name, labels), {"sum": 0.0, "count": 0, "buckets": {}})
+        if suffix == "_bucket":
+            entry["buckets"][le] = float(value)
+        else:
+            entry[suffix[1:]] = float(value)
+    return series
+
+
+def _bucket_quantile(buckets: List[Tuple[float, float]], count: float, q: float) -> float:
+    """Квантиль по кумулятивным бакетам (линейная интерполяция, как histogram_quantile)."""
+    rank = q * count
+    prev_upper, prev_count = 0.0, 0.0
+    for upper, cumulative in buckets:
+        if cumulative >= rank:
+            if upper == float("inf"):
+                return prev_upper
+            span = cumulative - prev_count
+            return prev_upper + (upper - prev_upper) * ((rank - prev_count) / span if span else 1.0)
+        prev_upper, prev_count = upper, cumulative
+    return prev_upper
+
+
+def stage_breakdown(before, after) -> List[Dict[str, Any]]:
+    """Разница гистограмм за прогон: число наблюдений, среднее и p95 по каждой серии, мс."""
+    rows = []
+    for key, end in sorted(after.items()):
+        start = before.get(key, {"sum": 0.0, "count": 0, "buckets": {}})
+        count = end["count"] - start["count"]
+        if count <= 0:
+            continue
+        buckets = sorted(
+            (float(le), n - start["buckets"].get(le, 0.0)) for le, n in end["buckets"].items()
+        )
+        rows.append({
+            "metric": key[0],
+            "labels": key[1],
+            "count": int(count),
+            "mean_ms": (end["sum"] - start["sum"]) / count * 1000,
+            "p95_ms": _bucket_quantile(buckets, count, 0.95) * 1000,
+        })
+    return rows
+
+
+# =====================================================================
+#                              Нагрузка
+# =====================================================================
+
+
+class RequestPlan:
+    """Бесконечная последовательность запросов: случайная по смеси или из сохранённого трейса."""
+
+    def __init__(self, mix, texts: List[str], replay: Optional[str] = None, seed: int = 0):
+        self._lock = threading.Lock()
+        if replay:
+            with open(replay, "r", encoding="utf-8") as f:
+                items = [json.loads(line) for line in f if line.strip()]
+            self._items: Iterator[Dict[str, Any]] = itertools.cycle(items)
+        else:
+            self._items = self._random(mix, texts, random.Random(seed))
+
+    @staticmethod
+    def _random(mix, texts, rng) -> Iterator[Dict[str, Any]]:
+        names, weights = zip(*mix)
+        while True:
+            name = rng.choices(names, weights)[0]
+            item: Dict[str, Any] = {"endpoint": name}
+            if name == "analyze-text":
+                item["content"] = rng.choice(texts)
+            yield item
+
+    def next(self) -> Dict[str, Any]:
+        with self._lock:
+            return next(self._items)
+
+
+def register_users(base_url: str, count: int) -> List[str]:
+    tokens = []
+    for _ in range(count):
+        username = f"bench-{uuid.uuid4().hex[:12]}@example.com"
+        resp = requests.post(f"{base_url}/register", json={"username": username, "password": "bench-password"}, timeout=30)
+        resp.raise_for_status()
+        tokens.append(resp.json()["access_token"])
+    return tokens
+
+
+def send(session: requests.Session, base_url: str, item: Dict[str, Any], image: bytes, timeout: float) -> int:
+    endpoint = item["endpoint"]
+    if endpoint == "analyze-text":
+        resp = session.post(f"{base_url}/analyze-text", json={"content": item["content"]}, timeout=timeout)
+    elif endpoint == "analyze-image":
+        files = {"file": ("bench.jpg", image, "image/jpeg")}
+        resp = session.post(f"{base_url}/analyze-image", files=files, timeout=timeout)
+    else:
+        resp = session.get(f"{base_url}/history", timeout=timeout)
+    resp.content  # дочитываем тело: время ответа включает передачу
+    return resp.status_code
+
+
+def run_level(base_url, concurrency, duration, plan, tokens, image, timeout, save_file=None) -> Dict[str, Any]:
+    """Держит concurrency параллельных клиентов (закрытая модель) duration секунд."""
+    results: List[Tuple[str, int, float]] = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(index: int) -> None:
+        session = requests.Session()
+        session.headers["Authorization"] = f"Bearer {tokens[index % len(tokens)]}"
+        local = []
+        while time.perf_counter() < deadline:
+            item = plan.next()
+            started = time.perf_counter()
+            try:
+                status = send(session, base_url, item, image, timeout)
+            except requests.RequestException:
+                status = 0
+            local.append((item["endpoint"], status, time.perf_counter() - started))
+            if save_file is not None:
+                with lock:
+                    save_file.write(json.dumps(item, ensure_ascii=False) + "\n")
+        with lock:
+            results.extend(local)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    by_endpoint: Dict[str, List[Tuple[int, float]]] = defaultdict(list)
+    for endpoint, status, latency in results:
+        by_endpoint[endpoint].append((status, latency))
+        by_endpoint["all"].append((status, latency))
+
+    endpoints = {}
+    for endpoint, rows in by_endpoint.items():
+        latencies = sorted(latency * 1000 for status, latency in rows if 200 <= status < 300)
+        endpoints[endpoint] = {
+            "requests": len(rows),
+            "errors": sum(1 for status, _ in rows if not 200 <= status < 300),
+            "rps": len(latencies) / elapsed,
+            "p50_ms": percentile(latencies, 50),
+            "p95_ms": percentile(latencies, 95),
+            "p99_ms": percentile(latencies, 99),
+        }
+    return {"concurrency": concurrency, "elapsed_s": elapsed, "endpoints": endpoints}
+
+
+def print_level(level: Dict[str, Any]) -> None:
+    print(f"\n=== concurrency {level['concurrency']} ({level['elapsed_s']:.1f}с) ===")
+    print(f"{'endpoint':<16}{'req':>8}{'err':>6}{'rps':>9}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}")
+    for name, row in sorted(level["endpoints"].items(), key=lambda kv: kv[0] == "all"):
+        print(
+            f"{name:<16}{row['requests']:>8}{row['errors']:>6}{row['rps']:>9.1f}"
+            f"{row['p50_ms']:>10.0f}{row['p95_ms']:>10.0f}{row['p99_ms']:>10.0f}"
+        )
+    if level.get("stages"):
+        print("  этапы (по /metrics бэкенда):")
+        for stage in level["stages"]:
+            print(
+                f"    {stage['metric']}{stage['labels']}: n={stage['count']} "
+                f"mean={stage['mean_ms']:.1f}мс p95≈{stage['p95_ms']:.1f}мс"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест /analyze-text, /analyze-image, /history")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--concurrency", default="1,8,32", help="Уровни конкурентности через запятую")
+    parser.add_argument("--duration", type=float, default=30, help="Секунд на уровень")
+    parser.add_argument("--warmup", type=float, default=5, help="Прогрев перед первым уровнем, сек")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX))
+    parser.add_argument("--texts", nargs="+", default=DEFAULT_TEXTS)
+    parser.add_argument("--max-texts", type=int, default=2000)
+    parser.add_argument("--image", default=DEFAULT_IMAGE)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save-requests", help="Записать последовательность запросов в JSONL")
+    parser.add_argument("--replay-requests", help="Проиграть последовательность запросов из JSONL")
+    parser.add_argument("--out", help="Сохранить результаты в JSON")
+    args = parser.parse_args()
+
+    base_url = args.base_url.rstrip("/")
+    levels = [int(c) for c in args.concurrency.split(",")]
+    texts = [] if args.replay_requests else load_texts(args.texts, args.max_texts)
+    with open(args.image, "rb") as f:
+        image = f.read()
+
+    tokens = register_users(base_url, args.users)
+    print(f"Зарегистрировано пользователей: {len(tokens)}")
+    plan = RequestPlan(args.mix, texts, args.replay_requests, args.seed)
+
+    if args.warmup > 0:
+        run_level(base_url, min(levels), args.warmup, plan, tokens, image, args.timeout)
+
+    save_file = open(args.save_requests, "w", encoding="utf-8") if args.save_requests else None
+    report = []
+    try:
+        for concurrency in levels:
+            before = scrape_histograms(base_url)
+            level = run_level(base_url, concurrency, args.duration, plan, tokens, image, args.timeout, save_file)
+            after = scrape_histograms(base_url)
+            # С --workers > 1 /metrics отдаёт один процесс — разбивка будет по его доле запросов
+            level["stages"] = stage_breakdown(before, after) if before is not None and after is not None else []
+            print_level(level)
+            report.append(level)
+    finally:
+        if save_file is not None:
+            save_file.close()
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"base_url": base_url, "mix": args.mix, "levels": report}, f, ensure_ascii=False, indent=2)
+        print(f"\n✅ Результаты сохранены в {args.out}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
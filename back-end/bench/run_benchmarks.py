@@ -0,0 +1,60 @@
+"""
+Запуск микробенчмарков (bench_hot_paths.py) со сравнением с базовыми замерами.
+
+Базовые замеры лежат в bench/baselines/<машина>/ (формат pytest-benchmark) и коммитятся
+в репозиторий. Сравнение идёт с последним сохранённым замером; прогон падает, если медиана
+времени любого бенчмарка выросла больше порога (медиана устойчивее среднего к шуму).
+Замеры сопоставимы только на одной машине: для CI базу нужно сохранить на том же раннере.
+
+Нужен pytest-benchmark (pip install pytest-benchmark).
+
+Примеры (из папки back-end):
+    python bench/run_benchmarks.py                    # сравнить с базой, порог 20%
+    python bench/run_benchmarks.py --threshold 10
+    python bench/run_benchmarks.py --save             # обновить базу после осознанного изменения
+    python bench/run_benchmarks.py -- -k history      # дополнительные аргументы pytest после --
+"""
+
+import argparse
+import glob
+import os
+import sys
+
+import pytest
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+BASELINE_DIR = os.path.join(BENCH_DIR, "baselines")
+DEFAULT_THRESHOLD = 20.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Микробенчмарки горячего пути с порогом регрессии")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Допустимый рост медианы времени, %%")
+    parser.add_argument("--save", action="store_true", help="Сохранить замер как новую базу")
+    parser.add_argument("pytest_args", nargs="*", help="Аргументы pytest (после --)")
+    args = parser.parse_args()
+
+    os.chdir(BACKEND_DIR)
+    sys.path.insert(0, BACKEND_DIR)
+    pytest_args = [
+        os.path.join(BENCH_DIR, "bench_hot_paths.py"),
+        "-q",
+        "-p", "no:cacheprovider",
+        f"--benchmark-storage=file://{BASELINE_DIR}",
+        "--benchmark-disable-gc",
+        "--benchmark-sort=name",
+        "--benchmark-columns=min,mean,median,ops,rounds",
+    ]
+    if args.save:
+        pytest_args.append("--benchmark-autosave")
+    elif glob.glob(os.path.join(BASELINE_DIR, "*", "*.json")):
+        pytest_args += ["--benchmark-compare", f"--benchmark-compare-fail=median:{args.threshold:g}%"]
+    else:
+        print("⚠️ Базовых замеров нет — только замер (сохраните базу: --save)")
+    return pytest.main(pytest_args + args.pytest_args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
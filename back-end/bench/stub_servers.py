@@ -0,0 +1,417 @@
+"""
+Локальные заглушки внешних API для нагрузочного тестирования (без расхода кредитов).
+
+Один HTTP-сервер отвечает по трём протоколам:
+- OpenAI chat.completions  — POST /v1/chat/completions (JSON для текста или Vision, usage с токенами);
+- ZeroGPT detectText       — POST /api/detect/detectText;
+- HuggingFace inference    — POST /models/<имя модели>.
+
+У каждого сервиса своя задержка (распределение), доля ошибок и размер ответа.
+Задержка задаётся строкой:
+    const:50              — всегда 50 мс
+    uniform:20-80         — равномерно от 20 до 80 мс
+    lognormal:800,0.4     — логнормальное, медиана 800 мс, sigma 0.4 (похоже на реальный LLM)
+
+Режимы:
+    stub    — синтетические ответы (по умолчанию);
+    record  — прокси к настоящим API: ответы и задержки пишутся в JSONL-трейс;
+    replay  — ответы и задержки из трейса (по кругу для каждого сервиса).
+
+Запуск (из папки bench):
+    python stub_servers.py --port 9100 --openai-latency lognormal:800,0.4 --openai-error-rate 0.02
+    python stub_servers.py --mode record --trace traces/real.jsonl
+    python stub_servers.py --mode replay --trace traces/real.jsonl --time-scale 0.5
+
+Бэкенд направляется на заглушки переменными окружения (сервер печатает их при старте):
+    OPENAI_BASE_URL=http://127.0.0.1:9100/v1
+    ZEROGPT_ENDPOINT=http://127.0.0.1:9100/api/detect/detectText
+    HF_IMAGE_MODEL_URL=http://127.0.0.1:9100/models/stub
+Для ZeroGPT и HF ключи ZEROGPT_API_KEY / HF_API_KEY должны быть заданы (любое значение),
+иначе ai_service эти вызовы пропускает.
+"""
+
+import argparse
+import itertools
+import json
+import math
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+import requests
+
+# Настоящие адреса — для режима record
+REAL_UPSTREAMS = {
+    "openai": "https://api.openai.com",
+    "zerogpt": "https://api.zerogpt.com",
+    "hf": "https://api-inference.huggingface.co",
+}
+
+# Заголовки, которые не проксируются (их выставляет HTTP-стек)
+HOP_HEADERS = {"host", "content-length", "connection", "accept-encoding", "transfer-encoding"}
+
+
+class LatencyModel:
+    """Распределение задержки ответа, секунды."""
+
+    def __init__(self, spec: str):
+        self.spec = spec
+        kind, _, params = spec.partition(":")
+        try:
+            if kind == "const":
+                value = float(params) / 1000
+                self._sample = lambda rng: value
+            elif kind == "uniform":
+                low, high = (float(x) / 1000 for x in params.split("-"))
+                self._sample = lambda rng: rng.uniform(low, high)
+            elif kind == "lognormal":
+                median, sigma = (float(x) for x in params.split(","))
+                mu = math.log(median / 1000)
+                self._sample = lambda rng: rng.lognormvariate(mu, sigma)
+            else:
+                raise ValueError(kind)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"Неверное распределение задержки: {spec!r}")
+
+    def sample(self, rng: random.Random) -> float:
+        return self._sample(rng)
+
+
+class ServiceConfig:
+    def __init__(self, latency: LatencyModel, error_rate: float = 0.0, response_size: int = 0):
+        self.latency = latency
+        self.error_rate = error_rate
+        # Сколько символов добавить в текстовые поля ответа (проверка влияния размера ответа)
+        self.response_size = response_size
+
+
+# =====================================================================
+#                        Синтетические ответы
+# =====================================================================
+
+
+def _filler(rng: random.Random, size: int) -> str:
+    if size <= 0:
+        return ""
+    words = ("claim", "source", "context", "tone", "evidence", "style", "pattern", "signal")
+    text = " ".join(rng.choice(words) for _ in range(size // 6 + 1))
+    return " " + text[:size]
+
+
+def _is_vision_request(body: Dict[str, Any]) -> bool:
+    for message in body.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, list) and any(part.get("type") == "image_url" for part in content):
+            return True
+    return False
+
+
+def openai_response(body: Dict[str, Any], config: ServiceConfig, rng: random.Random) -> Dict[str, Any]:
+    """Ответ в формате chat.completion; content — JSON той структуры, что просит ai_service."""
+    filler = _filler(rng, config.response_size)
+    if _is_vision_request(body):
+        content = {
+            "ai_likeliness": round(rng.random(), 3),
+            "manipulation_risk": round(rng.random() * 0.6, 3),
+            "realism": round(0.5 + rng.random() * 0.5, 3),
+            "anomalies": rng.sample(["hands", "shadows", "text artifacts", "reflections"], k=rng.randint(0, 2)),
+            "summary": "Stub image analysis." + filler,
+        }
+    else:
+        content = {
+            "ai_likeliness": round(rng.random(), 3),
+            "manipulation_score": round(rng.random() * 0.7, 3),
+            "emotion_intensity": round(rng.random() * 0.8, 3),
+            "dangerous_phrases": [],
+            "claims_evaluation": [
+                {"text": "Stub claim", "true_likeliness": round(rng.random(), 3), "comment": "stub" + filler},
+            ],
+            "summary": "Stub text analysis." + filler,
+        }
+    raw = json.dumps(content, ensure_ascii=False)
+    # ~4 символа на токен; картинка в data URL считается как фиксированные 765 токенов (high detail)
+    prompt_text = "".join(
+        m["content"] if isinstance(m.get("content"), str) else json.dumps(m.get("content"))[:2000]
+        for m in body.get("messages", [])
+    )
+    prompt_tokens = len(prompt_text) // 4 + (765 if _is_vision_request(body) else 0)
+    return {
+        "id": f"chatcmpl-stub-{rng.getrandbits(48):x}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "gpt-4.1-mini"),
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": raw},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(raw) // 4,
+            "total_tokens": prompt_tokens + len(raw) // 4,
+            # Системный промпт одинаковый — OpenAI кеширует префикс блоками по 128 токенов
+            "prompt_tokens_details": {"cached_tokens": (prompt_tokens // 2) // 128 * 128},
+        },
+    }
+
+
+def zerogpt_response(config: ServiceConfig, rng: random.Random) -> Dict[str, Any]:
+    return {
+        "success": True,
+        "code": 200,
+        "message": "detection complete",
+        "data": {
+            "fakePercentage": round(rng.random() * 100, 2),
+            "isHuman": rng.randint(0, 100),
+            "feedback": "Stub" + _filler(rng, config.response_size),
+        },
+    }
+
+
+def hf_response(rng: random.Random) -> List[Dict[str, Any]]:
+    fake = round(rng.random(), 4)
+    return [{"label": "fake", "score": fake}, {"label": "real", "score": round(1 - fake, 4)}]
+
+
+# =====================================================================
+#                              Трейсы
+# =====================================================================
+
+
+class TraceWriter:
+    """JSONL: одна строка на вызов внешнего API (сервис, путь, статус, задержка, тело ответа)."""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def write(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+
+class TraceReplayer:
+    """Отдаёт записанные ответы по кругу, отдельно для каждого сервиса."""
+
+    def __init__(self, path: str):
+        by_service: Dict[str, List[Dict[str, Any]]] = {}
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    by_service.setdefault(record["service"], []).append(record)
+        if not by_service:
+            raise SystemExit(f"Трейс {path} пуст")
+        self._cycles = {service: itertools.cycle(records) for service, records in by_service.items()}
+        self.counts = {service: len(records) for service, records in by_service.items()}
+        self._lock = threading.Lock()
+
+    def next(self, service: str) -> Optional[Dict[str, Any]]:
+        cycle = self._cycles.get(service)
+        if cycle is None:
+            return None
+        with self._lock:
+            return next(cycle)
+
+
+# =====================================================================
+#                              Сервер
+# =====================================================================
+
+
+def trace_key(service: str, raw_body: bytes) -> str:
+    """Ключ трейса: вызовы Vision и текстовые вызовы OpenAI проигрываются раздельно."""
+    if service == "openai":
+        try:
+            if _is_vision_request(json.loads(raw_body or b"{}")):
+                return "openai_vision"
+        except ValueError:
+            pass
+    return service
+
+
+def service_for_path(path: str) -> Optional[str]:
+    if path.endswith("/chat/completions"):
+        return "openai"
+    if path.endswith("/detectText"):
+        return "zerogpt"
+    if path.startswith("/models/"):
+        return "hf"
+    return None
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive: клиенты бэкенда переиспользуют соединения
+
+    # Выставляются в make_server
+    mode = "stub"
+    configs: Dict[str, ServiceConfig] = {}
+    upstreams: Dict[str, str] = REAL_UPSTREAMS
+    trace_writer: Optional[TraceWriter] = None
+    replayer: Optional[TraceReplayer] = None
+    time_scale = 1.0
+    _local = threading.local()
+
+    def log_message(self, format, *args):  # noqa: A002 — сигнатура BaseHTTPRequestHandler
+        pass
+
+    @property
+    def rng(self) -> random.Random:
+        rng = getattr(self._local, "rng", None)
+        if rng is None:
+            rng = self._local.rng = random.Random()
+        return rng
+
+    def _send_json(self, status: int, payload: Any, content: Optional[bytes] = None) -> None:
+        body = content if content is not None else json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok", "mode": self.mode})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw_body = self.rfile.read(length)
+        service = service_for_path(self.path)
+        if service is None:
+            self._send_json(404, {"error": f"no stub for {self.path}"})
+            return
+        if self.mode == "record":
+            self._record(service, raw_body)
+        elif self.mode == "replay":
+            self._replay(trace_key(service, raw_body))
+        else:
+            self._stub(service, raw_body)
+
+    def _stub(self, service: str, raw_body: bytes) -> None:
+        config, rng = self.configs[service], self.rng
+        time.sleep(config.latency.sample(rng))
+        if rng.random() < config.error_rate:
+            # 429 и 5xx — то, что реально приходит от провайдеров под нагрузкой
+            status = rng.choice((429, 500, 503))
+            self._send_json(status, {"error": {"message": "stub error", "type": "server_error"}})
+            return
+        if service == "openai":
+            self._send_json(200, openai_response(json.loads(raw_body or b"{}"), config, rng))
+        elif service == "zerogpt":
+            self._send_json(200, zerogpt_response(config, rng))
+        else:
+            self._send_json(200, hf_response(rng))
+
+    def _record(self, service: str, raw_body: bytes) -> None:
+        headers = {k: v for k, v in self.headers.items() if k.lower() not in HOP_HEADERS}
+        started = time.perf_counter()
+        try:
+            resp = requests.post(self.upstreams[service] + self.path, data=raw_body, headers=headers, timeout=120)
+            status, content = resp.status_code, resp.content
+        except requests.RequestException as e:
+            status, content = 502, json.dumps({"error": str(e)}).encode("utf-8")
+        latency_ms = (time.perf_counter() - started) * 1000
+        self.trace_writer.write({
+            "service": trace_key(service, raw_body),
+            "path": self.path,
+            "status": status,
+            "latency_ms": round(latency_ms, 1),
+            "request_bytes": len(raw_body),
+            "body": content.decode("utf-8", errors="replace"),
+        })
+        self._send_json(status, None, content)
+
+    def _replay(self, service: str) -> None:
+        record = self.replayer.next(service)
+        if record is None:
+            self._send_json(503, {"error": f"trace has no {service} calls"})
+            return
+        time.sleep(record["latency_ms"] / 1000 * self.time_scale)
+        self._send_json(record["status"], None, record["body"].encode("utf-8"))
+
+
+def make_server(host: str, port: int, handler_attrs: Dict[str, Any]) -> ThreadingHTTPServer:
+    handler = type("ConfiguredStubHandler", (StubHandler,), handler_attrs)
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def backend_env(host: str, port: int) -> Dict[str, str]:
+    """Переменные окружения, направляющие ai_service на заглушки."""
+    base = f"http://{host}:{port}"
+    return {
+        "OPENAI_BASE_URL": f"{base}/v1",
+        "ZEROGPT_ENDPOINT": f"{base}/api/detect/detectText",
+        "HF_IMAGE_MODEL_URL": f"{base}/models/stub",
+    }
+
+
+def _service_args(parser: argparse.ArgumentParser, name: str, latency: str) -> None:
+    parser.add_argument(f"--{name}-latency", type=LatencyModel, default=LatencyModel(latency))
+    parser.add_argument(f"--{name}-error-rate", type=float, default=0.0)
+    parser.add_argument(f"--{name}-response-size", type=int, default=0,
+                        help="Сколько символов добавить в текстовые поля ответа")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Заглушки OpenAI / ZeroGPT / HuggingFace для нагрузочных тестов")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--mode", choices=("stub", "record", "replay"), default="stub")
+    parser.add_argument("--trace", help="JSONL-трейс: куда писать (record) или откуда читать (replay)")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="Множитель записанных задержек (replay)")
+    _service_args(parser, "openai", "lognormal:900,0.35")
+    _service_args(parser, "zerogpt", "lognormal:400,0.3")
+    _service_args(parser, "hf", "lognormal:600,0.5")
+    for service, url in REAL_UPSTREAMS.items():
+        parser.add_argument(f"--upstream-{service}", default=url, help="Настоящий API для режима record")
+    args = parser.parse_args()
+
+    if args.mode != "stub" and not args.trace:
+        parser.error("--trace обязателен для режимов record и replay")
+
+    attrs: Dict[str, Any] = {
+        "mode": args.mode,
+        "configs": {
+            service: ServiceConfig(
+                getattr(args, f"{service}_latency"),
+                getattr(args, f"{service}_error_rate"),
+                getattr(args, f"{service}_response_size"),
+            )
+            for service in REAL_UPSTREAMS
+        },
+        "upstreams": {service: getattr(args, f"upstream_{service}").rstrip("/") for service in REAL_UPSTREAMS},
+        "time_scale": args.time_scale,
+    }
+    if args.mode == "record":
+        attrs["trace_writer"] = TraceWriter(args.trace)
+    elif args.mode == "replay":
+        attrs["replayer"] = TraceReplayer(args.trace)
+        print(f"Трейс: {attrs['replayer'].counts}")
+
+    server = make_server(args.host, args.port, attrs)
+    print(f"Заглушки ({args.mode}) слушают http://{args.host}:{args.port}")
+    for key, value in backend_env(args.host, args.port).items():
+        print(f"  export {key}={value}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
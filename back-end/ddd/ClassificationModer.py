@@ -1,6 +1,7 @@
 import json
 import os
 import random
+import sys
 
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.linear_model import LogisticRegression
@@ -11,6 +12,7 @@ import joblib
 
 DATA_PATHS = ["dataset_5000.json", "dataset_10000.json"]
 MODEL_PATH = "sentiment_tfidf_logreg.joblib"
+ONNX_MODEL_PATH = "sentiment_tfidf_logreg.onnx"
 
 # ===== 1. Загружаем данные =====
 data = []
@@ -69,3 +71,16 @@ print(classification_report(test_labels, test_preds))
 # ===== 7. Сохранение =====
 joblib.dump(pipeline, MODEL_PATH)
 print(f"\n✅ Модель сохранена в {MODEL_PATH}")
+
+# ===== 8. Экспорт в ONNX (для onnxruntime в API) =====
+# Нужны skl2onnx и onnxruntime; без них остаётся только joblib-артефакт
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+try:
+    from app.services.onnx_text_model import OnnxTextModel, export_to_onnx
+
+    export_to_onnx(pipeline, ONNX_MODEL_PATH)
+    onnx_model = OnnxTextModel(ONNX_MODEL_PATH)
+    diff = abs(onnx_model.predict_proba(test_texts) - pipeline.predict_proba(test_texts)).max()
+    print(f"✅ ONNX-модель сохранена в {ONNX_MODEL_PATH} (макс. расхождение с sklearn: {diff:.2e})")
+except ImportError as e:
+    print(f"⚠️ Экспорт в ONNX пропущен: {e}")
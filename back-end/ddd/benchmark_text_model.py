@@ -0,0 +1,89 @@
+"""
+Сравнение backend'ов текстовой модели: joblib (sklearn Pipeline) и ONNX (onnxruntime).
+
+Меряем:
+- время загрузки артефакта;
+- задержку одного предсказания (p50 / p95);
+- пропускную способность на батчах.
+
+Запуск (после ClassificationModer.py, из папки ddd):
+    python benchmark_text_model.py
+    python benchmark_text_model.py --joblib model.joblib --onnx model.onnx --batch-size 256
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app.services.text_classifier_service import load_text_model  # noqa: E402
+
+
+def load_texts(paths, limit):
+    texts = []
+    for path in paths:
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                texts.extend(item["text"] for item in json.load(f))
+    return texts[:limit]
+
+
+def bench(path, texts, single_calls, batch_size, repeats):
+    started = time.perf_counter()
+    model = load_text_model(path)
+    load_ms = (time.perf_counter() - started) * 1000
+
+    model.predict_proba(texts[:1])  # прогрев
+
+    latencies = []
+    for text in texts[:single_calls]:
+        t0 = time.perf_counter()
+        model.predict_proba([text])
+        latencies.append((time.perf_counter() - t0) * 1000)
+    latencies.sort()
+
+    rows = 0
+    t0 = time.perf_counter()
+    for _ in range(repeats):
+        for i in range(0, len(texts), batch_size):
+            rows += len(model.predict_proba(texts[i:i + batch_size]))
+    throughput = rows / (time.perf_counter() - t0)
+
+    return {
+        "size_kb": os.path.getsize(path) / 1024,
+        "load_ms": load_ms,
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1],
+        "rows_per_s": throughput,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк joblib vs ONNX")
+    parser.add_argument("--joblib", default="sentiment_tfidf_logreg.joblib")
+    parser.add_argument("--onnx", default="sentiment_tfidf_logreg.onnx")
+    parser.add_argument("--data", nargs="+", default=["dataset_5000.json", "dataset_10000.json"])
+    parser.add_argument("--limit", type=int, default=10000)
+    parser.add_argument("--single-calls", type=int, default=500)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    texts = load_texts(args.data, args.limit)
+    print(f"Текстов: {len(texts)}, батч: {args.batch_size}\n")
+    print(f"{'backend':<8} {'size, KB':>10} {'load, ms':>10} {'p50, ms':>9} {'p95, ms':>9} {'rows/s':>12}")
+    for name, path in (("joblib", args.joblib), ("onnx", args.onnx)):
+        if not os.path.exists(path):
+            print(f"{name:<8} ⚠️ файл {path} не найден")
+            continue
+        r = bench(path, texts, args.single_calls, args.batch_size, args.repeats)
+        print(f"{name:<8} {r['size_kb']:>10.0f} {r['load_ms']:>10.1f} {r['p50_ms']:>9.3f} "
+              f"{r['p95_ms']:>9.3f} {r['rows_per_s']:>12,.0f}")
+
+
+if __name__ == "__main__":
+    main()
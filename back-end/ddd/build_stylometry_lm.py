@@ -0,0 +1,105 @@
+"""
+Сборка стилометрической модели для app/services/stylometry.py.
+
+Символьная n-граммная модель (хешированные счётчики, фиксированный размер)
++ средние/СКО стилометрических признаков. Корпус — тексты, написанные людьми:
+перплексия и burstiness сгенерированного текста сравниваются с ними.
+
+Опорная статистика считается по отложенной части корпуса (--holdout-percent), которую
+модель не видела при обучении: на собственных обучающих текстах перплексия занижена,
+и с такой опорой любой текст выглядел бы «слишком непредсказуемым», то есть человеческим.
+
+Нужны длинные тексты (не короче STYLOMETRY_MIN_WORDS = 25 слов, лучше сотни слов
+в несколько предложений). dataset_*.json для этого не годятся — там короткие отзывы,
+и сборка на них завершится ошибкой. Подходит, например, дамп Википедии до 2022 года
+(ru, en, sk — тексты заведомо написаны людьми), разобранный WikiExtractor в JSONL:
+    python -m wikiextractor.WikiExtractor ruwiki-20211201-pages-articles.xml.bz2 --json -o wiki_ru
+    python build_stylometry_lm.py --jsonl "wiki_ru/*/wiki_*"
+
+Примеры (из папки ddd):
+    python build_stylometry_lm.py --jsonl "wiki_*/*/wiki_*" --order 4
+    python build_stylometry_lm.py --jsonl corpus/*.jsonl --label REAL --holdout-percent 20
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from typing import Iterable, Iterator, Optional, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app.services.stylometry import (  # noqa: E402
+    DEFAULT_BUCKETS,
+    DEFAULT_ORDER,
+    FEATURE_WEIGHTS,
+    STYLOMETRY_MIN_WORDS,
+    NgramLanguageModel,
+    reference_stats,
+)
+from stream_train import is_holdout, iter_json_arrays  # noqa: E402
+
+OUT_PATH = "stylometry_lm.npz"
+
+
+def iter_jsonl_texts(paths: Iterable[str]) -> Iterator[Tuple[str, Optional[str]]]:
+    """JSONL с полем text; label необязателен (в выгрузке WikiExtractor его нет)."""
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                item = json.loads(line)
+                yield item["text"], item.get("label")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сборка n-граммной модели для стилометрии")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--jsonl", nargs="+", help="JSONL-файлы (поддерживаются glob-маски)")
+    source.add_argument("--json", nargs="+", help="JSON-массивы (dataset_*.json)")
+    parser.add_argument("--label", help="Брать только строки с этой меткой (например, только человеческие тексты)")
+    parser.add_argument("--order", type=int, default=DEFAULT_ORDER)
+    parser.add_argument("--buckets", type=int, default=DEFAULT_BUCKETS)
+    parser.add_argument("--holdout-percent", type=int, default=10,
+                        help="Доля текстов (%%) для опорной статистики; в обучение модели они не идут")
+    parser.add_argument("--out", default=OUT_PATH)
+    args = parser.parse_args()
+
+    if args.jsonl:
+        paths = [p for pattern in args.jsonl for p in sorted(glob.glob(pattern))]
+        make_rows = lambda: iter_jsonl_texts(paths)
+    else:
+        make_rows = lambda: iter_json_arrays(args.json)
+
+    def texts(holdout: bool):
+        for index, (text, label) in enumerate(make_rows()):
+            if (args.label is None or label == args.label) and is_holdout(index, args.holdout_percent) == holdout:
+                yield text
+
+    started = time.perf_counter()
+    model = NgramLanguageModel.fit(texts(holdout=False), order=args.order, buckets=args.buckets)
+    print(f"Модель: порядок {model.order}, {model.total} символов, алфавит {model.vocab_size} "
+          f"({time.perf_counter() - started:.1f}с)")
+
+    stats = reference_stats(model, texts(holdout=True))
+    for name, mean, std in zip(stats["feature_names"], stats["feature_mean"], stats["feature_std"]):
+        print(f"  {name}: {mean:.3f} ± {std:.3f}")
+    # Без опоры по перплексии скорер молча обходился бы константами DEFAULT_REFERENCE
+    missing = [name for name in FEATURE_WEIGHTS if name not in set(stats["feature_names"].tolist())]
+    if missing:
+        raise SystemExit(
+            f"❌ Опорная статистика не посчитана для {', '.join(missing)}: в отложенной части мало текстов "
+            f"длиннее {STYLOMETRY_MIN_WORDS} слов из нескольких предложений. Нужен корпус длинных "
+            f"человеческих текстов (см. описание в начале скрипта). Модель не сохранена."
+        )
+
+    model.save(args.out, **stats)
+    print(f"✅ Модель сохранена в {args.out} ({os.path.getsize(args.out) / 1e6:.1f} МБ)")
+
+
+if __name__ == "__main__":
+    main()
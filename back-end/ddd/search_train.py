@@ -0,0 +1,255 @@
+"""
+Подбор гиперпараметров TF-IDF + LogisticRegression с кешированием признаков.
+
+- Векторизация кешируется на диске (joblib.Memory): ключ — хеш данных + параметры
+  векторизатора. Смена C или другого параметра классификатора не требует повторной
+  токенизации, а матрицы читаются из кеша через mmap.
+- Конфигурации обучаются параллельно на всех ядрах (joblib.Parallel).
+- --halving: successive halving — все конфигурации стартуют на малой доле данных,
+  дальше проходит лучшая 1/eta, и так до полного train.
+- Итог — таблица лидеров (leaderboard.csv) со временем обучения и метриками.
+
+Примеры (из папки ddd):
+    python search_train.py
+    python search_train.py --halving --eta 3 --save-best
+"""
+
+import argparse
+import csv
+import hashlib
+import itertools
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List, Sequence, Tuple
+
+import joblib
+from joblib import Memory, Parallel, delayed
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import accuracy_score, f1_score
+from sklearn.model_selection import train_test_split
+from sklearn.pipeline import Pipeline
+
+DATA_PATHS = ["dataset_5000.json", "dataset_10000.json"]
+CACHE_DIR = os.getenv("DDD_FEATURE_CACHE", ".feature_cache")
+LEADERBOARD_PATH = "leaderboard.csv"
+MODEL_PATH = "sentiment_tfidf_logreg.joblib"
+ONNX_MODEL_PATH = "sentiment_tfidf_logreg.onnx"
+
+# Сетка: параметры векторизатора (кешируются) × параметры классификатора (дешёвые)
+VECTORIZER_GRID = {
+    "ngram_range": [(1, 1), (1, 2)],
+    "max_features": [50000, 100000],
+    "sublinear_tf": [True],
+    "min_df": [1, 2],
+}
+CLASSIFIER_GRID = {
+    "C": [0.5, 1.0, 2.0, 4.0],
+}
+
+# mmap_mode='r': повторные чтения матриц из кеша не копируют их в память
+memory = Memory(CACHE_DIR, mmap_mode="r", verbose=0)
+
+
+# ===== 1. Данные =====
+
+def load_data(paths: Sequence[str]) -> Tuple[List[str], List[str]]:
+    texts, labels = [], []
+    for path in paths:
+        if not os.path.exists(path):
+            print(f"⚠️ Файл {path} не найден, пропускаю")
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            for item in json.load(f):
+                texts.append(item["text"])
+                labels.append(item["label"])
+    return texts, labels
+
+
+def data_hash(texts: Sequence[str], labels: Sequence[str]) -> str:
+    digest = hashlib.sha256()
+    for text, label in zip(texts, labels):
+        digest.update(text.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(label.encode("utf-8"))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+def grid(spec: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+    keys = list(spec)
+    return [dict(zip(keys, values)) for values in itertools.product(*(spec[k] for k in keys))]
+
+
+# ===== 2. Кеш признаков =====
+
+@memory.cache(ignore=["train_texts", "val_texts"])
+def vectorize(dataset_key: str, vec_params: Dict[str, Any], train_texts: List[str], val_texts: List[str]):
+    """
+    Обучает TF-IDF и возвращает (X_train, X_val, vectorizer).
+    Тексты в ключ кеша не входят (их заменяет dataset_key), иначе joblib
+    хешировал бы весь датасет на каждом вызове.
+    """
+    vectorizer = TfidfVectorizer(**vec_params)
+    X_train = vectorizer.fit_transform(train_texts)
+    X_val = vectorizer.transform(val_texts)
+    return X_train, X_val, vectorizer
+
+
+def load_features(dataset_key: str, vec_params: Dict[str, Any]):
+    """Достаёт уже посчитанные матрицы из кеша (main() заполняет его до обучения)."""
+    if not vectorize.check_call_in_cache(dataset_key, vec_params, None, None):
+        raise RuntimeError(f"Признаки для {vec_params} не посчитаны")
+    return vectorize(dataset_key, vec_params, None, None)
+
+
+# ===== 3. Обучение одной конфигурации =====
+
+def fit_one(
+    dataset_key: str,
+    vec_params: Dict[str, Any],
+    clf_params: Dict[str, Any],
+    y_train: Sequence[str],
+    y_val: Sequence[str],
+    train_rows: int,
+) -> Dict[str, Any]:
+    X_train, X_val, _ = load_features(dataset_key, vec_params)
+    clf = LogisticRegression(max_iter=500, **clf_params)
+    started = time.perf_counter()
+    clf.fit(X_train[:train_rows], list(y_train[:train_rows]))
+    fit_seconds = time.perf_counter() - started
+    preds = clf.predict(X_val)
+    return {
+        "vec_params": vec_params,
+        "clf_params": clf_params,
+        "train_rows": train_rows,
+        "fit_seconds": fit_seconds,
+        "accuracy": accuracy_score(y_val, preds),
+        "f1_macro": f1_score(y_val, preds, average="macro"),
+    }
+
+
+def run_round(dataset_key, configs, y_train, y_val, train_rows, n_jobs) -> List[Dict[str, Any]]:
+    results = Parallel(n_jobs=n_jobs)(
+        delayed(fit_one)(dataset_key, vec_params, clf_params, y_train, y_val, train_rows)
+        for vec_params, clf_params in configs
+    )
+    return sorted(results, key=lambda r: (-r["f1_macro"], r["fit_seconds"]))
+
+
+def successive_halving(dataset_key, configs, y_train, y_val, n_jobs, eta=3, min_rows=500):
+    """Каждый раунд: лучшая 1/eta конфигураций получает в eta раз больше строк."""
+    n_rounds = 0
+    while len(configs) // (eta ** n_rounds) > 1:
+        n_rounds += 1
+    rows = max(min_rows, len(y_train) // (eta ** n_rounds))
+    history: List[Dict[str, Any]] = []
+    while True:
+        rows = min(rows, len(y_train))
+        results = run_round(dataset_key, configs, y_train, y_val, rows, n_jobs)
+        history.extend(results)
+        print(f"  раунд: {len(configs)} конфигураций на {rows} строках, лучший f1={results[0]['f1_macro']:.4f}")
+        if len(results) == 1 or rows == len(y_train):
+            return results, history
+        keep = max(1, len(results) // eta)
+        configs = [(r["vec_params"], r["clf_params"]) for r in results[:keep]]
+        rows *= eta
+
+
+def write_leaderboard(results: List[Dict[str, Any]], path: str) -> None:
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["rank", "vectorizer", "classifier", "train_rows", "fit_seconds", "accuracy", "f1_macro"])
+        for rank, r in enumerate(results, start=1):
+            writer.writerow([
+                rank,
+                json.dumps(r["vec_params"]),
+                json.dumps(r["clf_params"]),
+                r["train_rows"],
+                f"{r['fit_seconds']:.3f}",
+                f"{r['accuracy']:.4f}",
+                f"{r['f1_macro']:.4f}",
+            ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Поиск гиперпараметров с кешем признаков")
+    parser.add_argument("--data", nargs="+", default=DATA_PATHS)
+    parser.add_argument("--n-jobs", type=int, default=-1)
+    parser.add_argument("--halving", action="store_true", help="successive halving вместо полной сетки")
+    parser.add_argument("--eta", type=int, default=3)
+    parser.add_argument("--leaderboard", default=LEADERBOARD_PATH)
+    parser.add_argument("--save-best", action="store_true", help=f"переобучить лучшую конфигурацию в {MODEL_PATH} и {ONNX_MODEL_PATH}")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    texts, labels = load_data(args.data)
+    # Тот же сплит, что в ClassificationModer.py (80% train, 10% validation)
+    train_texts, temp_texts, y_train, temp_labels = train_test_split(
+        texts, labels, test_size=0.2, random_state=42, shuffle=True
+    )
+    val_texts, _, y_val, _ = train_test_split(temp_texts, temp_labels, test_size=0.5, random_state=42, shuffle=True)
+    dataset_key = data_hash(train_texts + val_texts, y_train + y_val)
+    print(f"Train: {len(train_texts)}, Validation: {len(val_texts)}, данные {dataset_key[:12]}")
+
+    # Векторизация: из кеша либо один раз на каждый набор параметров
+    vec_configs = grid(VECTORIZER_GRID)
+    Parallel(n_jobs=args.n_jobs)(
+        delayed(vectorize)(dataset_key, vec_params, train_texts, val_texts) for vec_params in vec_configs
+    )
+    print(f"Признаки готовы за {time.perf_counter() - started:.1f}с ({len(vec_configs)} векторизаторов)")
+
+    configs = [(v, c) for v in vec_configs for c in grid(CLASSIFIER_GRID)]
+    print(f"Конфигураций: {len(configs)}")
+    if args.halving:
+        results, history = successive_halving(dataset_key, configs, y_train, y_val, args.n_jobs, eta=args.eta)
+        results = results + [r for r in history if r not in results]
+    else:
+        results = run_round(dataset_key, configs, y_train, y_val, len(y_train), args.n_jobs)
+
+    write_leaderboard(results, args.leaderboard)
+    print(f"\n🏆 Топ-5 (полностью — в {args.leaderboard}):")
+    for r in results[:5]:
+        print(f"  f1={r['f1_macro']:.4f} acc={r['accuracy']:.4f} fit={r['fit_seconds']:.2f}с "
+              f"rows={r['train_rows']} {r['vec_params']} {r['clf_params']}")
+    print(f"\n⏱ Всего: {time.perf_counter() - started:.1f}с")
+
+    if args.save_best:
+        best = results[0]
+        pipeline = Pipeline([
+            ("tfidf", TfidfVectorizer(**best["vec_params"])),
+            ("clf", LogisticRegression(max_iter=500, **best["clf_params"])),
+        ])
+        pipeline.fit(train_texts, y_train)
+        joblib.dump(pipeline, MODEL_PATH)
+        print(f"✅ Лучшая модель сохранена в {MODEL_PATH}")
+        export_onnx(pipeline, val_texts)
+
+
+def export_onnx(pipeline: Pipeline, check_texts: Sequence[str]) -> None:
+    """
+    Переэкспортирует модель в ONNX, как ClassificationModer.py. API берёт .onnx, если файл
+    есть (TEXT_MODEL_PATH), поэтому без skl2onnx старый .onnx удаляется — иначе API
+    продолжил бы отдавать предсказания прежней модели.
+    """
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+    try:
+        from app.services.onnx_text_model import OnnxTextModel, export_to_onnx
+
+        export_to_onnx(pipeline, ONNX_MODEL_PATH)
+    except ImportError as e:
+        if os.path.exists(ONNX_MODEL_PATH):
+            os.remove(ONNX_MODEL_PATH)
+            print(f"⚠️ Экспорт в ONNX пропущен ({e}); устаревший {ONNX_MODEL_PATH} удалён, API возьмёт {MODEL_PATH}")
+        else:
+            print(f"⚠️ Экспорт в ONNX пропущен: {e}")
+        return
+
+    diff = abs(OnnxTextModel(ONNX_MODEL_PATH).predict_proba(check_texts) - pipeline.predict_proba(check_texts)).max()
+    print(f"✅ ONNX-модель сохранена в {ONNX_MODEL_PATH} (макс. расхождение с sklearn: {diff:.2e})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""
+Потоковое (out-of-core) обучение текстового классификатора.
+
+В отличие от ClassificationModer.py данные не загружаются в память целиком:
+строки читаются чанками из JSONL или из Postgres (server-side cursor),
+HashingVectorizer не хранит словарь, а SGDClassifier дообучается через partial_fit.
+Память не зависит от размера датасета.
+
+Примеры:
+    python stream_train.py --jsonl data/part-*.jsonl
+    python stream_train.py --json dataset_5000.json dataset_10000.json
+    DATABASE_URL=postgresql://... python stream_train.py --db --classes REAL,FAKE,MIXED
+"""
+
+import argparse
+import glob
+import json
+import os
+import time
+import zlib
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import joblib
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import SGDClassifier
+from sklearn.metrics import classification_report
+from sklearn.pipeline import Pipeline
+
+MODEL_PATH = "sentiment_hashing_sgd.joblib"
+DEFAULT_CLASSES = ["negative", "positive"]
+N_FEATURES = 2 ** 20
+
+# Размеченные тексты из БД: текст заявки (contents или старая inline-колонка) + вердикт
+DEFAULT_DB_QUERY = """
+SELECT s.content_text, c.body, c.body_zstd, t.verdict AS label
+FROM submissions s
+JOIN trust_scores t ON t.submission_id = s.id
+LEFT JOIN contents c ON c.hash = s.content_hash
+WHERE s.media_type = 'text'
+"""
+
+Row = Tuple[str, str]
+
+
+# ===== 1. Источники данных (потоковые) =====
+
+def iter_jsonl(paths: Iterable[str]) -> Iterator[Row]:
+    """Читает JSONL построчно: {"text": ..., "label": ...} на строку."""
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                item = json.loads(line)
+                yield item["text"], item["label"]
+
+
+def iter_json_arrays(paths: Iterable[str]) -> Iterator[Row]:
+    """Старые dataset_*.json (один JSON-массив). Небольшие, поэтому читаются целиком по файлу."""
+    for path in paths:
+        if not os.path.exists(path):
+            print(f"⚠️ Файл {path} не найден, пропускаю")
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            for item in json.load(f):
+                yield item["text"], item["label"]
+
+
+def iter_db_rows(database_url: str, query: str = DEFAULT_DB_QUERY, fetch_rows: int = 10000) -> Iterator[Row]:
+    """
+    Строки из Postgres через server-side cursor (stream_results + yield_per):
+    на клиенте одновременно лежит не больше fetch_rows строк.
+    """
+    from sqlalchemy import create_engine, text
+
+    try:
+        import zstandard
+        decompressor = zstandard.ZstdDecompressor()
+    except ImportError:
+        decompressor = None
+
+    engine = create_engine(database_url)
+    try:
+        with engine.connect() as conn:
+            result = conn.execution_options(stream_results=True, yield_per=fetch_rows).execute(text(query))
+            for content_text, body, body_zstd, label in result:
+                if body is None and body_zstd is not None:
+                    if decompressor is None:
+                        continue
+                    body = decompressor.decompress(bytes(body_zstd)).decode("utf-8")
+                row_text = body if body is not None else content_text
+                if row_text and label:
+                    yield row_text, label
+    finally:
+        engine.dispose()
+
+
+def chunked(rows: Iterable[Row], size: int) -> Iterator[List[Row]]:
+    iterator = iter(rows)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def is_holdout(row_index: int, holdout_percent: int) -> bool:
+    """
+    Детерминированный сплит по номеру строки: порядок источника между эпохами
+    не меняется, поэтому строка всегда попадает в одну и ту же часть.
+    """
+    return zlib.crc32(row_index.to_bytes(8, "little")) % 100 < holdout_percent
+
+
+# ===== 2. Модель =====
+
+def build_vectorizer(n_features: int = N_FEATURES) -> HashingVectorizer:
+    # Словаря нет — память не растёт с числом уникальных n-грамм
+    return HashingVectorizer(
+        n_features=n_features,
+        ngram_range=(1, 2),
+        alternate_sign=False,
+        norm="l2",
+    )
+
+
+def build_classifier(alpha: float = 1e-6) -> SGDClassifier:
+    # log_loss даёт predict_proba, как у LogisticRegression
+    return SGDClassifier(loss="log_loss", alpha=alpha, random_state=42)
+
+
+# ===== 3. Обучение =====
+
+def train_streaming(
+    make_rows,
+    classes: List[str],
+    chunk_size: int = 10000,
+    epochs: int = 1,
+    holdout_percent: int = 10,
+    max_holdout_rows: int = 50000,
+    n_features: int = N_FEATURES,
+    alpha: float = 1e-6,
+    log_every: int = 10,
+) -> Tuple[Pipeline, Dict[str, float], List[Row]]:
+    """
+    Обучает модель чанками. make_rows() должна возвращать новый итератор строк
+    на каждую эпоху (файлы/запрос читаются заново, ничего не кешируется).
+
+    Отложенная выборка ограничена max_holdout_rows, так что память
+    остаётся постоянной при любом размере данных.
+
+    :return: (pipeline, статистика, отложенные строки)
+    """
+    vectorizer = build_vectorizer(n_features)
+    clf = build_classifier(alpha)
+    holdout: List[Row] = []
+    stats = {"rows": 0, "train_rows": 0, "seconds": 0.0}
+    started = time.perf_counter()
+
+    for epoch in range(1, epochs + 1):
+        row_index = 0
+        for chunk_no, chunk in enumerate(chunked(make_rows(), chunk_size), start=1):
+            train_texts, train_labels = [], []
+            for row_text, label in chunk:
+                row_index += 1
+                if is_holdout(row_index, holdout_percent):
+                    if epoch == 1 and len(holdout) < max_holdout_rows:
+                        holdout.append((row_text, label))
+                    continue
+                train_texts.append(row_text)
+                train_labels.append(label)
+
+            stats["rows"] += len(chunk)
+            if train_texts:
+                clf.partial_fit(vectorizer.transform(train_texts), train_labels, classes=classes)
+                stats["train_rows"] += len(train_texts)
+
+            if chunk_no % log_every == 0:
+                elapsed = time.perf_counter() - started
+                print(f"  эпоха {epoch}, чанк {chunk_no}: {stats['rows']} строк, "
+                      f"{stats['rows'] / elapsed:,.0f} строк/с")
+
+    stats["seconds"] = time.perf_counter() - started
+    stats["rows_per_second"] = stats["rows"] / stats["seconds"] if stats["seconds"] else 0.0
+    pipeline = Pipeline([("hash", vectorizer), ("clf", clf)])
+    return pipeline, stats, holdout
+
+
+def evaluate(pipeline: Pipeline, holdout: List[Row], chunk_size: int = 10000) -> str:
+    """Оценка на отложенной выборке (предсказания тоже чанками)."""
+    y_true, y_pred = [], []
+    for chunk in chunked(holdout, chunk_size):
+        texts = [row_text for row_text, _ in chunk]
+        y_true.extend(label for _, label in chunk)
+        y_pred.extend(pipeline.predict(texts))
+    return classification_report(y_true, y_pred, zero_division=0)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Потоковое обучение HashingVectorizer + SGDClassifier")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--jsonl", nargs="+", help="JSONL-файлы (поддерживаются glob-маски)")
+    source.add_argument("--json", nargs="+", help="Старые JSON-массивы (dataset_*.json)")
+    source.add_argument("--db", action="store_true", help="Читать из Postgres (DATABASE_URL)")
+    parser.add_argument("--db-query", default=DEFAULT_DB_QUERY)
+    parser.add_argument("--classes", default=",".join(DEFAULT_CLASSES), help="Все классы через запятую")
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    parser.add_argument("--epochs", type=int, default=1)
+    parser.add_argument("--holdout-percent", type=int, default=10)
+    parser.add_argument("--max-holdout-rows", type=int, default=50000)
+    parser.add_argument("--n-features", type=int, default=N_FEATURES)
+    parser.add_argument("--alpha", type=float, default=1e-6)
+    parser.add_argument("--out", default=MODEL_PATH)
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+
+    if args.jsonl:
+        paths = [p for pattern in args.jsonl for p in sorted(glob.glob(pattern))]
+        make_rows = lambda: iter_jsonl(paths)
+    elif args.json:
+        make_rows = lambda: iter_json_arrays(args.json)
+    else:
+        database_url = os.getenv("DATABASE_URL")
+        if not database_url:
+            raise SystemExit("DATABASE_URL не задан")
+        make_rows = lambda: iter_db_rows(database_url, args.db_query, args.chunk_size)
+
+    classes = [c.strip() for c in args.classes.split(",") if c.strip()]
+    print(f"Обучение (chunk={args.chunk_size}, epochs={args.epochs}, classes={classes})...")
+    pipeline, stats, holdout = train_streaming(
+        make_rows,
+        classes,
+        chunk_size=args.chunk_size,
+        epochs=args.epochs,
+        holdout_percent=args.holdout_percent,
+        max_holdout_rows=args.max_holdout_rows,
+        n_features=args.n_features,
+        alpha=args.alpha,
+    )
+    print(f"\n⏱ {stats['rows']} строк за {stats['seconds']:.1f}с "
+          f"({stats['rows_per_second']:,.0f} строк/с), в обучении: {stats['train_rows']}")
+
+    print(f"\n🧪 Held-out results ({len(holdout)} строк):")
+    if holdout:
+        print(evaluate(pipeline, holdout, args.chunk_size))
+
+    joblib.dump(pipeline, args.out)
+    print(f"\n✅ Модель сохранена в {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+import asyncio
+import io
+import os
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from app.services import async_storage_service
+from app.services.async_storage_service import S3_MIN_PART_BYTES, AsyncMultipartUploader, with_retries
+
+
+# -----------------------------------------------------------
+# ФЕЙКОВЫЙ async S3-клиент (API как у aiobotocore)
+# -----------------------------------------------------------
+
+class FakeAsyncS3:
+    def __init__(self, part_delay=0.01, failures=None):
+        self.objects = {}
+        self.uploads = {}
+        self.aborted = []
+        self.part_delay = part_delay
+        # part_number -> сколько раз упасть перед успехом
+        self.failures = dict(failures or {})
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def put_object(self, Bucket, Key, Body, ContentType):
+        self.objects[Key] = Body
+        return {}
+
+    async def create_multipart_upload(self, Bucket, Key, ContentType):
+        upload_id = f"upload-{len(self.uploads)}"
+        self.uploads[upload_id] = {}
+        return {"UploadId": upload_id}
+
+    async def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.part_delay)
+            if self.failures.get(PartNumber, 0) > 0:
+                self.failures[PartNumber] -= 1
+                raise ConnectionError(f"part {PartNumber} failed")
+            self.uploads[UploadId][PartNumber] = Body
+            return {"ETag": f"etag-{PartNumber}"}
+        finally:
+            self.in_flight -= 1
+
+    async def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        parts = self.uploads[UploadId]
+        numbers = [p["PartNumber"] for p in MultipartUpload["Parts"]]
+        assert numbers == sorted(parts)
+        self.objects[Key] = b"".join(parts[n] for n in numbers)
+        return {}
+
+    async def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.aborted.append(UploadId)
+        return {}
+
+
+def make_uploader(client, **kwargs):
+    # Части по 10 байт: минимум S3 в 5 МиБ фейковому клиенту не нужен
+    params = dict(chunk_size=10, part_concurrency=3, max_attempts=3, backoff_base=0.001, min_part_size=1)
+    params.update(kwargs)
+    return AsyncMultipartUploader(client, "bucket", upload_semaphore=asyncio.Semaphore(2), **params)
+
+
+# -----------------------------------------------------------
+# ТЕСТЫ
+# -----------------------------------------------------------
+
+def test_small_file_uses_single_put():
+    client = FakeAsyncS3()
+
+    async def run():
+        return await make_uploader(client).upload(io.BytesIO(b"tiny"), "k1", "text/plain")
+
+    assert asyncio.run(run()) == "k1"
+    assert client.objects["k1"] == b"tiny"
+    assert client.uploads == {}
+
+
+def test_multipart_upload_reassembles_and_bounds_concurrency():
+    client = FakeAsyncS3()
+    payload = bytes(range(256)) * 2  # 512 байт -> 52 части по 10 байт
+
+    async def run():
+        return await make_uploader(client).upload(io.BytesIO(payload), "big", "image/jpeg")
+
+    asyncio.run(run())
+
+    assert client.objects["big"] == payload
+    assert client.max_in_flight == 3
+
+
+def test_failed_part_is_retried():
+    client = FakeAsyncS3(failures={2: 2})
+    payload = b"x" * 35
+
+    async def run():
+        return await make_uploader(client).upload(io.BytesIO(payload), "retry", "image/png")
+
+    asyncio.run(run())
+    assert client.objects["retry"] == payload
+
+
+def test_exhausted_retries_abort_upload():
+    client = FakeAsyncS3(failures={3: 10})
+
+    async def run():
+        return await make_uploader(client).upload(io.BytesIO(b"y" * 50), "broken", "image/png")
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(run())
+    assert client.aborted == ["upload-0"]
+    assert "broken" not in client.objects
+
+
+class TrickleStream(io.BytesIO):
+    """Поток, отдающий не больше 3 байт за read() (как сокет), и считающий прочитанное."""
+
+    def read(self, size=-1):
+        return super().read(min(size, 3) if size and size > 0 else 3)
+
+
+def test_short_reads_still_give_full_size_parts():
+    client = FakeAsyncS3()
+    payload = bytes(range(95))
+
+    async def run():
+        return await make_uploader(client).upload(TrickleStream(payload), "trickle", "image/jpeg")
+
+    asyncio.run(run())
+
+    parts = client.uploads["upload-0"]
+    assert [len(parts[n]) for n in sorted(parts)] == [10] * 9 + [5]
+    assert client.objects["trickle"] == payload
+
+
+def test_failed_part_stops_reading_and_aborts():
+    client = FakeAsyncS3(failures={1: 10}, part_delay=0.001)
+    stream = io.BytesIO(b"z" * 10_000)  # 1000 частей
+
+    async def run():
+        return await make_uploader(client, part_concurrency=2).upload(stream, "stop", "image/png")
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(run())
+    assert client.aborted == ["upload-0"]
+    # Пока первая часть исчерпывала повторы, прочитано лишь несколько частей, а не весь файл
+    assert stream.tell() < 200
+
+
+def test_part_size_is_at_least_s3_minimum():
+    uploader = AsyncMultipartUploader(FakeAsyncS3(), "bucket", chunk_size=1024)
+    assert uploader.chunk_size == S3_MIN_PART_BYTES
+
+
+def test_with_retries_gives_up_after_max_attempts():
+    calls = []
+
+    async def flaky():
+        calls.append(1)
+        raise TimeoutError("slow")
+
+    with pytest.raises(TimeoutError):
+        asyncio.run(with_retries(flaky, what="test", max_attempts=3, backoff_base=0.001))
+    assert len(calls) == 3
+
+
+# -----------------------------------------------------------
+# НАСТОЯЩИЙ aiobotocore поверх moto (сервер S3 в потоке)
+# -----------------------------------------------------------
+
+@pytest.fixture(scope="module")
+def moto_endpoint():
+    pytest.importorskip("aiobotocore")
+    moto_server = pytest.importorskip("moto.server")
+    server = moto_server.ThreadedMotoServer(ip_address="127.0.0.1", port=0, verbose=False)
+    server.start()
+    host, port = server.get_host_and_port()
+    yield f"http://{host}:{port}"
+    server.stop()
+
+
+def run_against_moto(endpoint, bucket, scenario):
+    """Создаёт бакет и выполняет scenario(client) с реальным aiobotocore-клиентом."""
+    from aiobotocore.session import get_session
+
+    async def run():
+        async with get_session().create_client(
+            "s3",
+            endpoint_url=endpoint,
+            region_name="us-east-1",
+            aws_access_key_id="test",
+            aws_secret_access_key="test",
+        ) as client:
+            await client.create_bucket(Bucket=bucket)
+            return await scenario(client)
+
+    return asyncio.run(run())
+
+
+class FailingPartClient:
+    """Настоящий клиент, у которого upload_part указанной части всегда падает."""
+
+    def __init__(self, client, failing_part):
+        self._client = client
+        self._failing_part = failing_part
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    async def upload_part(self, **kwargs):
+        if kwargs["PartNumber"] == self._failing_part:
+            raise ConnectionError("connection reset")
+        return await self._client.upload_part(**kwargs)
+
+
+def test_moto_multipart_round_trip(moto_endpoint):
+    payload = os.urandom(2 * S3_MIN_PART_BYTES + 1234)
+
+    async def scenario(client):
+        uploader = AsyncMultipartUploader(client, "roundtrip", part_concurrency=2,
+                                          chunk_size=S3_MIN_PART_BYTES, upload_semaphore=asyncio.Semaphore(1))
+        await uploader.upload(io.BytesIO(payload), "big.jpg", "image/jpeg")
+        response = await client.get_object(Bucket="roundtrip", Key="big.jpg")
+        async with response["Body"] as body:
+            stored = await body.read()
+        pending = await client.list_multipart_uploads(Bucket="roundtrip")
+        return stored, response["ETag"], response["ContentType"], pending.get("Uploads", [])
+
+    stored, etag, content_type, pending = run_against_moto(moto_endpoint, "roundtrip", scenario)
+
+    assert stored == payload
+    assert etag.strip('"').endswith("-3")  # собран из трёх частей
+    assert content_type == "image/jpeg"
+    assert pending == []
+
+
+def test_moto_failed_part_aborts_multipart_upload(moto_endpoint):
+    async def scenario(client):
+        uploader = AsyncMultipartUploader(FailingPartClient(client, failing_part=2), "aborted",
+                                          max_attempts=1, upload_semaphore=asyncio.Semaphore(1))
+        with pytest.raises(ConnectionError):
+            await uploader.upload(io.BytesIO(b"x" * (2 * S3_MIN_PART_BYTES + 1)), "broken.jpg", "image/jpeg")
+        pending = await client.list_multipart_uploads(Bucket="aborted")
+        listing = await client.list_objects_v2(Bucket="aborted")
+        return pending.get("Uploads", []), listing.get("Contents", [])
+
+    pending, objects = run_against_moto(moto_endpoint, "aborted", scenario)
+
+    assert pending == []
+    assert objects == []
+
+
+def test_upload_media_file_async_takes_ref_off_event_loop(moto_endpoint):
+    ref_threads = []
+
+    def acquire_media_ref(db, s3_key, size, content_type):
+        ref_threads.append(threading.current_thread())
+        return object()
+
+    async def scenario(client):
+        with patch.object(async_storage_service, "_async_s3_client", client), \
+                patch.object(async_storage_service, "R2_BUCKET_NAME", "refs"), \
+                patch.object(async_storage_service, "acquire_media_ref", acquire_media_ref):
+            key = await async_storage_service.upload_media_file_async(
+                io.BytesIO(os.urandom(64)), "photo.png", "image/png", db=object()
+            )
+        head = await client.head_object(Bucket="refs", Key=key)
+        return key, head["ContentLength"]
+
+    key, size = run_against_moto(moto_endpoint, "refs", scenario)
+
+    assert key.startswith("submissions/") and size == 64
+    assert ref_threads and ref_threads[0] is not threading.main_thread()
@@ -0,0 +1,49 @@
+import threading
+import time
+
+import pytest
+
+from app.core.container import LazyService, init_services
+
+
+@pytest.fixture(autouse=True)
+def isolated_services(monkeypatch):
+    monkeypatch.setattr("app.core.container.SERVICES", {})
+
+
+def test_factory_runs_once_for_concurrent_first_calls():
+    calls = []
+
+    def factory():
+        calls.append(1)
+        time.sleep(0.05)
+        return object()
+
+    service = LazyService("slow", factory)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(service.get())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert len({id(r) for r in results}) == 1
+    assert service.ready and service.init_ms >= 50
+
+
+def test_failed_factory_is_retried_and_reported():
+    attempts = []
+
+    def factory():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("no credentials")
+        return "client"
+
+    service = LazyService("flaky", factory)
+
+    assert init_services() == {"flaky": "RuntimeError: no credentials"}
+    assert not service.ready
+    assert init_services(["flaky"]) == {"flaky": None}
+    assert service.get() == "client"
@@ -0,0 +1,55 @@
+import hashlib
+
+import pytest
+
+from app.models import database_ops
+from app.models.database_ops import (
+    content_digest,
+    pack_content,
+    resolve_content_text,
+    unpack_content,
+)
+
+
+def test_digest_is_sha256_of_utf8():
+    text = "Проверка дедупликации"
+    assert content_digest(text) == hashlib.sha256(text.encode("utf-8")).digest()
+    assert len(content_digest(text)) == 32
+
+
+def test_short_text_is_stored_inline():
+    values = pack_content("short text")
+
+    assert values["body"] == "short text"
+    assert values["body_zstd"] is None
+    assert values["size"] == len("short text")
+    assert unpack_content(values["body"], values["body_zstd"]) == "short text"
+
+
+def test_long_text_is_compressed_and_roundtrips():
+    pytest.importorskip("zstandard")
+    text = "Повторяющийся абзац новостной статьи. " * 500
+
+    values = pack_content(text)
+
+    assert values["body"] is None
+    assert len(values["body_zstd"]) < values["size"]
+    assert values["preview"] == text[: database_ops.CONTENT_PREVIEW_CHARS]
+    assert values["hash"] == content_digest(text)
+    assert unpack_content(values["body"], values["body_zstd"]) == text
+
+
+def test_long_text_without_zstd_stays_inline(monkeypatch):
+    monkeypatch.setattr(database_ops, "zstandard", None)
+    text = "x" * (database_ops.CONTENT_ZSTD_MIN_BYTES * 2)
+
+    values = pack_content(text)
+
+    assert values["body"] == text
+    assert values["body_zstd"] is None
+
+
+def test_resolve_prefers_legacy_inline_column():
+    assert resolve_content_text("old inline", None, None) == "old inline"
+    assert resolve_content_text(None, "from contents", None) == "from contents"
+    assert resolve_content_text(None, None, None) is None
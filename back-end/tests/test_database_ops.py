@@ -2,17 +2,31 @@ import pytest
 import uuid
 import sys
 import os
+from datetime import datetime, timedelta, timezone
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from sqlalchemy.orm import Session
 from app.models.database_ops import (
     SessionLocal,
     create_db_and_tables,
+    upgrade_schema,
     create_user,
     create_submission,
     create_trust_score,
     update_submission_status,
     get_pending_submissions,
     get_submission_with_score,
+    query_submissions_by_metrics,
+    create_history_record,
+    get_user_history,
+    search_user_history,
+    acquire_media_ref,
+    claim_orphaned_media,
+    delete_all_history_for_user,
+    delete_history_item,
+    forget_media_objects,
+    Content,
+    content_digest,
+    MediaObject,
     User,
     Submission
 )
@@ -21,8 +35,9 @@ from app.models.database_ops import (
 
 @pytest.fixture(scope="session", autouse=True)
 def setup_database():
-    """Создает таблицы в базе данных один раз перед всеми тестами."""
+    """Создает таблицы и применяет миграции один раз перед всеми тестами."""
     create_db_and_tables()
+    upgrade_schema()
 
 # Фикстура для каждой тестовой функции
 @pytest.fixture
@@ -140,4 +155,115 @@ def test_full_result_retrieval(db: Session, test_user: User):
     assert final_sub is not None
     assert final_sub.trust_score.verdict == "FAKE"
     # Проверяем, что JSONB вернулся как словарь
-    assert final_sub.trust_score.ai_metadata["model_version"] == "v2.1"
\ No newline at end of file
+    assert final_sub.trust_score.ai_metadata["model_version"] == "v2.1"
+
+
+def test_query_submissions_by_hot_metrics(db: Session, test_user: User):
+    """Проверяет фильтрацию и сортировку по generated-колонкам из ai_metadata."""
+
+    for trust, ai in [(90, 0.1), (50, 0.5), (10, 0.9)]:
+        sub = create_submission(db, user_id=test_user.id, media_type='text', media_url='n/a')
+        create_trust_score(
+            db,
+            sub.id,
+            fake_probability=1 - trust / 100,
+            verdict="REAL" if trust > 80 else ("FAKE" if trust < 30 else "MIXED"),
+            ai_metadata={"trust_score": trust, "ai_likeliness": ai, "manipulation_score": 0.2},
+        )
+
+    rows = query_submissions_by_metrics(db, user_id=test_user.id, sort_by="trust_score", descending=False)
+    assert [r["trust_score"] for r in rows] == [10, 50, 90]
+    assert rows[0]["ai_likeliness"] == 0.9
+    assert rows[0]["manipulation_score"] == 0.2
+
+    risky = query_submissions_by_metrics(db, user_id=test_user.id, min_ai_likeliness=0.5)
+    assert {r["verdict"] for r in risky} == {"MIXED", "FAKE"}
+
+    fake = query_submissions_by_metrics(db, user_id=test_user.id, verdict="FAKE")
+    assert len(fake) == 1 and fake[0]["trust_score"] == 10
+
+    with pytest.raises(ValueError):
+        query_submissions_by_metrics(db, user_id=test_user.id, sort_by="ai_metadata")
+
+
+def test_history_full_text_search(db: Session, test_user: User):
+    """Проверяет поиск по истории на разных языках (tsvector заполняется триггером)."""
+
+    create_history_record(
+        db, test_user.id,
+        question="Статья о выборах в парламент",
+        raw_response={"summary": "Текст содержит манипуляции"}, kind="text",
+    )
+    create_history_record(
+        db, test_user.id,
+        question="Weather forecast for tomorrow",
+        raw_response={"summary": "Elections are not mentioned here"}, kind="text",
+    )
+    create_history_record(
+        db, test_user.id,
+        question="Článok o voľbách",
+        raw_response={"summary": "Krátke zhrnutie"}, kind="text",
+    )
+
+    ru = search_user_history(db, test_user.id, "выборы")
+    assert [h.question for h, _ in ru] == ["Статья о выборах в парламент"]
+
+    en = search_user_history(db, test_user.id, "election")
+    assert [h.question for h, _ in en] == ["Weather forecast for tomorrow"]
+
+    sk = search_user_history(db, test_user.id, "voľbách")
+    assert len(sk) == 1
+
+    other_user = create_user(db, username=f"other_{uuid.uuid4()}")
+    assert search_user_history(db, other_user.id, "выборы") == []
+
+
+def test_same_text_is_stored_once(db: Session, test_user: User):
+    """Одинаковый текст в submissions и history хранится в contents один раз."""
+    text = f"Одна и та же новость {uuid.uuid4()}"
+
+    sub = create_submission(db, user_id=test_user.id, media_type='text', content_text=text, media_url='n/a')
+    create_history_record(db, test_user.id, question=text, raw_response={"summary": "s"}, kind="text")
+    create_history_record(db, test_user.id, question=text, raw_response={"summary": "s"}, kind="text")
+
+    assert db.query(Content).filter(Content.hash == content_digest(text)).count() == 1
+    assert sub.content_text == text
+    assert [h.question for h in get_user_history(db, test_user.id)] == [text, text]
+
+
+def test_deleting_history_removes_unreferenced_contents(db: Session, test_user: User):
+    """Текст удаляется из contents вместе с последней ссылкой на него."""
+    shared, own = f"Общая новость {uuid.uuid4()}", f"Своя новость {uuid.uuid4()}"
+    create_submission(db, user_id=test_user.id, media_type='text', content_text=shared, media_url='n/a')
+    first = create_history_record(db, test_user.id, question=own, raw_response={"summary": "s"}, kind="text")
+    create_history_record(db, test_user.id, question=own, raw_response={"summary": "s"}, kind="text")
+    create_history_record(db, test_user.id, question=shared, raw_response={"summary": "s"}, kind="text")
+
+    assert delete_history_item(db, test_user.id, first.id)
+    assert db.get(Content, content_digest(own)) is not None
+    assert delete_all_history_for_user(db, test_user.id) == 2
+    db.expire_all()
+    assert db.get(Content, content_digest(own)) is None
+    # На текст ещё ссылается submissions
+    assert db.get(Content, content_digest(shared)) is not None
+
+
+def test_media_refs_follow_history_and_tombstone_blocks_new_refs(db: Session, test_user: User):
+    """Ссылки на картинку снимаются удалением истории; объект на удалении новых ссылок не получает."""
+    key = f"submissions/{uuid.uuid4().hex}.png"
+    for _ in range(3):
+        acquire_media_ref(db, key, 10, "image/png")
+        create_history_record(db, test_user.id, question="pic.png", raw_response={}, kind="image", media_key=key)
+    first = get_user_history(db, test_user.id)[0]
+
+    assert delete_history_item(db, test_user.id, first.id)
+    assert db.get(MediaObject, key).ref_count == 2
+    assert delete_all_history_for_user(db, test_user.id) == 2
+    media = db.get(MediaObject, key)
+    db.refresh(media)
+    assert media.ref_count == 0 and media.orphaned_at is not None
+
+    assert key in claim_orphaned_media(db, datetime.now(timezone.utc) + timedelta(seconds=1), limit=1000)
+    assert acquire_media_ref(db, key, 10, "image/png") is None
+    assert forget_media_objects(db, [key]) == 1
+    assert acquire_media_ref(db, key, 10, "image/png") == 1
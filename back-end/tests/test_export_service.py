@@ -0,0 +1,93 @@
+import csv
+import gzip
+import io
+import itertools
+import json
+import uuid
+from datetime import datetime
+
+import pytest
+
+from app.services.export_service import (
+    accepts_gzip,
+    encode_csv,
+    encode_ndjson,
+    export_chunks,
+    gzip_stream,
+)
+
+
+def make_rows(n):
+    for i in range(n):
+        yield {
+            "id": uuid.UUID(int=i),
+            "created_at": datetime(2025, 1, 1, 12, 0, i % 60),
+            "question": f"Вопрос №{i}, с \"кавычками\"\nи переносом",
+            "trust_score": 50.0 + i % 10,
+            "raw_response": {"summary": "ok", "claims_evaluation": [{"text": "a"}]},
+        }
+
+
+FIELDS = ["id", "created_at", "question", "trust_score", "raw_response"]
+
+
+def test_ndjson_roundtrip():
+    data = b"".join(encode_ndjson(make_rows(3)))
+    lines = data.decode("utf-8").splitlines()
+
+    assert len(lines) == 3
+    first = json.loads(lines[0])
+    assert first["id"] == str(uuid.UUID(int=0))
+    assert first["created_at"] == "2025-01-01T12:00:00"
+    assert first["raw_response"]["summary"] == "ok"
+
+
+def test_csv_roundtrip_with_nested_json():
+    data = b"".join(encode_csv(make_rows(2), FIELDS)).decode("utf-8")
+    rows = list(csv.DictReader(io.StringIO(data)))
+
+    assert len(rows) == 2
+    assert rows[1]["question"] == "Вопрос №1, с \"кавычками\"\nи переносом"
+    assert json.loads(rows[0]["raw_response"])["claims_evaluation"] == [{"text": "a"}]
+
+
+def test_gzip_stream_roundtrip():
+    plain = b"".join(encode_ndjson(make_rows(500)))
+    compressed = b"".join(gzip_stream(encode_ndjson(make_rows(500))))
+
+    assert gzip.decompress(compressed) == plain
+    assert len(compressed) < len(plain)
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("gzip, deflate, br", True),
+    ("GZIP;q=0.5", True),
+    ("gzip;q=0", False),
+    ("gzip; q=0.0, identity", False),
+    ("br;q=1.0, gzip;q=0.8, *;q=0.1", True),
+    ("identity, *;q=0", False),
+    ("br, *", True),
+    ("*;q=1, gzip;q=0", False),
+    ("gzip;q=abc", False),
+    ("deflate", False),
+    ("", False),
+    (None, False),
+])
+def test_accepts_gzip_respects_q_values(header, expected):
+    assert accepts_gzip(header) is expected
+
+
+def test_export_is_lazy_and_chunked():
+    """Бесконечный источник: первые куски должны отдаваться без чтения всего потока."""
+    infinite = (row for i in itertools.count() for row in make_rows(1))
+    chunks = export_chunks(infinite, "csv", FIELDS, gzip=True)
+
+    first = next(chunks)
+    second = next(chunks)
+    assert first[:2] == b"\x1f\x8b"  # gzip magic
+    assert second
+
+
+def test_unknown_format_is_rejected():
+    with pytest.raises(ValueError):
+        export_chunks(make_rows(1), "xml", FIELDS)
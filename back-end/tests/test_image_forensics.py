@@ -0,0 +1,151 @@
+import io
+import os
+import time
+
+import pytest
+
+np = pytest.importorskip("numpy")
+PIL_Image = pytest.importorskip("PIL.Image")
+
+from app.services.image_forensics import analyze_forensics, forensics_fallback
+
+# ai_service создаёт клиент OpenAI при импорте; сеть в этих тестах не используется
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+from app.services.ai_service import analyze_image, compute_image_trust_score, forensics_is_conclusive
+
+TAG_EXIF_IFD = 0x8769
+
+
+def _gradient(width=1600, height=1200, noise=0.0):
+    rng = np.random.default_rng(0)
+    base = np.linspace(0, 200, width * height, dtype=np.float32).reshape(height, width)
+    pixels = base[..., None] + rng.normal(0, noise, (height, width, 3)) if noise else np.repeat(base[..., None], 3, 2)
+    return PIL_Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+
+def _camera_jpeg(software=None):
+    exif = PIL_Image.Exif()
+    exif[0x010F] = "Canon"
+    exif[0x0110] = "EOS 5D"
+    exif[0x0132] = "2024:05:01 10:00:00"
+    exif.get_ifd(TAG_EXIF_IFD)[0x9003] = "2024:05:01 10:00:00"
+    if software:
+        exif[0x0131] = software
+    buffer = io.BytesIO()
+    # Своя таблица квантования, как у камер
+    _gradient(noise=6.0).save(buffer, "JPEG", exif=exif, qtables=[[(i % 7) + 2 for i in range(64)]])
+    return buffer.getvalue()
+
+
+def _smooth_png():
+    buffer = io.BytesIO()
+    _gradient().save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def test_camera_original_photo_is_conclusive():
+    result = analyze_forensics(_camera_jpeg())
+
+    assert result["camera"] == "Canon EOS 5D"
+    assert result["standard_table"] is False
+    assert result["ai_likeliness"] < 0.2
+    assert result["manipulation_risk"] == 0.0
+    assert forensics_is_conclusive(forensics=result)
+
+    vision = forensics_fallback(result)
+    assert vision["anomalies"] == []
+    assert "Canon EOS 5D" in vision["summary"]
+
+
+def test_smooth_png_without_metadata_looks_generated():
+    result = analyze_forensics(_smooth_png())
+
+    assert result["has_exif"] is False
+    assert result["ai_likeliness"] > 0.5
+    assert "Unusually low sensor noise" in result["findings"]
+    assert not forensics_is_conclusive(forensics=result)
+
+
+def test_ai_and_editor_software_tags():
+    generated = analyze_forensics(_camera_jpeg(software="Midjourney v6"))
+    assert generated["ai_software"] is True
+    assert generated["ai_likeliness"] > 0.5
+
+    edited = analyze_forensics(_camera_jpeg(software="Adobe Photoshop 25.0"))
+    assert edited["editor_software"] is True
+    assert edited["manipulation_risk"] > 0
+
+
+def test_standard_quantization_table_is_recognised():
+    buffer = io.BytesIO()
+    _gradient(256, 256, noise=4.0).save(buffer, "JPEG", quality=75)
+
+    result = analyze_forensics(buffer.getvalue())
+
+    assert result["standard_table"] is True
+    assert result["estimated_quality"] == 75
+
+
+def test_forensic_score_lowers_trust_score():
+    kwargs = dict(ai_likeliness=0.2, manipulation_risk=0.1, realism=0.9, anomalies=[])
+    baseline = compute_image_trust_score(**kwargs)
+
+    assert compute_image_trust_score(**kwargs, forensic_score=0.2) < baseline
+    assert compute_image_trust_score(**kwargs, forensic_score=None) == baseline
+
+
+def test_forensics_only_result_is_counted_once():
+    data = _camera_jpeg()
+    forensics = analyze_forensics(data)
+    vision = forensics_fallback(forensics)
+
+    response = analyze_image(data)
+
+    # Удалённые детекторы пропущены: оси Vision уже из локальной проверки, forensic_score не добавляется
+    assert response.summary == vision["summary"]
+    assert response.trust_score == compute_image_trust_score(
+        ai_likeliness=forensics["ai_likeliness"],
+        manipulation_risk=vision["manipulation_risk"],
+        realism=vision["realism"],
+        anomalies=vision["anomalies"],
+    )
+
+
+@pytest.fixture(scope="module")
+def camera_12mp():
+    """12 Мп кадр с шумом сенсора — типичный размер фото со смартфона."""
+    rng = np.random.default_rng(1)
+    base = np.linspace(0, 200, 4000 * 3000, dtype=np.float32).reshape(3000, 4000)
+    pixels = np.clip(base[..., None] + rng.normal(0, 6, (3000, 4000, 3)).astype(np.float32), 0, 255)
+    return PIL_Image.fromarray(pixels.astype(np.uint8))
+
+
+def _best_of(func, runs=3):
+    func()
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def test_forensics_is_fast(camera_12mp):
+    buffer = io.BytesIO()
+    camera_12mp.save(buffer, "JPEG", quality=90)
+    data = buffer.getvalue()
+
+    assert _best_of(lambda: analyze_forensics(data)) < 0.1
+
+
+def test_forensics_of_large_png_costs_little_beyond_decoding(camera_12mp):
+    buffer = io.BytesIO()
+    camera_12mp.save(buffer, "PNG", compress_level=1)
+    data = buffer.getvalue()
+
+    def decode():
+        PIL_Image.open(io.BytesIO(data)).load()
+
+    # PNG декодируется целиком; всё остальное (уменьшение, ELA, шум) — около 50 мс
+    # (до reduce — ~200 мс), запас на шум соседних процессов
+    assert _best_of(lambda: analyze_forensics(data)) - _best_of(decode) < 0.15
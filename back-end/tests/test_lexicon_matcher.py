@@ -0,0 +1,79 @@
+import os
+import time
+
+import pytest
+
+from app.services import lexicon_matcher as lexicon_module
+from app.services.lexicon_matcher import LexiconMatcher, _PythonAutomaton, merge_phrases, normalize_text
+
+LEXICON_DIR = os.path.join(os.path.dirname(__file__), "..", "lexicon")
+
+
+@pytest.fixture(params=["python", "c"])
+def automaton_backend(request, monkeypatch):
+    """Оба бэкенда должны давать одинаковый результат."""
+    if request.param == "c":
+        if lexicon_module.ahocorasick is None:
+            pytest.skip("pyahocorasick не установлен")
+    else:
+        monkeypatch.setattr(lexicon_module, "ahocorasick", None)
+    return request.param
+
+
+def test_normalization_ignores_case_width_and_diacritics():
+    assert normalize_text("ＺÁZRAČNÝ   Liek") == "zazracny liek"
+    assert normalize_text("Ёлка") == normalize_text("елка")
+
+
+def test_finds_phrases_in_all_languages(automaton_backend):
+    matcher = LexiconMatcher(LEXICON_DIR)
+    text = (
+        "Врачи СКРЫВАЮТ это! Сообщите код из СМС. "
+        "Zazracny liek je tu. A MIRACLE  cure for everyone."
+    )
+
+    assert matcher.find(text) == ["врачи скрывают", "сообщите код из смс", "zázračný liek", "miracle cure"]
+
+
+def test_matches_respect_word_boundaries(automaton_backend):
+    matcher = LexiconMatcher("/nonexistent")
+    matcher.build(["he", "she", "hers", "his"])
+
+    assert matcher.find("ushers") == []
+    assert matcher.find("she said: his, hers; he") == ["she", "his", "hers", "he"]
+
+
+def test_overlapping_patterns_are_all_reported(automaton_backend):
+    matcher = LexiconMatcher("/nonexistent")
+    matcher.build(["кот", "кот в мешке", "в мешке"])
+
+    assert sorted(matcher.find("купить кот в мешке")) == ["в мешке", "кот", "кот в мешке"]
+
+
+def test_lexicon_is_reloaded_when_file_changes(tmp_path):
+    path = tmp_path / "en.txt"
+    path.write_text("# comment\nfirst phrase\n", encoding="utf-8")
+    matcher = LexiconMatcher(str(tmp_path), reload_interval=0)
+
+    assert matcher.find("a first phrase here") == ["first phrase"]
+
+    path.write_text("second phrase\n", encoding="utf-8")
+    os.utime(path, (time.time() + 10, time.time() + 10))
+    assert matcher.find("first phrase, second phrase") == ["second phrase"]
+
+
+def test_merge_phrases_deduplicates_llm_and_lexicon():
+    merged = merge_phrases(["Miracle cure", "что-то ещё"], ["miracle cure", "врачи скрывают"])
+    assert merged == ["Miracle cure", "что-то ещё", "врачи скрывают"]
+    assert merge_phrases(["a"], None) == ["a"]
+
+
+def test_python_automaton_handles_large_inputs():
+    automaton = _PythonAutomaton()
+    for i in range(20000):
+        automaton.add_word(f"pattern{i}x", i)
+    automaton.make_automaton()
+
+    text = " ".join(f"pattern{i}x" for i in range(0, 20000, 1000)) * 50
+    hits = {value for _, value in automaton.iter(text)}
+    assert hits == set(range(0, 20000, 1000))
@@ -0,0 +1,120 @@
+import os
+import threading
+import time
+
+import pytest
+
+from app.services.media_cache import DiskLRUCache
+
+
+def writer(data: bytes, calls: list = None, delay: float = 0.0):
+    def fetch(f):
+        if calls is not None:
+            calls.append(1)
+        if delay:
+            time.sleep(delay)
+        f.write(data)
+    return fetch
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return DiskLRUCache(directory=str(tmp_path), max_bytes=100)
+
+
+def test_hit_after_miss(cache):
+    calls = []
+    assert cache.get_or_fetch("submissions/a.jpg", writer(b"hello", calls)) == b"hello"
+    assert cache.get_or_fetch("submissions/a.jpg", writer(b"other", calls)) == b"hello"
+
+    assert len(calls) == 1
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["bytes_saved"] == 5
+    assert stats["hit_ratio"] == 0.5
+
+
+def test_lru_eviction_respects_size_limit(cache):
+    cache.get_or_fetch("a", writer(b"a" * 40))
+    cache.get_or_fetch("b", writer(b"b" * 40))
+    cache.get("a")  # "a" теперь самый свежий
+    cache.get_or_fetch("c", writer(b"c" * 40))
+
+    assert cache.get("b") is None
+    assert cache.get("a") == b"a" * 40
+    assert cache.stats()["size_bytes"] <= 100
+
+
+def test_object_larger_than_cache_is_not_stored(cache, tmp_path):
+    assert cache.get_or_fetch("big", writer(b"x" * 150)) == b"x" * 150
+    assert cache.get("big") is None
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_failed_fetch_leaves_no_partial_file(cache, tmp_path):
+    def broken(f):
+        f.write(b"partial")
+        raise ConnectionError("network down")
+
+    with pytest.raises(ConnectionError):
+        cache.get_or_fetch("k", broken)
+    assert list(tmp_path.iterdir()) == []
+    assert cache.get("k") is None
+
+
+def test_concurrent_requests_download_once(cache):
+    calls = []
+    results = []
+
+    def worker():
+        results.append(bytes(cache.get_or_fetch("shared", writer(b"payload", calls, delay=0.05))))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert results == [b"payload"] * 8
+
+
+def test_index_is_restored_on_restart(tmp_path):
+    first = DiskLRUCache(directory=str(tmp_path), max_bytes=100)
+    first.get_or_fetch("persisted", writer(b"data"))
+    (tmp_path / "leftover.tmp").write_bytes(b"junk")
+    os.utime(tmp_path / "leftover.tmp", (time.time() - 2 * 3600,) * 2)
+    # Свежий .tmp может дописывать другой воркер — его не трогаем
+    (tmp_path / "writing.tmp").write_bytes(b"partial")
+
+    second = DiskLRUCache(directory=str(tmp_path), max_bytes=100)
+    assert second.get("persisted") == b"data"
+    assert not (tmp_path / "leftover.tmp").exists()
+    assert (tmp_path / "writing.tmp").exists()
+
+
+def test_workers_share_objects_and_size_limit(tmp_path):
+    # Два воркера с общим каталогом
+    first = DiskLRUCache(directory=str(tmp_path), max_bytes=100)
+    second = DiskLRUCache(directory=str(tmp_path), max_bytes=100)
+    first.get_or_fetch("a", writer(b"a" * 40))
+    calls = []
+    assert second.get_or_fetch("a", writer(b"a" * 40, calls)) == b"a" * 40
+    assert calls == []
+
+    second.get_or_fetch("b", writer(b"b" * 40))
+    first.get("a")  # чтение в одном воркере освежает объект для обоих
+    first.get_or_fetch("c", writer(b"c" * 40))
+
+    assert second.get("b") is None
+    assert second.get("a") == b"a" * 40
+    assert sum(f.stat().st_size for f in tmp_path.iterdir()) <= 100
+
+
+def test_disabled_cache_fetches_every_time(tmp_path):
+    cache = DiskLRUCache(directory=str(tmp_path / "off"), max_bytes=0)
+    calls = []
+    assert cache.get_or_fetch("k", writer(b"v", calls)) == b"v"
+    assert cache.get_or_fetch("k", writer(b"v", calls)) == b"v"
+    assert len(calls) == 2
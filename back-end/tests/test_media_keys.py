@@ -0,0 +1,56 @@
+import hashlib
+import io
+
+from app.services.media_keys import BloomFilter, KnownMediaKeys, hash_and_spool, media_key_for
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_media_key_is_content_addressed():
+    digest = hashlib.sha256(b"abc").hexdigest()
+    assert media_key_for(digest, "IMG.PNG") == f"submissions/{digest}.png"
+    assert media_key_for(digest, "noext") == f"submissions/{digest}"
+
+
+def test_hash_and_spool_keeps_bytes():
+    data = b"x" * (3 * 1024 * 1024 + 17)
+    sha256_hex, spool, size = hash_and_spool(io.BytesIO(data))
+    with spool:
+        assert sha256_hex == hashlib.sha256(data).hexdigest()
+        assert size == len(data)
+        assert spool.read() == data
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(capacity=1000)
+    keys = [f"submissions/{i}" for i in range(1000)]
+    for key in keys:
+        bloom.add(key)
+    assert all(key in bloom for key in keys)
+    false_positives = sum(f"other/{i}" in bloom for i in range(1000))
+    assert false_positives < 50
+
+
+def test_known_keys_lru_evicts_and_expires():
+    clock = FakeClock()
+    known = KnownMediaKeys(lru_size=2, bloom_capacity=100, ttl_seconds=10, clock=clock)
+    known.remember("a")
+    known.remember("b")
+    known.remember("c")
+
+    assert known.is_known("a") is False
+    assert known.maybe_known("a") is True
+    assert known.is_known("c") is True
+
+    clock.now += 11
+    assert known.is_known("c") is False
+
+    known.remember("d")
+    known.forget("d")
+    assert known.is_known("d") is False
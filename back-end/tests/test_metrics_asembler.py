@@ -1,7 +1,10 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import pytest
 from unittest.mock import MagicMock, patch
 # Обратите внимание: импорт должен быть корректным после исправления путей
-from app.services.metrics_assembler import TrustScoreAssembler 
+from app.services.metrics_assembler import DetectorPipeline, TrustScoreAssembler 
 
 # -----------------------------------------------------------
 # ФИКСАТУРЫ (Заглушки для изоляции)
@@ -101,7 +104,7 @@ def test_save_to_db_calls_create_trust_score_correctly(assembler):
         assert call_kwargs['submission_id'] == 456
         assert call_kwargs['verdict'] == "MIXED"
         assert call_kwargs['fake_probability'] == 0.5
-        assert call_kwargs['metrics_data'] == {"check_1": {"data": 1}, "check_2": {"data": 2}}
+        assert call_kwargs['ai_metadata'] == {"check_1": {"data": 1}, "check_2": {"data": 2}}
 
 def test_save_to_db_raises_error_if_verdict_missing(assembler):
     """Проверяет, что если общий вердикт не установлен, будет поднято исключение."""
@@ -112,4 +115,165 @@ def test_save_to_db_raises_error_if_verdict_missing(assembler):
     
     # Ожидаем, что будет поднята ошибка ValueError с нужным сообщением
     with pytest.raises(ValueError, match="Overall verdict and probability must be set before saving"):
-        assembler.save_to_db(mock_db_session)
\ No newline at end of file
+        assembler.save_to_db(mock_db_session)
+
+
+# -----------------------------------------------------------
+# ТЕСТЫ КОНВЕЙЕРА ДЕТЕКТОРОВ
+# -----------------------------------------------------------
+
+@pytest.fixture
+def pipeline():
+    return DetectorPipeline("test", max_workers=4)
+
+
+def test_independent_detectors_run_concurrently(pipeline):
+    @pipeline.register("slow_a", inputs=("text",))
+    def slow_a(text):
+        time.sleep(0.2)
+        return 1
+
+    @pipeline.register("slow_b", inputs=("text",))
+    def slow_b(text):
+        time.sleep(0.2)
+        return 2
+
+    started = time.perf_counter()
+    run = pipeline.run({"text": "x"})
+    elapsed = time.perf_counter() - started
+
+    assert run.value("slow_a") == 1
+    assert run.value("slow_b") == 2
+    assert elapsed < 0.35
+    assert run.outcomes["slow_a"].elapsed_ms >= 190
+
+
+def test_dependent_detector_gets_upstream_output(pipeline):
+    pipeline.register("length", inputs=("text",))(lambda text: len(text))
+    pipeline.register("double", inputs=("length",))(lambda length: length * 2)
+
+    run = pipeline.run({"text": "abcd"})
+
+    assert run.value("double") == 8
+
+
+def test_failed_and_timed_out_detectors_do_not_break_pipeline(pipeline):
+    def broken(text):
+        raise RuntimeError("boom")
+
+    def hangs(text):
+        time.sleep(1)
+        return "late"
+
+    pipeline.register("broken", inputs=("text",))(broken)
+    pipeline.register("hangs", inputs=("text",), timeout=0.1)(hangs)
+    pipeline.register("after_broken", inputs=("broken",))(lambda broken: broken is None)
+
+    run = pipeline.run({"text": "x"})
+
+    assert run.outcomes["broken"].status == "error"
+    assert run.outcomes["hangs"].status == "timeout"
+    assert run.value("hangs") is None
+    assert run.value("after_broken") is True
+    assert run.elapsed_ms < 900
+
+
+def test_weighted_combines_numbers_and_dicts(pipeline):
+    pipeline.register("zerogpt", inputs=("text",), weight=0.6)(lambda text: 1.0)
+    pipeline.register("openai", inputs=("text",), weight=0.4)(lambda text: {"ai_likeliness": 0.5})
+    pipeline.register("missing", inputs=("text",), weight=1.0)(lambda text: None)
+    pipeline.register("unweighted", inputs=("text",))(lambda text: 0.0)
+
+    run = pipeline.run({"text": "x"})
+
+    assert run.weighted("ai_likeliness") == pytest.approx(0.8)
+
+
+def test_graph_is_validated(pipeline):
+    pipeline.register("a", inputs=("b",))(lambda b: b)
+    pipeline.register("b", inputs=("a",))(lambda a: a)
+    with pytest.raises(ValueError, match="cycle"):
+        pipeline.run({})
+
+    other = DetectorPipeline("other")
+    other.register("c", inputs=("nope",))(lambda nope: nope)
+    with pytest.raises(ValueError, match="unknown input"):
+        other.run({})
+
+    with pytest.raises(ValueError, match="already registered"):
+        other.register("c")(lambda: None)
+
+
+def test_skip_if_skips_detector_and_its_consumers_get_none(pipeline):
+    called = []
+
+    def remote(text, local):
+        called.append(text)
+        return 0.9
+
+    pipeline.register("local", inputs=("text",), weight=1.0)(lambda text: {"confidence": 0.95, "ai_likeliness": 0.1})
+    pipeline.register(
+        "remote", inputs=("text", "local"), weight=1.0, skip_if=lambda text, local: local["confidence"] > 0.9
+    )(remote)
+    pipeline.register("after_remote", inputs=("remote",))(lambda remote: remote is None)
+
+    run = pipeline.run({"text": "x"})
+
+    assert called == []
+    assert run.outcomes["remote"].status == "skipped"
+    assert run.value("after_remote") is True
+    assert run.weighted("ai_likeliness") == pytest.approx(0.1)
+
+
+def test_pipeline_run_goes_into_ai_metadata(pipeline, assembler):
+    pipeline.register("score", inputs=("text",), weight=1.0)(lambda text: 0.25)
+    pipeline.register("broken", inputs=("text",))(lambda text: 1 / 0)
+
+    assembler.add_pipeline_run(pipeline.run({"text": "x"}))
+    metadata = assembler.assemble()["pipeline"]
+
+    assert metadata["detectors"]["score"]["status"] == "ok"
+    assert metadata["detectors"]["score"]["value"] == 0.25
+    assert metadata["detectors"]["score"]["weight"] == 1.0
+    assert metadata["detectors"]["broken"]["status"] == "error"
+    assert "ZeroDivisionError" in metadata["detectors"]["broken"]["error"]
+    assert "elapsed_ms" in metadata
+
+
+def test_concurrent_runs_do_not_share_a_queue(pipeline):
+    # 20 запросов одновременно: время в очереди общего пула не должно съедать таймаут
+    pipeline.register("remote", inputs=("text",), timeout=0.5)(lambda text: time.sleep(0.3) or 1)
+    pipeline.register("local", inputs=("text",), timeout=0.5)(lambda text: time.sleep(0.3) or 2)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=20) as requests:
+        runs = list(requests.map(lambda i: pipeline.run({"text": str(i)}), range(20)))
+
+    assert [run.outcomes["remote"].status for run in runs] == ["ok"] * 20
+    assert [run.value("local") for run in runs] == [2] * 20
+    assert time.perf_counter() - started < 1.0
+
+
+def test_queued_detector_deadline_starts_when_it_runs():
+    # Один поток на прогон: второй детектор ждёт первого, но его таймаут идёт только с его старта
+    pipeline = DetectorPipeline("test", max_workers=1)
+    pipeline.register("first", inputs=("text",), timeout=1)(lambda text: time.sleep(0.3) or 1)
+    pipeline.register("second", inputs=("text",), timeout=0.2)(lambda text: time.sleep(0.1) or 2)
+
+    run = pipeline.run({"text": "x"})
+
+    assert run.value("first") == 1
+    assert run.value("second") == 2
+
+
+def test_queued_detector_times_out_when_workers_are_stuck():
+    pipeline = DetectorPipeline("test", max_workers=1)
+    pipeline.register("hangs", inputs=("text",), timeout=0.1)(lambda text: time.sleep(1))
+    pipeline.register("queued", inputs=("text",), timeout=0.1)(lambda text: 1)
+
+    run = pipeline.run({"text": "x"})
+
+    # Единственный поток занят зависшим "hangs" — "queued" не ждёт его бесконечно
+    assert run.outcomes["hangs"].status == "timeout"
+    assert run.outcomes["queued"].status == "timeout"
+    assert run.elapsed_ms < 500
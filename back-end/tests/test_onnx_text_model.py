@@ -0,0 +1,67 @@
+import json
+import os
+
+import numpy as np
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import Pipeline
+
+from app.services.onnx_text_model import OnnxTextModel, export_to_onnx
+from app.services.text_classifier_service import TextClassifier, load_text_model
+
+DATASET = os.path.join(os.path.dirname(__file__), "..", "ddd", "dataset_5000.json")
+
+
+@pytest.fixture(scope="module")
+def fitted_pipeline():
+    with open(DATASET, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    # Та же конфигурация, что в ddd/ClassificationModer.py
+    pipeline = Pipeline([
+        ("tfidf", TfidfVectorizer(ngram_range=(1, 2), max_features=100000, sublinear_tf=True)),
+        ("clf", LogisticRegression(max_iter=500, C=2.0)),
+    ])
+    pipeline.fit([d["text"] for d in data], [d["label"] for d in data])
+    return pipeline
+
+
+@pytest.fixture(scope="module")
+def onnx_path(fitted_pipeline, tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("onnx") / "model.onnx")
+    export_to_onnx(fitted_pipeline, path)
+    return path
+
+
+PARITY_TEXTS = [
+    "Все прошло идеально",
+    "Не рекомендую",
+    "НИЧЕГО НЕ РАБОТАЕТ!!!",
+    "Худший выбор, но доставка быстрая",
+    "Great product, works fine",
+    "ёлка, Ёжик и 42 попугая",
+    "",
+]
+
+
+def test_onnx_matches_sklearn(fitted_pipeline, onnx_path):
+    model = OnnxTextModel(onnx_path)
+
+    assert list(model.classes_) == list(fitted_pipeline.classes_)
+    np.testing.assert_allclose(
+        model.predict_proba(PARITY_TEXTS),
+        fitted_pipeline.predict_proba(PARITY_TEXTS),
+        atol=1e-5,
+    )
+    assert model.predict(PARITY_TEXTS) == list(fitted_pipeline.predict(PARITY_TEXTS))
+
+
+def test_onnx_backend_behind_text_classifier(onnx_path):
+    assert isinstance(load_text_model(onnx_path), OnnxTextModel)
+
+    classifier = TextClassifier(path=onnx_path, batch_wait_ms=1)
+    assert classifier.load() is True
+    try:
+        assert classifier.classify("Не рекомендую")["label"] == "negative"
+    finally:
+        classifier.batcher.close()
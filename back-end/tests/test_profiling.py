@@ -0,0 +1,93 @@
+import time
+from unittest.mock import patch
+
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+from app.services.profiling import ProfileStore, ProfilingMiddleware, StackSampler, collapsed_stacks
+
+
+def busy_loop(seconds: float) -> int:
+    total, deadline = 0, time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        total += sum(range(200))
+    return total
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ProfileStore(str(tmp_path), keep=3)
+
+
+def make_client(store, sample_rate=0.0):
+    app = FastAPI()
+
+    @app.get("/work")
+    def work():
+        busy_loop(0.15)
+        return {"ok": True}
+
+    app.add_middleware(ProfilingMiddleware, admin_token="secret", sample_rate=sample_rate, store=store)
+    return TestClient(app)
+
+
+def test_sampler_sees_busy_function():
+    sampler = StackSampler(interval=0.002)
+    sampler.start()
+    busy_loop(0.1)
+    sampler.stop()
+
+    assert sampler.samples > 10
+    assert any("busy_loop (tests/test_profiling.py" in stack for stack in sampler.stacks)
+
+
+def test_admin_header_profiles_request(store):
+    client = make_client(store)
+
+    resp = client.get("/work", headers={"X-Profile": "1", "X-Admin-Token": "secret"})
+
+    profile_id = resp.headers["x-profile-id"]
+    profile = store.get(profile_id)
+    assert profile["route"] == "/work"
+    assert profile["status"] == 200
+    assert profile["duration_ms"] >= 150
+    assert "busy_loop" in collapsed_stacks(profile)
+    assert profile["allocations"]
+    assert [item["id"] for item in store.list()] == [profile_id]
+
+
+def test_requests_without_valid_header_are_not_profiled(store):
+    client = make_client(store)
+
+    assert "x-profile-id" not in client.get("/work").headers
+    assert "x-profile-id" not in client.get("/work", headers={"X-Profile": "1", "X-Admin-Token": "wrong"}).headers
+    resp = client.get("/work", headers={"X-Profile": "1", "X-Admin-Token": "секрет".encode("utf-8")})
+    assert resp.status_code == 200 and "x-profile-id" not in resp.headers
+    assert store.list() == []
+
+
+def test_sampling_and_retention(store):
+    client = make_client(store, sample_rate=1.0)
+
+    ids = [client.get("/work").headers["x-profile-id"] for _ in range(4)]
+
+    assert len(store.list()) == 3
+    assert store.get(ids[0]) is None
+    assert store.get(ids[-1]) is not None
+
+
+def test_store_rejects_malformed_ids(store):
+    assert store.get("../../etc/passwd") is None
+    assert store.get("0" * 32) is None
+
+
+def test_require_admin_rejects_non_ascii_token_with_403():
+    from app import main
+
+    with patch.object(main, "ADMIN_API_TOKEN", "secret"):
+        main.require_admin("secret")
+        # Starlette отдаёт заголовок, декодированный как latin-1
+        with pytest.raises(HTTPException) as error:
+            main.require_admin("секрет".encode("utf-8").decode("latin-1"))
+    assert error.value.status_code == 403
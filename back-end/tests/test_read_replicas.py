@@ -0,0 +1,166 @@
+import uuid
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.models import database_ops
+from app.models.database_ops import ReadReplicaRouter, ReplicaState, parse_pg_lsn
+
+
+# -----------------------------------------------------------
+# ФИКСАТУРЫ (фейковые реплики без настоящего Postgres)
+# -----------------------------------------------------------
+
+class FakeClock:
+    """Управляемые часы вместо time.monotonic."""
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeProbe:
+    """Возвращает заранее заданные (лаг, LSN) для каждой реплики."""
+    def __init__(self):
+        self.state = {}
+        self.calls = 0
+
+    def __call__(self, replica_engine):
+        self.calls += 1
+        value = self.state[replica_engine]
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def probe():
+    return FakeProbe()
+
+
+def make_router(probe, clock, names=("r1", "r2")):
+    replicas = [ReplicaState(name=n, replica_engine=n) for n in names]
+    return ReadReplicaRouter(
+        replicas,
+        max_lag_seconds=5,
+        sticky_seconds=10,
+        check_interval=1,
+        probe=probe,
+        clock=clock,
+    )
+
+
+# -----------------------------------------------------------
+# ТЕСТЫ
+# -----------------------------------------------------------
+
+def test_parse_pg_lsn():
+    assert parse_pg_lsn("0/0") == 0
+    assert parse_pg_lsn("16/B374D848") == (0x16 << 32) | 0xB374D848
+    assert parse_pg_lsn(None) is None
+    assert parse_pg_lsn("1/0") > parse_pg_lsn("0/FFFFFFFF")
+
+
+def test_no_replicas_means_primary(probe, clock):
+    router = ReadReplicaRouter([], probe=probe, clock=clock)
+    assert router.enabled is False
+    assert router.choose(uuid.uuid4()) is None
+
+
+def test_fresh_replicas_are_used_round_robin(probe, clock):
+    probe.state = {"r1": (0.0, 100), "r2": (0.5, 100)}
+    router = make_router(probe, clock)
+
+    chosen = {router.choose(None).name for _ in range(4)}
+    assert chosen == {"r1", "r2"}
+
+
+def test_stale_replica_falls_back(probe, clock):
+    probe.state = {"r1": (30.0, 100), "r2": (0.0, 100)}
+    router = make_router(probe, clock)
+
+    for _ in range(3):
+        assert router.choose(None).name == "r2"
+
+    # Обе реплики отстают — читаем с primary
+    probe.state["r2"] = (60.0, 100)
+    clock.now += 2
+    assert router.choose(None) is None
+
+
+def test_unreachable_replica_is_skipped(probe, clock):
+    probe.state = {"r1": ConnectionError("down"), "r2": (0.0, 100)}
+    router = make_router(probe, clock)
+
+    assert router.choose(None).name == "r2"
+    assert router.replicas[0].healthy is False
+
+
+def test_lag_probe_is_cached(probe, clock):
+    probe.state = {"r1": (0.0, 100)}
+    router = make_router(probe, clock, names=("r1",))
+
+    router.choose(None)
+    router.choose(None)
+    assert probe.calls == 1
+
+    clock.now += 1.5
+    router.choose(None)
+    assert probe.calls == 2
+
+
+def test_read_your_writes_waits_for_lsn(probe, clock):
+    user_id = uuid.uuid4()
+    probe.state = {"r1": (0.1, 100)}
+    router = make_router(probe, clock, names=("r1",))
+
+    router.note_write(user_id, lsn=150)
+    # Реплика ещё не проиграла WAL до записи пользователя
+    assert router.choose(user_id) is None
+    # Остальные пользователи продолжают читать с реплики
+    assert router.choose(uuid.uuid4()).name == "r1"
+
+    # Реплика догнала — пользователь снова читает с неё
+    probe.state["r1"] = (0.0, 200)
+    assert router.choose(user_id).name == "r1"
+
+
+def test_sticky_without_lsn_expires(probe, clock):
+    user_id = uuid.uuid4()
+    probe.state = {"r1": (0.0, 100)}
+    router = make_router(probe, clock, names=("r1",))
+
+    router.note_write(user_id, lsn=None)
+    assert router.choose(user_id) is None
+
+    clock.now += 11
+    assert router.choose(user_id).name == "r1"
+
+
+def test_old_writes_are_pruned(probe, clock):
+    router = make_router(probe, clock)
+    for _ in range(5):
+        router.note_write(uuid.uuid4(), lsn=1)
+    clock.now += 20
+    router.note_write(uuid.uuid4(), lsn=1)
+
+    assert len(router._recent_writes) == 1
+
+
+def test_history_deletes_pin_user_to_primary():
+    user_id = uuid.uuid4()
+    db = MagicMock()
+    db.query.return_value.filter.return_value.first.return_value.content_hash = None
+    db.execute.return_value.all.return_value = [(None, None), (None, None)]
+
+    with patch.object(database_ops, "note_user_write") as note:
+        assert database_ops.delete_history_item(db, user_id, uuid.uuid4())
+        assert database_ops.delete_all_history_for_user(db, user_id) == 2
+
+    assert [c.args for c in note.call_args_list] == [(db, user_id), (db, user_id)]
@@ -1,7 +1,30 @@
 import pytest
 from unittest.mock import patch, MagicMock
+import hashlib
 import io
 import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlparse, parse_qs
+
+import boto3
+import requests
+from botocore.config import Config as BotoConfig
+from botocore.exceptions import ClientError
+from botocore.response import StreamingBody
+from botocore.stub import Stubber
+
+from app.services import storage_service
+from app.services.storage_service import (
+    MediaChangedError,
+    RangedMediaReader,
+    create_presigned_upload,
+    head_media_file,
+    owns_upload_key,
+    read_media_range,
+    sniff_image_type,
+    sniff_media_file,
+)
 from app.services.storage_service import (
     upload_media_file, 
     get_file_url,
@@ -66,4 +89,342 @@ def test_get_file_url_generation():
     expected_url = f"{R2_ENDPOINT_URL}/{R2_BUCKET_NAME}/{test_key}"
     actual_url = get_file_url(test_key)
     
-    assert actual_url == expected_url
\ No newline at end of file
+    assert actual_url == expected_url
+
+@patch('app.services.storage_service.s3_client')
+def test_duplicate_upload_is_skipped(mock_s3_client):
+    """Одинаковое содержимое получает один ключ, повторная загрузка не выполняется."""
+
+    content = b"same bytes for dedupe test"
+    first_key = upload_media_file(io.BytesIO(content), "photo.JPG", "image/jpeg")
+    second_key = upload_media_file(io.BytesIO(content), "copy.jpg", "image/jpeg")
+
+    assert first_key == second_key
+    assert first_key.endswith(".jpg")
+    mock_s3_client.upload_fileobj.assert_called_once()
+
+
+# -----------------------------------------------------------
+# PRESIGNED-ЗАГРУЗКИ (локальный S3: MinIO / moto server)
+# -----------------------------------------------------------
+
+# Для сквозного теста: S3_TEST_ENDPOINT_URL=http://localhost:9000 (MinIO) и существующий бакет
+S3_TEST_ENDPOINT_URL = os.getenv("S3_TEST_ENDPOINT_URL")
+S3_TEST_BUCKET = os.getenv("S3_TEST_BUCKET", "amkid-test")
+
+
+def local_s3_client(endpoint_url="http://localhost:9000"):
+    return boto3.client(
+        "s3",
+        endpoint_url=endpoint_url,
+        aws_access_key_id=os.getenv("S3_TEST_ACCESS_KEY", "minioadmin"),
+        aws_secret_access_key=os.getenv("S3_TEST_SECRET_KEY", "minioadmin"),
+        region_name="us-east-1",
+        config=BotoConfig(signature_version="s3v4"),
+    )
+
+
+def test_presigned_upload_is_scoped_to_user():
+    user_id = uuid.uuid4()
+    with patch.object(storage_service, "s3_client", local_s3_client()), \
+            patch.object(storage_service, "R2_BUCKET_NAME", "bucket"):
+        upload = create_presigned_upload(user_id, "Photo.PNG", "image/png")
+
+    assert upload["method"] == "PUT"
+    assert upload["key"].startswith(f"uploads/{user_id}/")
+    assert upload["key"].endswith(".png")
+    assert upload["headers"] == {"Content-Type": "image/png"}
+
+    url = urlparse(upload["url"])
+    assert url.path == f"/bucket/{upload['key']}"
+    assert "X-Amz-Signature" in parse_qs(url.query)
+
+    assert owns_upload_key(user_id, upload["key"])
+    assert not owns_upload_key(uuid.uuid4(), upload["key"])
+    assert not owns_upload_key(user_id, f"uploads/{user_id}/../other/x.png")
+
+
+def test_head_media_file_missing_object():
+    client = local_s3_client()
+    with Stubber(client) as stubber, patch.object(storage_service, "s3_client", client), \
+            patch.object(storage_service, "R2_BUCKET_NAME", "bucket"):
+        stubber.add_client_error("head_object", service_error_code="404", http_status_code=404)
+        stubber.add_response("head_object", {"ContentLength": 42, "ContentType": "image/png", "ETag": '"abc"'})
+
+        assert head_media_file("uploads/x/missing.png") is None
+        assert head_media_file("uploads/x/present.png") == {"size": 42, "content_type": "image/png", "etag": '"abc"'}
+
+
+@pytest.mark.skipif(not S3_TEST_ENDPOINT_URL, reason="S3_TEST_ENDPOINT_URL не задан (нужен MinIO/moto server)")
+def test_presigned_put_roundtrip_against_local_s3(tmp_path):
+    client = local_s3_client(S3_TEST_ENDPOINT_URL)
+    user_id = uuid.uuid4()
+    payload = b"\x89PNG fake image bytes"
+    with patch.object(storage_service, "s3_client", client), \
+            patch.object(storage_service, "R2_BUCKET_NAME", S3_TEST_BUCKET), \
+            patch.object(storage_service.media_cache, "get", return_value=storage_service.DiskLRUCache(str(tmp_path), 1024 * 1024)):
+        upload = create_presigned_upload(user_id, "pic.png", "image/png")
+        response = requests.put(upload["url"], data=payload, headers=upload["headers"], timeout=10)
+        assert response.status_code == 200
+
+        meta = head_media_file(upload["key"])
+        assert meta["size"] == len(payload)
+        content_key, data = storage_service.claim_direct_upload(upload["key"], meta)
+        assert bytes(data) == payload
+        assert content_key.startswith("submissions/")
+        assert head_media_file(upload["key"]) is None
+
+
+class FakeBucketS3:
+    """Бакет в памяти с условными запросами (IfMatch / CopySourceIfMatch) и Range."""
+    def __init__(self):
+        self.objects = {}
+        self.deleted = []
+
+    def put(self, key, data, modified=None):
+        self.objects[key] = {
+            "data": data,
+            "etag": f'"{hashlib.md5(data).hexdigest()}"',
+            "modified": modified or datetime.now(timezone.utc),
+        }
+
+    def _precondition(self, key, etag):
+        if self.objects[key]["etag"] != etag:
+            raise ClientError({"Error": {"Code": "PreconditionFailed"}}, "GetObject")
+
+    def head_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise ClientError({"Error": {"Code": "404"}}, "HeadObject")
+        obj = self.objects[Key]
+        return {"ContentLength": len(obj["data"]), "ContentType": "image/png", "ETag": obj["etag"]}
+
+    def get_object(self, Bucket, Key, IfMatch=None, Range=None):
+        self._precondition(Key, IfMatch)
+        data = self.objects[Key]["data"]
+        if Range:
+            start, _, end = Range[len("bytes="):].partition("-")
+            data = data[int(start):int(end) + 1]
+        return {"Body": StreamingBody(io.BytesIO(data), len(data))}
+
+    def download_fileobj(self, Bucket, Key, Fileobj, Config=None):
+        Fileobj.write(self.objects[Key]["data"])
+
+    def copy_object(self, Bucket, Key, CopySource, CopySourceIfMatch, **kwargs):
+        self._precondition(CopySource["Key"], CopySourceIfMatch)
+        self.put(Key, self.objects[CopySource["Key"]]["data"])
+
+    def delete_object(self, Bucket, Key):
+        self.deleted.append(Key)
+        self.objects.pop(Key, None)
+
+    def get_paginator(self, name):
+        objects = self.objects
+
+        class Paginator:
+            def paginate(self, Bucket, Prefix):
+                yield {"Contents": [
+                    {"Key": k, "LastModified": o["modified"]} for k, o in objects.items() if k.startswith(Prefix)
+                ]}
+        return Paginator()
+
+    def delete_objects(self, Bucket, Delete):
+        for item in Delete["Objects"]:
+            self.delete_object(Bucket, item["Key"])
+
+
+@pytest.fixture
+def bucket(tmp_path):
+    fake = FakeBucketS3()
+    with patch.object(storage_service, "s3_client", fake), \
+            patch.object(storage_service, "known_media_keys", storage_service.KnownMediaKeys()), \
+            patch.object(storage_service.media_cache, "get", return_value=storage_service.DiskLRUCache(str(tmp_path), 1024 * 1024)):
+        yield fake
+
+
+def test_claim_direct_upload_moves_object_to_content_key(bucket):
+    payload = b"\x89PNG\r\n\x1a\n" + b"pixels" * 100
+    bucket.put("uploads/u/a.png", payload)
+
+    content_key, data = storage_service.claim_direct_upload("uploads/u/a.png", head_media_file("uploads/u/a.png"))
+
+    assert bytes(data) == payload
+    assert content_key == f"submissions/{hashlib.sha256(payload).hexdigest()}.png"
+    assert bucket.objects[content_key]["data"] == payload
+    assert "uploads/u/a.png" not in bucket.objects
+
+
+def test_claim_direct_upload_rejects_object_replaced_after_head(bucket):
+    bucket.put("uploads/u/a.png", b"small")
+    meta = head_media_file("uploads/u/a.png")
+    # Повторный PUT по тому же presigned URL после проверки размера
+    bucket.put("uploads/u/a.png", b"huge" * 10000)
+
+    assert storage_service.claim_direct_upload("uploads/u/a.png", meta) is None
+    assert not any(key.startswith("submissions/") for key in bucket.objects)
+
+
+def test_claim_direct_upload_reads_no_more_than_checked_size(bucket):
+    bucket.put("uploads/u/a.png", b"0123456789")
+    meta = head_media_file("uploads/u/a.png")
+    meta["size"] = 4  # как если бы HEAD видел меньший объект с тем же etag
+
+    content_key, data = storage_service.claim_direct_upload("uploads/u/a.png", meta)
+
+    assert bytes(data) == b"0123"
+
+
+def test_claim_direct_upload_refuses_key_that_is_being_purged(bucket):
+    bucket.put("uploads/u/a.png", b"image")
+    with patch.object(storage_service, "acquire_media_ref", return_value=None):
+        claimed = storage_service.claim_direct_upload("uploads/u/a.png", head_media_file("uploads/u/a.png"), db=MagicMock())
+
+    assert claimed is None
+    assert not any(key.startswith("submissions/") for key in bucket.objects)
+
+
+def test_download_media_file_returns_bytes_and_caches_only_content_keys(bucket):
+    bucket.put("submissions/abc.png", b"immutable")
+    bucket.put("uploads/u/a.png", b"first")
+
+    assert storage_service.download_media_file("submissions/abc.png") == b"immutable"
+    assert storage_service.download_media_file("uploads/u/a.png") == b"first"
+    # Повторный PUT по presigned URL: изменяемый ключ читается мимо кеша
+    bucket.put("uploads/u/a.png", b"second")
+    bucket.put("submissions/abc.png", b"never happens")
+
+    assert storage_service.download_media_file("uploads/u/a.png") == b"second"
+    assert storage_service.download_media_file("submissions/abc.png") == b"immutable"
+    assert storage_service.media_cache.get().stats()["entries"] == 1
+
+
+def test_purge_orphaned_media_deletes_objects_before_rows(bucket):
+    bucket.put("submissions/a.png", b"a")
+    bucket.put("submissions/b.png", b"b")
+    events = []
+    db = MagicMock()
+    db.commit.side_effect = lambda: events.append("commit")
+    delete_object = bucket.delete_object
+
+    def flaky_delete(Bucket, Key):
+        events.append(f"delete {Key}")
+        if Key == "submissions/b.png":
+            raise ClientError({"Error": {"Code": "500"}}, "DeleteObject")
+        delete_object(Bucket, Key)
+
+    bucket.delete_object = flaky_delete
+    with patch.object(storage_service, "claim_orphaned_media", return_value=["submissions/a.png", "submissions/b.png"]), \
+            patch.object(storage_service, "forget_media_objects", side_effect=lambda db, keys: events.append(f"forget {keys}")):
+        assert storage_service.purge_orphaned_media(db) == ["submissions/a.png"]
+
+    # Пометка закоммичена до удаления; запись b остаётся помеченной и будет забрана повторно
+    assert events == [
+        "commit",
+        "delete submissions/a.png",
+        "delete submissions/b.png",
+        "forget ['submissions/a.png']",
+        "commit",
+    ]
+
+
+def test_purge_stale_uploads_removes_only_old_objects(bucket):
+    old = datetime.now(timezone.utc) - timedelta(hours=2)
+    bucket.put("uploads/u/old.png", b"x", modified=old)
+    bucket.put("uploads/u/new.png", b"y")
+    bucket.put("submissions/abc.png", b"z", modified=old)
+
+    assert storage_service.purge_stale_uploads(max_age_seconds=3600) == ["uploads/u/old.png"]
+    assert set(bucket.objects) == {"uploads/u/new.png", "submissions/abc.png"}
+
+
+# -----------------------------------------------------------
+# ЧАСТИЧНОЕ ЧТЕНИЕ
+# -----------------------------------------------------------
+
+class FakeRangeS3:
+    """get_object/head_object с поддержкой Range и IfMatch поверх байтов в памяти."""
+    def __init__(self, data: bytes):
+        self.data = data
+        self.etag = '"v1"'
+        self.ranges = []
+
+    def head_object(self, Bucket, Key):
+        return {"ContentLength": len(self.data), "ContentType": "image/png", "ETag": self.etag}
+
+    def get_object(self, Bucket, Key, Range=None, IfMatch=None):
+        if IfMatch is not None and IfMatch != self.etag:
+            raise ClientError({"Error": {"Code": "PreconditionFailed"}}, "GetObject")
+        self.ranges.append(Range)
+        data = self.data
+        if Range:
+            start, _, end = Range[len("bytes="):].partition("-")
+            data = data[int(start):int(end) + 1 if end else None]
+        return {"Body": StreamingBody(io.BytesIO(data), len(data))}
+
+
+@pytest.fixture
+def range_s3(tmp_path):
+    fake = FakeRangeS3(bytes(range(256)) * 100)
+    with patch.object(storage_service, "s3_client", fake), \
+            patch.object(storage_service.media_cache, "get", return_value=storage_service.DiskLRUCache(str(tmp_path), 0)):
+        yield fake
+
+
+def test_read_media_range_requests_only_needed_bytes(range_s3):
+    assert read_media_range("k", 10, 19) == range_s3.data[10:20]
+    assert range_s3.ranges == ["bytes=10-19"]
+
+
+def test_read_media_range_refuses_overwritten_object(range_s3):
+    with pytest.raises(MediaChangedError):
+        read_media_range("k", 0, 9, etag='"v0"')
+    assert read_media_range("k", 0, 9, etag='"v1"') == range_s3.data[:10]
+
+
+def test_ranged_reader_seeks_and_reuses_block(range_s3):
+    reader = RangedMediaReader("k", block_size=4096)
+    assert reader.read(4) == range_s3.data[:4]
+    assert reader.read(4) == range_s3.data[4:8]
+    assert reader.requests == 1
+    reader.seek(-10, io.SEEK_END)
+    assert reader.read() == range_s3.data[-10:]
+    assert reader.read(1) == b""
+    reader.seek(20000)
+    assert reader.tell() == 20000
+    assert reader.read(3) == range_s3.data[20000:20003]
+    assert reader.requests == 3
+
+
+def test_image_header_is_read_from_first_block(range_s3):
+    from PIL import Image
+    from app.services.image_forensics import read_image_header
+
+    exif = Image.Exif()
+    exif[0x010F] = "Canon"
+    noise = Image.effect_noise((1200, 900), 64).convert("RGB")
+    buffer = io.BytesIO()
+    noise.save(buffer, "JPEG", exif=exif, quality=95)
+    range_s3.data = buffer.getvalue()
+    assert len(range_s3.data) > 4 * storage_service.MEDIA_RANGE_BLOCK_BYTES
+
+    reader = RangedMediaReader("k", etag='"v1"')
+    header = read_image_header(reader)
+
+    assert (header["format"], header["width"], header["height"]) == ("JPEG", 1200, 900)
+    assert header["camera"] == "Canon"
+    assert header["jpeg"] is True
+    assert reader.requests == 1
+
+
+def test_sniff_media_file_reads_only_signature(range_s3):
+    range_s3.data = b"%PDF-1.7" + b"\0" * 1000
+    assert sniff_media_file("k") is None
+    range_s3.data = b"\x89PNG\r\n\x1a\n" + b"\0" * 1000
+    assert sniff_media_file("k") == "image/png"
+    assert range_s3.ranges[-1] == f"bytes=0-{storage_service.MEDIA_SNIFF_BYTES - 1}"
+
+
+def test_sniff_image_type():
+    assert sniff_image_type(b"\x89PNG\r\n\x1a\n" + b"\0" * 8) == "image/png"
+    assert sniff_image_type(b"\xff\xd8\xff\xe0") == "image/jpeg"
+    assert sniff_image_type(b"RIFF\0\0\0\0WEBPVP8 ") == "image/webp"
+    assert sniff_image_type(b"%PDF-1.7") is None
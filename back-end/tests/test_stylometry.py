@@ -0,0 +1,110 @@
+import os
+import random
+from unittest.mock import patch
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from app.services.stylometry import (
+    NgramLanguageModel,
+    StylometryScorer,
+    _moving_ttr,
+    extract_features,
+    reference_stats,
+)
+
+WORDS = "кот пёс дом лес река поле город море небо солнце ветер дождь снег утро вечер".split()
+
+
+def _human_like(seed):
+    """Предложения разной длины из случайных слов."""
+    rng = random.Random(seed)
+    sentences = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 18))) for _ in range(rng.randint(6, 12))]
+    return ". ".join(s.capitalize() for s in sentences) + "."
+
+
+def _uniform(text="Все прошло идеально и без проблем", repeat=12):
+    return ". ".join([text] * repeat) + "."
+
+
+@pytest.fixture
+def model_path(tmp_path):
+    corpus = [_human_like(seed) for seed in range(200)]
+    model = NgramLanguageModel.fit(corpus, order=3, buckets=2 ** 12)
+    path = str(tmp_path / "lm.npz")
+    model.save(path, **reference_stats(model, corpus))
+    return path
+
+
+def test_moving_ttr_matches_naive_definition():
+    rng = random.Random(0)
+    words = [rng.choice(WORDS) for _ in range(300)]
+    naive = sum(len(set(words[s:s + 50])) for s in range(251)) / 251 / 50
+
+    assert _moving_ttr(words) == pytest.approx(naive)
+    assert _moving_ttr(["a", "b", "a"]) == pytest.approx(2 / 3)
+
+
+def test_language_model_prefers_in_domain_text(model_path):
+    model = NgramLanguageModel.load(model_path)
+
+    in_domain = -model.char_log_probs(_human_like(999)).mean()
+    out_of_domain = -model.char_log_probs("the quick brown fox jumps over the lazy dog " * 5).mean()
+
+    assert in_domain < out_of_domain
+    assert np.all(np.isfinite(model.char_log_probs("совсем новые символы: ½ ∑ ☃")))
+
+
+def test_short_text_has_no_score(model_path):
+    assert extract_features("Слишком коротко.") is None
+    assert StylometryScorer(model_path).score("Слишком коротко.") is None
+
+
+def test_uniform_text_scores_more_ai_like_than_varied_text(model_path):
+    scorer = StylometryScorer(model_path)
+    assert scorer.load() is True
+
+    varied = scorer.score(_human_like(12345))
+    uniform = scorer.score(_uniform())
+
+    assert uniform["ai_likeliness"] > varied["ai_likeliness"]
+    assert uniform["features"]["sentence_burstiness"] == pytest.approx(0.0)
+    assert "cross_entropy" in varied["features"] and "perplexity_burstiness" in varied["features"]
+    assert 0.0 < varied["confidence"] <= 1.0
+
+
+def test_scorer_works_without_model():
+    scorer = StylometryScorer("/nonexistent.npz")
+    assert scorer.load() is False
+
+    result = scorer.score(_uniform())
+    assert result is not None
+    assert "cross_entropy" not in result["features"]
+    assert result["ai_likeliness"] > 0.5
+
+
+def test_model_without_reference_stats_is_reported(tmp_path, caplog):
+    corpus = [_human_like(seed) for seed in range(20)]
+    path = str(tmp_path / "lm.npz")
+    NgramLanguageModel.fit(corpus, order=3, buckets=2 ** 12).save(path)
+
+    scorer = StylometryScorer(path)
+    with caplog.at_level("WARNING", logger="app.services.stylometry"):
+        assert scorer.load() is True
+
+    assert "cross_entropy" in caplog.text and "perplexity_burstiness" in caplog.text
+    assert "cross_entropy" in scorer.score(_human_like(1))["features"]
+
+
+def test_zerogpt_slot_falls_back_to_stylometry():
+    # ai_service создаёт клиент OpenAI при импорте; сеть здесь не используется
+    os.environ.setdefault("OPENAI_API_KEY", "test-key")
+    from app.services import ai_service
+
+    local = {"ai_likeliness": 0.7, "confidence": 0.5, "features": {}}
+    with patch.object(ai_service, "check_text_with_zerogpt", return_value=None):
+        assert ai_service.detect_text_with_zerogpt("x", local) == {"ai_likeliness": 0.7, "source": "stylometry"}
+        assert ai_service.detect_text_with_zerogpt("x", None) is None
+    with patch.object(ai_service, "check_text_with_zerogpt", return_value=0.2):
+        assert ai_service.detect_text_with_zerogpt("x", local) == {"ai_likeliness": 0.2, "source": "zerogpt"}
@@ -0,0 +1,85 @@
+import threading
+
+import pytest
+
+from app.services.text_classifier_service import MicroBatcher, TextClassifier, load_text_model
+
+
+class FakeModel:
+    """predict_proba считает вызовы и размеры батчей."""
+    classes_ = ["negative", "positive"]
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def predict_proba(self, texts):
+        self.batch_sizes.append(len(texts))
+        return [[0.0, 1.0] if "хорош" in t else [1.0, 0.0] for t in texts]
+
+
+@pytest.fixture
+def classifier():
+    clf = TextClassifier(path="/nonexistent.joblib", batch_wait_ms=50, max_batch=64)
+    clf.set_model(FakeModel())
+    yield clf
+    clf.batcher.close()
+
+
+def test_missing_model_disables_classifier():
+    clf = TextClassifier(path="/nonexistent.joblib")
+    assert clf.load() is False
+    with pytest.raises(RuntimeError):
+        clf.predict_proba("текст")
+
+
+def test_single_prediction(classifier):
+    result = classifier.classify("всё хорошо")
+    assert result["label"] == "positive"
+    assert result["probabilities"] == {"negative": 0.0, "positive": 1.0}
+
+
+def test_concurrent_requests_are_batched(classifier):
+    texts = [f"хорошо {i}" if i % 2 else f"плохо {i}" for i in range(20)]
+    results = [None] * len(texts)
+    barrier = threading.Barrier(len(texts))
+
+    def worker(i):
+        barrier.wait()
+        results[i] = classifier.predict_proba(texts[i])
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(len(texts))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sum(classifier.model.batch_sizes) == 20
+    assert len(classifier.model.batch_sizes) < 20
+    for text, result in zip(texts, results):
+        assert result["positive"] == (1.0 if "хорошо" in text else 0.0)
+
+
+def test_batch_error_reaches_every_caller():
+    def broken(texts):
+        raise ValueError("model failure")
+
+    batcher = MicroBatcher(broken, batch_wait_ms=1)
+    futures = [batcher.submit("a"), batcher.submit("b")]
+    for future in futures:
+        with pytest.raises(ValueError):
+            future.result(timeout=1)
+    batcher.close()
+
+
+def test_joblib_model_is_memory_mapped(tmp_path):
+    joblib = pytest.importorskip("joblib")
+    np = pytest.importorskip("numpy")
+    sklearn_linear = pytest.importorskip("sklearn.linear_model")
+
+    model = sklearn_linear.LogisticRegression().fit(np.array([[0.0], [1.0], [2.0], [3.0]]), [0, 0, 1, 1])
+    path = tmp_path / "model.joblib"
+    joblib.dump(model, path)
+
+    loaded = load_text_model(str(path))
+    assert isinstance(loaded.coef_, np.memmap)
+    assert list(loaded.predict([[0.0], [3.0]])) == [0, 1]
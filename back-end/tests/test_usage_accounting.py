@@ -0,0 +1,125 @@
+import json
+import queue
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from app.models.schemas import TextAnalyzeResponse
+from app.services.metrics_assembler import DetectorPipeline
+from app.services.usage_accounting import call_cost_usd, completion_usage, summarize_usage, usage_from_run
+
+
+def fake_completion(prompt=1000, completion=200, cached=400, model="gpt-4.1-mini-2025-04-14"):
+    usage = SimpleNamespace(
+        prompt_tokens=prompt,
+        completion_tokens=completion,
+        prompt_tokens_details=SimpleNamespace(cached_tokens=cached),
+    )
+    return SimpleNamespace(usage=usage, model=model)
+
+
+def test_cost_charges_cached_prompt_tokens_at_discount():
+    # 600 обычных * 0.40 + 400 из кеша * 0.10 + 200 выходных * 1.60 (за 1M)
+    assert call_cost_usd("gpt-4.1-mini", 1000, 400, 200) == pytest.approx(0.0006)
+    assert call_cost_usd("unknown-model", 1000, 0, 200) is None
+
+
+def test_completion_usage_reads_openai_usage_block():
+    usage = completion_usage(fake_completion(), "gpt-4.1-mini", 812.345)
+
+    assert usage["model"] == "gpt-4.1-mini-2025-04-14"
+    assert (usage["prompt_tokens"], usage["completion_tokens"], usage["cached_tokens"]) == (1000, 200, 400)
+    assert usage["latency_ms"] == 812.3
+    assert usage["cost_usd"] == pytest.approx(0.0006)
+
+
+def test_completion_usage_tolerates_missing_usage():
+    usage = completion_usage(SimpleNamespace(usage=None, model=None), "gpt-4.1-mini", 10.0)
+
+    assert usage["model"] == "gpt-4.1-mini"
+    assert usage["prompt_tokens"] == usage["completion_tokens"] == usage["cached_tokens"] == 0
+    assert usage["cost_usd"] == 0.0
+
+
+def test_summarize_usage_adds_up_calls():
+    first = completion_usage(fake_completion(), "gpt-4.1-mini", 100.0)
+    second = completion_usage(fake_completion(prompt=500, completion=50, cached=0), "gpt-4.1-mini", 50.0)
+
+    totals = summarize_usage({"openai_text": first, "openai_vision": second}, input_bytes=2048)
+
+    assert totals["llm_calls"] == 2
+    assert totals["prompt_tokens"] == 1500
+    assert totals["completion_tokens"] == 250
+    assert totals["cached_tokens"] == 400
+    assert totals["upstream_ms"] == 150.0
+    assert totals["input_bytes"] == 2048
+    assert totals["cost_usd"] == pytest.approx(first["cost_usd"] + second["cost_usd"])
+
+
+def test_usage_from_run_collects_detector_usage():
+    pipeline = DetectorPipeline("test", max_workers=2)
+    call = completion_usage(fake_completion(), "gpt-4.1-mini", 20.0)
+    pipeline.register("llm", inputs=("text",))(lambda text: {"score": 0.5, "usage": call})
+    pipeline.register("local", inputs=("text",))(lambda text: {"score": 0.1})
+    pipeline.register("broken", inputs=("text",))(lambda text: 1 / 0)
+
+    totals = usage_from_run(pipeline.run({"text": "abc"}), input_bytes=3)
+
+    assert totals["llm_calls"] == 1
+    assert totals["calls"] == {"llm": call}
+    assert totals["prompt_tokens"] == 1000
+
+
+def test_usage_of_failed_paid_call_is_kept():
+    pipeline = DetectorPipeline("test", max_workers=1)
+    call = completion_usage(fake_completion(), "gpt-4.1-mini", 20.0)
+
+    def unparsable(text):
+        error = json.JSONDecodeError("Expecting value", "not json", 0)
+        error.usage = call
+        raise error
+
+    pipeline.register("llm", inputs=("text",))(unparsable)
+    run = pipeline.run({"text": "abc"})
+
+    assert run.outcomes["llm"].status == "error"
+    assert usage_from_run(run, input_bytes=3)["calls"] == {"llm": call}
+
+
+def test_late_usage_of_timed_out_call_is_reported():
+    pipeline = DetectorPipeline("test", max_workers=1)
+    call = completion_usage(fake_completion(), "gpt-4.1-mini", 20.0)
+    release = threading.Event()
+
+    def slow(text):
+        release.wait(5)
+        return {"score": 0.5, "usage": call}
+
+    pipeline.register("llm", inputs=("text",), timeout=0.05)(slow)
+    run = pipeline.run({"text": "abc"})
+    assert run.outcomes["llm"].status == "timeout"
+    assert usage_from_run(run, input_bytes=3)["llm_calls"] == 0
+
+    reported = queue.Queue()
+    run.on_late_usage(lambda name, usage: reported.put((name, usage)))
+    release.set()
+
+    assert reported.get(timeout=5) == ("llm", call)
+
+
+def test_usage_is_not_part_of_public_response():
+    response = TextAnalyzeResponse(
+        trust_score=50,
+        ai_likeliness=0.5,
+        manipulation_score=0.1,
+        emotion_intensity=0.1,
+        claims_evaluation=[],
+        dangerous_phrases=[],
+        summary="",
+        usage={"llm_calls": 1},
+    )
+
+    assert response.usage == {"llm_calls": 1}
+    assert "usage" not in response.dict()
+    assert "detector_run" not in response.dict()
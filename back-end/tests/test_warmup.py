@@ -0,0 +1,119 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import MagicMock, patch
+
+import pytest
+import requests
+from requests.adapters import HTTPAdapter
+from sqlalchemy import create_engine
+
+from app.services import storage_service, warmup
+from app.services.media_keys import KnownMediaKeys
+from app.services.warmup import open_connections, run_warmup, warm_db_pool, warm_media_keys, warm_scoring
+
+
+@pytest.fixture
+def keepalive_server():
+    """HTTP/1.1-сервер, запоминающий порты клиентов: один порт — одно TCP-соединение."""
+    ports = set()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_HEAD(self):
+            ports.add(self.client_address[1])
+            # Ответ не мгновенный: иначе поток, стартовавший чуть позже остальных, получил бы
+            # из пула уже освободившееся соединение
+            time.sleep(0.2)
+            self.send_response(200)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/", ports
+    server.shutdown()
+    server.server_close()
+
+
+def test_open_connections_fills_the_pool(keepalive_server):
+    url, ports = keepalive_server
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(pool_maxsize=4))
+
+    assert open_connections(lambda: session.head(url, timeout=5), 4) == 4
+    assert len(ports) == 4
+    # Соединения остались в пуле: следующие запросы новых не открывают
+    for _ in range(4):
+        session.head(url, timeout=5)
+    assert len(ports) == 4
+
+
+def test_open_connections_counts_failures():
+    calls = []
+    lock = threading.Lock()
+
+    def flaky():
+        with lock:
+            calls.append(1)
+            if len(calls) % 2:
+                raise ConnectionError("refused")
+
+    assert open_connections(flaky, 4) == 2
+
+    def down():
+        raise ConnectionError("refused")
+
+    with pytest.raises(ConnectionError):
+        open_connections(down, 3)
+
+
+def test_warm_db_pool_keeps_connections_up_to_pool_size(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'warm.db'}", pool_size=2)
+
+    assert warm_db_pool(engine, 5) == 2
+    assert engine.pool.checkedin() == 2
+    engine.dispose()
+
+
+def test_run_warmup_reports_each_step():
+    def broken():
+        raise RuntimeError("no route to host")
+
+    report = run_warmup((("db", lambda: 3), ("hf", lambda: None), ("r2", broken)))
+
+    assert report["db"]["status"] == "ok" and report["db"]["result"] == 3
+    assert report["hf"]["status"] == "skipped"
+    assert report["r2"] == {"status": "error", "error": "RuntimeError: no route to host", "elapsed_ms": report["r2"]["elapsed_ms"]}
+
+
+def test_scoring_pass_runs_without_network():
+    result = warm_scoring()
+
+    assert 0 <= result["text_trust_score"] <= 100
+    assert 0 <= result["image_trust_score"] <= 100
+    assert set(result["local_detectors"]) == {"stylometry", "lexicon", "text_classifier"}
+
+
+def test_media_keys_step_fills_known_keys_index():
+    client = MagicMock()
+    client.get_paginator.return_value.paginate.return_value = [
+        {"Contents": [{"Key": "submissions/a.png"}, {"Key": "submissions/b.jpg"}]},
+        {"Contents": [{"Key": "submissions/c.webp"}]},
+    ]
+    known = KnownMediaKeys()
+    with patch.object(storage_service, "s3_client", client), \
+            patch.object(storage_service, "known_media_keys", known), \
+            patch.object(storage_service, "R2_BUCKET_NAME", "media"), \
+            patch.object(warmup, "R2_BUCKET_NAME", "media"):
+        assert warm_media_keys() == 3
+        with patch.object(warmup, "WARMUP_MEDIA_KEYS", False):
+            assert warm_media_keys() is None
+
+    client.get_paginator.return_value.paginate.assert_called_once_with(Bucket="media", Prefix="submissions/")
+    assert known.is_known("submissions/b.jpg")